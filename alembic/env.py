@@ -18,8 +18,10 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from app.database import Base
 from app import models
 
-# Interpretar el archivo de configuración para Python logging.
-fileConfig(context.config.config_file_name)
+# Interpretar el archivo de configuración para Python logging (no existe si
+# Alembic se invoca desde código con una Config sin fichero)
+if context.config.config_file_name is not None:
+    fileConfig(context.config.config_file_name)
 
 # Obtener el metadata de los modelos
 target_metadata = Base.metadata
@@ -41,6 +43,14 @@ def run_migrations_offline():
 
 def run_migrations_online():
     """Run migrations in 'online' mode."""
+    # Conexión ya abierta por quien invoca a Alembic (p. ej. benchmarks o pruebas)
+    connection = context.config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     connectable = engine_from_config(
         {
             "sqlalchemy.url": os.getenv("DATABASE_URL"),
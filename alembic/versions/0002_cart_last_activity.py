@@ -0,0 +1,35 @@
+"""cart last activity
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 18:04:05.723776
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # batch_alter_table: SQLite no admite ADD COLUMN con un default no constante
+    # y recrea la tabla; en PostgreSQL es un ALTER TABLE normal. Las filas
+    # existentes toman la hora de la migración como última actividad.
+    for table in ('carts', 'cart_items'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('last_activity_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+            batch_op.create_index(op.f(f'ix_{table}_last_activity_at'), ['last_activity_at'], unique=False)
+
+
+def downgrade() -> None:
+    for table in ('cart_items', 'carts'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_index(op.f(f'ix_{table}_last_activity_at'))
+            batch_op.drop_column('last_activity_at')
@@ -0,0 +1,72 @@
+"""cart items unique line
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 19:58:21.604412
+
+"""
+from contextlib import nullcontext
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _outside_transaction():
+    # CONCURRENTLY solo existe en PostgreSQL; en el resto de bases (y con una
+    # conexión ya en transacción, como en las pruebas) se queda en la transacción
+    if op.get_bind().dialect.name == "postgresql":
+        return op.get_context().autocommit_block()
+    return nullcontext()
+
+
+def _merge_duplicate_lines() -> None:
+    # Fusionar las líneas repetidas de un mismo ítem en la de menor id (los
+    # totales del carrito no cambian) antes de crear el índice único
+    op.execute("""
+        UPDATE cart_items SET quantity = (
+            SELECT SUM(d.quantity) FROM cart_items d
+            WHERE d.cart_id = cart_items.cart_id AND d.item_id = cart_items.item_id
+        )
+        WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY cart_id, item_id HAVING COUNT(*) > 1)
+    """)
+    op.execute("""
+        DELETE FROM cart_items WHERE EXISTS (
+            SELECT 1 FROM cart_items k
+            WHERE k.cart_id = cart_items.cart_id AND k.item_id = cart_items.item_id AND k.id < cart_items.id
+        )
+    """)
+
+
+def upgrade() -> None:
+    # En PostgreSQL, CONCURRENTLY (fuera de la transacción) no bloquea las
+    # escrituras en cart_items mientras se construye el índice. El índice
+    # compuesto sustituye al de cart_id, que es su primera columna.
+    #
+    # Fuera de la transacción cada sentencia se confirma por separado: si la
+    # construcción falla (p. ej. porque la aplicación volvió a escribir una
+    # línea repetida tras la fusión) queda un índice INVALID y la fusión ya
+    # confirmada. Por eso la migración se puede repetir: borra ese índice y
+    # vuelve a fusionar justo antes de construirlo. Para que no falle, detén
+    # las escrituras en carritos mientras se aplica.
+    with _outside_transaction():
+        op.drop_index('ux_cart_items_cart_id_item_id', table_name='cart_items', if_exists=True,
+                      postgresql_concurrently=True)
+        _merge_duplicate_lines()
+        op.create_index('ux_cart_items_cart_id_item_id', 'cart_items', ['cart_id', 'item_id'], unique=True,
+                        postgresql_concurrently=True)
+        op.drop_index('ix_cart_items_cart_id', table_name='cart_items', if_exists=True,
+                      postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with _outside_transaction():
+        op.create_index('ix_cart_items_cart_id', 'cart_items', ['cart_id'], unique=False,
+                        postgresql_concurrently=True)
+        op.drop_index('ux_cart_items_cart_id_item_id', table_name='cart_items', postgresql_concurrently=True)
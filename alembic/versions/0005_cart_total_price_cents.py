@@ -0,0 +1,42 @@
+"""cart total price cents
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 20:41:07.512930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('carts') as batch_op:
+        batch_op.add_column(sa.Column('total_price_cents', sa.BigInteger(), server_default='0', nullable=False))
+    # Se recalcula desde las líneas en lugar de convertir el total en coma
+    # flotante, que ya arrastraba el error acumulado
+    op.execute("""
+        UPDATE carts SET total_price_cents = COALESCE((
+            SELECT SUM(cart_items.quantity * CAST(ROUND(items.price * 100) AS BIGINT))
+            FROM cart_items JOIN items ON items.id = cart_items.item_id
+            WHERE cart_items.cart_id = carts.id
+        ), 0)
+    """)
+    with op.batch_alter_table('carts') as batch_op:
+        batch_op.drop_column('total_price')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('carts') as batch_op:
+        batch_op.add_column(sa.Column('total_price', sa.Float(), server_default='0', nullable=False))
+    op.execute("UPDATE carts SET total_price = total_price_cents / 100.0")
+    with op.batch_alter_table('carts') as batch_op:
+        batch_op.drop_column('total_price_cents')
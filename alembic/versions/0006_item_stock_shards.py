@@ -0,0 +1,44 @@
+"""item stock shards
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 21:37:12.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Default constante: en PostgreSQL no reescribe 'items' y en SQLite no
+    # necesita batch_alter_table
+    op.add_column('items', sa.Column('stock_shards', sa.Integer(), server_default='1', nullable=False))
+    op.create_table('item_stock_shards',
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('stock', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['item_id'], ['items.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('item_id', 'shard')
+    )
+
+
+def downgrade() -> None:
+    # Devolver a items.stock el stock de los shards antes de borrarlos
+    op.execute("""
+        UPDATE items SET stock = stock + COALESCE((
+            SELECT SUM(item_stock_shards.stock) FROM item_stock_shards
+            WHERE item_stock_shards.item_id = items.id
+        ), 0)
+    """)
+    op.drop_table('item_stock_shards')
+    with op.batch_alter_table('items') as batch_op:
+        batch_op.drop_column('stock_shards')
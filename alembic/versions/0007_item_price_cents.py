@@ -0,0 +1,53 @@
+"""item price cents
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 09:12:40.218345
+
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _to_cents(price: float) -> int:
+    # Copia de app.money.to_cents: la migración no depende del código de la aplicación
+    return int(Decimal(str(price)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+
+
+def upgrade() -> None:
+    op.add_column('items', sa.Column('price_cents', sa.BigInteger(), server_default='0', nullable=False))
+    # El redondeo se hace en Python: ROUND() de SQL resuelve los empates de
+    # forma distinta en SQLite y en PostgreSQL
+    conn = op.get_bind()
+    rows = conn.execute(sa.text("SELECT id, price FROM items")).fetchall()
+    if rows:
+        conn.execute(
+            sa.text("UPDATE items SET price_cents = :price_cents WHERE id = :id"),
+            [{"id": id_, "price_cents": _to_cents(price)} for id_, price in rows]
+        )
+    # Sin default, un INSERT que olvide la columna falla en lugar de poner el precio a 0
+    with op.batch_alter_table('items') as batch_op:
+        batch_op.alter_column('price_cents', server_default=None)
+    # Los totales guardados se calcularon con ROUND(): se recalculan con la columna nueva
+    op.execute("""
+        UPDATE carts SET total_price_cents = COALESCE((
+            SELECT SUM(cart_items.quantity * items.price_cents)
+            FROM cart_items JOIN items ON items.id = cart_items.item_id
+            WHERE cart_items.cart_id = carts.id
+        ), 0)
+    """)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('items') as batch_op:
+        batch_op.drop_column('price_cents')
@@ -0,0 +1,29 @@
+"""idempotency cart versions
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 12:41:07.582913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Las respuestas ya guardadas se repiten sin anunciar versión, como antes
+    with op.batch_alter_table('idempotency_keys') as batch_op:
+        batch_op.add_column(sa.Column('cart_versions', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('idempotency_keys') as batch_op:
+        batch_op.drop_column('cart_versions')
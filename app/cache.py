@@ -0,0 +1,90 @@
+# app/cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class LRUCache:
+    """
+    Caché en proceso acotada por tamaño (expulsión LRU) y por antigüedad (TTL).
+
+    Es segura entre hilos, ya que las rutas síncronas se ejecutan en el
+    threadpool. Con maxsize=0 queda desactivada: get() siempre falla y set()
+    no guarda nada, pero los contadores siguen registrando los accesos.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, self._clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+# Parte inmutable del catálogo (nombre, precio, tipo...). El stock no se
+# cachea: siempre se lee de la base de datos. CATALOG_CACHE_SIZE=0 la desactiva.
+catalog_cache = LRUCache(
+    maxsize=int(os.getenv("CATALOG_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", "300")),
+)
+
+# Número de shards del stock de cada ítem (ver app/inventory.py). Solo orienta
+# la elección del shard en una reserva, así que puede estar desactualizado.
+stock_shard_cache = LRUCache(
+    maxsize=int(os.getenv("STOCK_SHARD_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("STOCK_SHARD_CACHE_TTL", "60")),
+)
@@ -1,99 +1,587 @@
 # app/crud.py
 
-from sqlalchemy.orm import Session, joinedload
+import base64
+import json
+import random
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import bindparam, case, delete, event, func, select, text, update
+from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
-from . import models, schemas
-
-def get_item(db: Session, item_id: int):
-    return db.query(models.Item).filter(models.Item.id == item_id).first()
+from . import inventory, models, replica, schemas
+from .money import from_cents, line_subtotal
+from .cache import catalog_cache, stock_shard_cache
+from .utils.exceptions import ItemNotFoundException, OutOfStockException
 
 def get_cart(db: Session, cart_id: int):
-    return db.query(models.Cart).filter(models.Cart.id == cart_id).first()
+    # Búsqueda directa por clave primaria (usa el identity map si ya está cargado)
+    return db.get(models.Cart, cart_id)
 
 def create_cart(db: Session):
     db_cart = models.Cart()
     db.add(db_cart)
     db.commit()
     db.refresh(db_cart)
+    # Hasta que la réplica lo tenga, el carrito nuevo se lee del primario (ver app/replica.py)
+    replica.record_cart_version(db_cart.id, db_cart.version)
     return db_cart
 
-def add_item_to_cart(db: Session, cart_id: int, item_id: int, quantity: int):
-    item = get_item(db, item_id)
-    if not item:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
-    if item.stock < quantity:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient stock")
-    
-    cart_item = db.query(models.CartItem).filter(
-        models.CartItem.cart_id == cart_id, 
-        models.CartItem.item_id == item_id
-    ).first()
-    if cart_item:
-        cart_item.quantity += quantity
-    else:
-        cart_item = models.CartItem(
-            cart_id=cart_id, 
-            item_id=item_id, 
-            quantity=quantity
+def reserve_stock(db: Session, item_id: int, quantity: int) -> Optional[int]:
+    """
+    Descuenta 'quantity' unidades del stock del ítem con una única sentencia
+    condicional y devuelve el stock disponible restante. Devuelve None si el
+    ítem no existe o no tiene stock suficiente; la propia sentencia decide, sin
+    leer el stock antes. Si el stock está repartido (ver app/inventory.py), la
+    sentencia va a un shard al azar y solo si no le alcanza se prueban los demás.
+    """
+    shard = random.randrange(inventory.shard_count(item_id))
+    remaining = inventory.take(db, item_id, shard, quantity)
+    if remaining is None:
+        remaining = inventory.take_from_siblings(db, item_id, quantity, shard)
+    return remaining
+
+def release_stock(db: Session, item_id: int, quantity: int) -> Optional[int]:
+    # Devuelve unidades a un shard al azar sin leer la fila; retorna el stock disponible resultante
+    shard = random.randrange(inventory.shard_count(item_id))
+    remaining = inventory.give(db, item_id, shard, quantity)
+    if remaining is None and shard:
+        remaining = inventory.give(db, item_id, 0, quantity)
+    return remaining
+
+def raise_reservation_error(db: Session, item_id: int):
+    # Solo en el camino de error: distinguir ítem inexistente de falta de stock
+    db.rollback()
+    if db.query(models.Item.id).filter(models.Item.id == item_id).first() is None:
+        raise ItemNotFoundException(item_id)
+    raise OutOfStockException(item_id)
+
+class CatalogEntry(NamedTuple):
+    # Campos del catálogo que cambian raramente; el stock queda fuera
+    id: int
+    name: str
+    description: str
+    thumbnail: str
+    price: float
+    type: str
+
+def get_catalog_entry(db: Session, item_id: int) -> Optional[CatalogEntry]:
+    entry = catalog_cache.get(item_id)
+    if entry is None:
+        row = db.query(
+            models.Item.id, models.Item.name, models.Item.description,
+            models.Item.thumbnail, models.Item.price, models.Item.type
+        ).filter(models.Item.id == item_id).first()
+        if row is None:
+            return None
+        entry = CatalogEntry(row.id, row.name, row.description, row.thumbnail, row.price, row.type.value)
+        catalog_cache.set(item_id, entry)
+    return entry
+
+def invalidate_catalog_item(item_id: int):
+    # Debe llamarse tras cualquier cambio de nombre, precio, tipo... de un ítem
+    catalog_cache.invalidate(item_id)
+
+@event.listens_for(models.Item, "after_update", propagate=True)
+@event.listens_for(models.Item, "after_delete", propagate=True)
+def _invalidate_catalog_on_change(mapper, connection, target):
+    # Cubre modificaciones hechas a través del ORM (las de stock son UPDATE directos)
+    invalidate_catalog_item(target.id)
+
+def cart_line_schema(db: Session, line_id: int, cart_id: int, item_id: int, quantity: int, stock: int) -> schemas.CartItem:
+    # Respuesta de una línea con el catálogo cacheado y el stock recién leído
+    entry = get_catalog_entry(db, item_id)
+    if entry is None:
+        raise ItemNotFoundException(item_id)
+    return schemas.CartItem(
+        id=line_id,
+        cart_id=cart_id,
+        item_id=item_id,
+        quantity=quantity,
+        item=schemas.Item(**entry._asdict(), stock=stock),
+        subtotal=line_subtotal(quantity, entry.price)
+    )
+
+def apply_cart_totals(db: Session, cart_id: int, deltas: Dict[int, int]):
+    """
+    Actualiza los totales y la versión del carrito en la misma transacción que
+    la mutación. 'deltas' es item_id -> cambio de cantidad; el importe, en
+    céntimos, se obtiene con una subconsulta sobre items.price_cents, sin leer el
+    ítem desde Python. La nueva versión se anota para las lecturas de la
+    réplica (app/replica.py).
+    """
+    deltas = {item_id: delta for item_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    price_delta = select(
+        func.sum(case(deltas, value=models.Item.id) * models.Item.price_cents)
+    ).where(models.Item.id.in_(deltas)).scalar_subquery()
+    version = db.execute(
+        update(models.Cart)
+        .where(models.Cart.id == cart_id)
+        .values(
+            total_quantity=models.Cart.total_quantity + sum(deltas.values()),
+            total_price_cents=models.Cart.total_price_cents + func.coalesce(price_delta, 0),
+            version=models.Cart.version + 1
         )
-        db.add(cart_item)
-    item.stock -= quantity
+        .returning(models.Cart.version)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if version is not None:
+        replica.record_cart_version(cart_id, version)
+
+def recalculate_cart_totals(db: Session, cart_id: int):
+    # Recalcula los totales desde las líneas (reparación o tras cambios de precio)
+    totals = db.query(
+        func.coalesce(func.sum(models.CartItem.quantity), 0),
+        func.coalesce(func.sum(models.CartItem.quantity * models.Item.price_cents), 0)
+    ).join(models.Item, models.CartItem.item_id == models.Item.id).filter(
+        models.CartItem.cart_id == cart_id
+    ).one()
+    version = db.execute(
+        update(models.Cart)
+        .where(models.Cart.id == cart_id)
+        .values(total_quantity=totals[0], total_price_cents=totals[1], version=models.Cart.version + 1)
+        .returning(models.Cart.version)
+        .execution_options(synchronize_session=False)
+    ).scalar()
     db.commit()
-    db.refresh(cart_item)
-    return cart_item
+    if version is not None:
+        replica.record_cart_version(cart_id, version)
+
+def get_cart_summary(db: Session, cart_id: int) -> schemas.CartSummary:
+    # Solo la fila de 'carts': ni líneas ni ítems
+    row = db.query(
+        models.Cart.id, models.Cart.total_quantity, models.Cart.total_price_cents, models.Cart.version
+    ).filter(models.Cart.id == cart_id).first()
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cart not found.")
+    return schemas.CartSummary(
+        id=row.id,
+        total_quantity=row.total_quantity,
+        total_price=from_cents(row.total_price_cents),
+        version=row.version
+    )
+
+@lru_cache(maxsize=64)
+def _upsert_lines_sql(rows: int):
+    # Texto fijo por número de líneas: los insert de los dialectos (con
+    # on_conflict_do_update) no entran en la caché de compilación de SQLAlchemy
+    # y se recompilaban en cada petición. Misma sintaxis en PostgreSQL y SQLite.
+    values = ", ".join(f"(:cart_id, :item_id_{n}, :quantity_{n}, :now)" for n in range(rows))
+    return text(f"""
+        INSERT INTO cart_items (cart_id, item_id, quantity, last_activity_at) VALUES {values}
+        ON CONFLICT (cart_id, item_id) DO UPDATE SET
+            quantity = cart_items.quantity + excluded.quantity, last_activity_at = excluded.last_activity_at
+        RETURNING item_id, id, quantity
+    """).bindparams(bindparam("now", type_=models.CartItem.__table__.c.last_activity_at.type))
+
+def upsert_cart_lines(db: Session, cart_id: int, quantities: Dict[int, int]) -> Dict[int, Tuple[int, int]]:
+    """
+    Suma 'quantities' (item_id -> unidades) a las líneas del carrito y crea las
+    que no existen, en una única sentencia INSERT ... ON CONFLICT (cart_id,
+    item_id) DO UPDATE apoyada en el índice único: la suma la hace la base de
+    datos, así que no se pierden incrementos concurrentes ni se duplican líneas.
+    Devuelve item_id -> (id de la línea, cantidad resultante).
+    """
+    # ON CONFLICT DO UPDATE no aplicaría los 'onupdate': last_activity_at va explícita
+    params = {"cart_id": cart_id, "now": models.utcnow()}
+    for n, (item_id, quantity) in enumerate(quantities.items()):
+        params[f"item_id_{n}"] = item_id
+        params[f"quantity_{n}"] = quantity
+    rows = db.execute(_upsert_lines_sql(len(quantities)), params)
+    return {row.item_id: (row.id, row.quantity) for row in rows}
+
+def add_item_to_cart(db: Session, cart_id: int, item_id: int, quantity: int) -> schemas.CartItem:
+    remaining = reserve_stock(db, item_id, quantity)
+    if remaining is None:
+        raise_reservation_error(db, item_id)
 
-def update_cart_item(db: Session, cart_id: int, item_id: int, quantity: int):
+    line_id, line_quantity = upsert_cart_lines(db, cart_id, {item_id: quantity})[item_id]
+    apply_cart_totals(db, cart_id, {item_id: quantity})
+    db.commit()
+    return cart_line_schema(db, line_id, cart_id, item_id, line_quantity, remaining)
+
+@lru_cache(maxsize=64)
+def _upsert_item_lines_sql(rows: int):
+    # Como _upsert_lines_sql, con un carrito distinto en cada fila y el mismo ítem
+    values = ", ".join(f"(:cart_id_{n}, :item_id, :quantity_{n}, :now)" for n in range(rows))
+    return text(f"""
+        INSERT INTO cart_items (cart_id, item_id, quantity, last_activity_at) VALUES {values}
+        ON CONFLICT (cart_id, item_id) DO UPDATE SET
+            quantity = cart_items.quantity + excluded.quantity, last_activity_at = excluded.last_activity_at
+        RETURNING cart_id, id, quantity
+    """).bindparams(bindparam("now", type_=models.CartItem.__table__.c.last_activity_at.type))
+
+def _grant_in_order(db: Session, item_id: int, requests: List[Tuple[int, int]]) -> Optional[Tuple[List[bool], Optional[int]]]:
+    # Reserva de un lote: todo en una sentencia si hay stock para todos; si no,
+    # lo que concederían las peticiones una detrás de otra con el stock leído.
+    # Devuelve None si el stock cambió entre la lectura y la reserva.
+    total = sum(quantity for _, quantity in requests)
+    remaining = reserve_stock(db, item_id, total)
+    if remaining is not None:
+        return [True] * len(requests), remaining
+    # take_from_siblings pudo tomar parte de los shards
+    db.rollback()
+    available = db.query(inventory.available_stock()).filter(models.Item.id == item_id).scalar()
+    if available is None:
+        raise ItemNotFoundException(item_id)
+    granted = []
+    for _, quantity in requests:
+        granted.append(quantity <= available)
+        if granted[-1]:
+            available -= quantity
+    total = sum(quantity for (_, quantity), ok in zip(requests, granted) if ok)
+    if not total:
+        return granted, None
+    remaining = reserve_stock(db, item_id, total)
+    if remaining is None:
+        db.rollback()
+        return None
+    return granted, remaining
+
+def add_item_to_carts(db: Session, item_id: int, requests: List[Tuple[int, int]]) -> Optional[List[object]]:
+    """
+    Aplica en una única transacción varias peticiones (cart_id, quantity) de
+    añadir el mismo ítem, en el orden de la lista: se conceden las que
+    concedería ejecutarlas una tras otra, y las líneas y los totales de todos
+    los carritos se escriben con un INSERT ... ON CONFLICT y un UPDATE de carts
+    para todo el lote. Devuelve, por petición, su schemas.CartItem o la
+    OutOfStockException que habría recibido. Devuelve None si el stock cambió
+    mientras se calculaba lo concedido (quien llama aplica entonces las
+    peticiones por separado). Ante cualquier error, incluido un ítem
+    inexistente, deshace el lote y lanza la excepción. Ver app/reservations.py.
+    """
+    try:
+        outcome = _grant_in_order(db, item_id, requests)
+        if outcome is None:
+            return None
+        granted, remaining = outcome
+        if remaining is None:
+            return [OutOfStockException(item_id) for _ in requests]
+
+        deltas: Dict[int, int] = {}
+        for (cart_id, quantity), ok in zip(requests, granted):
+            if ok:
+                deltas[cart_id] = deltas.get(cart_id, 0) + quantity
+        params = {"item_id": item_id, "now": models.utcnow()}
+        for n, (cart_id, quantity) in enumerate(deltas.items()):
+            params[f"cart_id_{n}"] = cart_id
+            params[f"quantity_{n}"] = quantity
+        lines = {row.cart_id: (row.id, row.quantity) for row in db.execute(_upsert_item_lines_sql(len(deltas)), params)}
+        amount = case(deltas, value=models.Cart.id)
+        price = select(models.Item.price_cents).where(models.Item.id == item_id).scalar_subquery()
+        versions = db.execute(
+            update(models.Cart)
+            .where(models.Cart.id.in_(deltas))
+            .values(
+                total_quantity=models.Cart.total_quantity + amount,
+                total_price_cents=models.Cart.total_price_cents + amount * func.coalesce(price, 0),
+                version=models.Cart.version + 1
+            )
+            .returning(models.Cart.id, models.Cart.version)
+            .execution_options(synchronize_session=False)
+        ).all()
+        # Antes del commit: tras él no queda ninguna consulta que pueda fallar
+        entry = get_catalog_entry(db, item_id)
+        if entry is None:
+            raise ItemNotFoundException(item_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    for cart_id, version in versions:
+        replica.record_cart_version(cart_id, version)
+
+    # Cantidad de la línea y stock restante que habría visto cada petición en su turno
+    results: List[object] = [None] * len(requests)
+    stock, later = remaining, dict.fromkeys(deltas, 0)
+    for index in reversed(range(len(requests))):
+        cart_id, quantity = requests[index]
+        if not granted[index]:
+            results[index] = OutOfStockException(item_id)
+            continue
+        line_id, line_quantity = lines[cart_id]
+        quantity_then = line_quantity - later[cart_id]
+        results[index] = schemas.CartItem(
+            id=line_id, cart_id=cart_id, item_id=item_id, quantity=quantity_then,
+            item=schemas.Item(**entry._asdict(), stock=stock), subtotal=line_subtotal(quantity_then, entry.price)
+        )
+        later[cart_id] += quantity
+        stock += quantity
+    return results
+
+def update_cart_item(db: Session, cart_id: int, item_id: int, quantity: int) -> Optional[schemas.CartItem]:
     if quantity < 0:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Quantity cannot be negative")
-    
+
     # Buscar el ítem en el carrito
-    cart_item = db.query(models.CartItem).filter(
-        models.CartItem.cart_id == cart_id, 
+    cart_item = db.query(models.CartItem.id, models.CartItem.quantity).filter(
+        models.CartItem.cart_id == cart_id,
         models.CartItem.item_id == item_id
     ).first()
-    
     if not cart_item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="CartItem not found")
-    
-    # Buscar el ítem en la base de datos
-    item = get_item(db, item_id)
-    if not item:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
-    
+
+    # Reservar o devolver solo la diferencia respecto a la cantidad actual
+    previous = cart_item.quantity
+    delta = quantity - previous
+    remaining = None
+    if delta > 0:
+        remaining = reserve_stock(db, item_id, delta)
+        if remaining is None:
+            raise_reservation_error(db, item_id)
+    if delta < 0:
+        remaining = release_stock(db, item_id, -delta)
+
+    # Compare-and-set sobre la línea: si otra petición la cambió, se deshace todo
+    line = [models.CartItem.id == cart_item.id, models.CartItem.quantity == previous]
     if quantity == 0:
-        # Si la cantidad es 0, devolver el stock y eliminar el ítem del carrito
-        item.stock += cart_item.quantity
-        db.delete(cart_item)
-        db.commit()
-        return None  # Devolver None si el ítem fue eliminado
+        # Si la cantidad es 0, eliminar el ítem del carrito (el stock ya se devolvió)
+        statement = delete(models.CartItem).where(*line)
     else:
-        # Verificar si hay suficiente stock para la cantidad solicitada
-        if item.stock + cart_item.quantity < quantity:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient stock")
-        
-        # Actualizar el stock y la cantidad del ítem en el carrito
-        item.stock += cart_item.quantity - quantity
-        cart_item.quantity = quantity
-        db.commit()
-        db.refresh(cart_item)
-        return cart_item
+        statement = update(models.CartItem).where(*line).values(quantity=quantity)
+    if db.execute(statement.execution_options(synchronize_session=False)).rowcount != 1:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="CartItem was modified concurrently")
+    apply_cart_totals(db, cart_id, {item_id: delta})
+    db.commit()
+
+    if quantity == 0:
+        return None  # Devolver None si el ítem fue eliminado
+    if remaining is None:
+        remaining = db.query(inventory.available_stock()).filter(models.Item.id == item_id).scalar()
+    return cart_line_schema(db, cart_item.id, cart_id, item_id, quantity, remaining)
 
 
 def remove_cart_item(db: Session, cart_id: int, item_id: int):
-    cart_item = db.query(models.CartItem).filter(
-        models.CartItem.cart_id == cart_id, 
-        models.CartItem.item_id == item_id
-    ).first()
-    if not cart_item:
+    # Borrar la línea y obtener la cantidad reservada en la misma sentencia
+    removed = db.execute(
+        delete(models.CartItem)
+        .where(models.CartItem.cart_id == cart_id, models.CartItem.item_id == item_id)
+        .returning(models.CartItem.quantity)
+    ).scalars().all()
+    if not removed:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="CartItem not found")
-    
-    item = get_item(db, item_id)
-    if item:
-        item.stock += cart_item.quantity
-    db.delete(cart_item)
+
+    release_stock(db, item_id, sum(removed))
+    apply_cart_totals(db, cart_id, {item_id: -sum(removed)})
     db.commit()
     return {"detail": "Item removed from cart successfully."}
 
+# Operaciones por lotes: un número constante de sentencias sea cual sea el
+# número de líneas, todo en una única transacción (o se aplica todo o nada)
+def _pick_shards(quantities: Dict[int, int]) -> Dict[int, int]:
+    # Shard al azar para cada ítem del lote (0, items.stock, si no está repartido)
+    return {item_id: random.randrange(inventory.shard_count(item_id)) for item_id in quantities}
+
+def _update_stock_shards(db: Session, quantities: Dict[int, int], shards: Dict[int, int], sign: int):
+    # Suma (sign=1) o resta (sign=-1) a un shard de item_stock_shards por ítem; devuelve los ítems actualizados
+    stock_shards = models.ItemStockShard
+    amount = case(quantities, value=stock_shards.item_id)
+    conditions = [stock_shards.item_id.in_(quantities), stock_shards.shard == case(shards, value=stock_shards.item_id)]
+    if sign < 0:
+        conditions.append(stock_shards.stock >= amount)
+    return set(db.execute(
+        update(stock_shards)
+        .where(*conditions)
+        .values(stock=stock_shards.stock + sign * amount)
+        .returning(stock_shards.item_id)
+        .execution_options(synchronize_session=False)
+    ).scalars())
+
+def reserve_stock_many(db: Session, quantities: Dict[int, int]) -> bool:
+    """
+    Versión por lotes de reserve_stock: un UPDATE con CASE para los ítems
+    cuyo shard elegido es items.stock (todos los que no están repartidos) y
+    otro para los que van a item_stock_shards. Los ítems cuyo shard no
+    alcanza se reservan uno a uno entre sus hermanos.
+    """
+    shards = _pick_shards(quantities)
+    on_items = {item_id: quantity for item_id, quantity in quantities.items() if not shards[item_id]}
+    on_shards = {item_id: quantity for item_id, quantity in quantities.items() if shards[item_id]}
+    granted = set()
+    if on_items:
+        amount = case(on_items, value=models.Item.id)
+        for item_id, count in db.execute(
+            update(models.Item)
+            .where(models.Item.id.in_(on_items), models.Item.stock >= amount)
+            .values(stock=models.Item.stock - amount)
+            .returning(models.Item.id, models.Item.stock_shards)
+            .execution_options(synchronize_session=False)
+        ):
+            granted.add(item_id)
+            stock_shard_cache.set(item_id, count)
+    if on_shards:
+        granted |= _update_stock_shards(db, on_shards, {item_id: shards[item_id] for item_id in on_shards}, -1)
+    for item_id, quantity in quantities.items():
+        if item_id not in granted and inventory.take_from_siblings(db, item_id, quantity, shards[item_id]) is None:
+            return False
+    return True
+
+def release_stock_many(db: Session, quantities: Dict[int, int]):
+    shards = _pick_shards(quantities)
+    on_shards = {item_id: quantity for item_id, quantity in quantities.items() if shards[item_id]}
+    released = _update_stock_shards(db, on_shards, {item_id: shards[item_id] for item_id in on_shards}, 1) if on_shards else set()
+    # Sin repartir, o con un shard que ya no existe: a items.stock
+    on_items = {item_id: quantity for item_id, quantity in quantities.items() if item_id not in released}
+    if on_items:
+        amount = case(on_items, value=models.Item.id)
+        db.execute(
+            update(models.Item)
+            .where(models.Item.id.in_(on_items))
+            .values(stock=models.Item.stock + amount)
+            .execution_options(synchronize_session=False)
+        )
+
+def raise_batch_reservation_error(db: Session, quantities: Dict[int, int]):
+    # Como raise_reservation_error para una reserva de varios ítems: el error del primero que falla
+    db.rollback()
+    stock = dict(db.query(models.Item.id, inventory.available_stock()).filter(models.Item.id.in_(quantities)).all())
+    for item_id, quantity in quantities.items():
+        if item_id not in stock:
+            raise ItemNotFoundException(item_id)
+        if stock[item_id] < quantity:
+            raise OutOfStockException(item_id)
+    # El stock cambió entre la reserva y la comprobación
+    raise OutOfStockException(next(iter(quantities)))
+
+def _get_cart_lines(db: Session, cart_id: int, item_ids) -> Dict[int, Tuple[int, int]]:
+    # item_id -> (id de la línea, cantidad)
+    rows = db.query(models.CartItem.item_id, models.CartItem.id, models.CartItem.quantity).filter(
+        models.CartItem.cart_id == cart_id,
+        models.CartItem.item_id.in_(item_ids)
+    ).all()
+    return {item_id: (line_id, quantity) for item_id, line_id, quantity in rows}
+
+# Proyección plana de una línea del carrito: columnas de cart_items y de la
+# tabla base 'items', que ya contiene todos los campos de ItemBase. No se cargan
+# entidades Product/Event, así que no hay joins ni SELECT adicionales sobre las
+# tablas de las subclases, y al leer 'items' directamente siempre refleja lo
+# escrito por create_product/create_event.
+_CART_LINE_COLUMNS = (
+    models.CartItem.id, models.CartItem.item_id, models.CartItem.quantity,
+    models.Item.name, models.Item.description, models.Item.thumbnail,
+    models.Item.price, inventory.available_stock(), models.Item.type
+)
+
+def cart_line_payload(cart_id: int, row) -> dict:
+    # Misma forma (y orden de claves) que schemas.CartItem, sin construir el modelo.
+    # También la usan la capa en memoria (app/repository.py) y la exportación (app/export.py)
+    line_id, item_id, quantity, name, description, thumbnail, price, stock, item_type = row
+    return {
+        "id": line_id,
+        "cart_id": cart_id,
+        "item_id": item_id,
+        "quantity": quantity,
+        "item": {
+            "name": name, "description": description, "thumbnail": thumbnail,
+            "price": price, "stock": stock, "type": item_type.value, "id": item_id
+        },
+        "subtotal": line_subtotal(quantity, price)
+    }
+
+def cart_invoice_lines_statement(cart_id: int, batch_size: int):
+    # Líneas de la factura en el orden de get_cart_invoice, leídas por lotes de
+    # 'batch_size' filas con un cursor del servidor (ver app/export.py)
+    return select(*_CART_LINE_COLUMNS).join(
+        models.Item, models.CartItem.item_id == models.Item.id
+    ).where(models.CartItem.cart_id == cart_id).order_by(models.CartItem.id).execution_options(yield_per=batch_size)
+
+def _cart_line_from_row(cart_id: int, row) -> schemas.CartItem:
+    return schemas.CartItem(**cart_line_payload(cart_id, row))
+
+def _cart_lines_payload(db: Session, cart_id: int, item_ids: List[int]) -> List[schemas.CartItem]:
+    # Una sola consulta para la respuesta, en el orden de la petición
+    rows = db.query(*_CART_LINE_COLUMNS).join(models.Item, models.CartItem.item_id == models.Item.id).filter(
+        models.CartItem.cart_id == cart_id,
+        models.CartItem.item_id.in_(item_ids)
+    ).all()
+    by_item = {row.item_id: row for row in rows}
+    return [_cart_line_from_row(cart_id, by_item[item_id]) for item_id in item_ids if item_id in by_item]
+
+def add_items_to_cart(db: Session, cart_id: int, lines: List[schemas.CartItemCreate]) -> List[schemas.CartItem]:
+    # Agrupar líneas repetidas del mismo ítem conservando el orden de la petición
+    quantities: Dict[int, int] = {}
+    for line in lines:
+        quantities[line.item_id] = quantities.get(line.item_id, 0) + line.quantity
+    if not quantities:
+        return []
+
+    if not reserve_stock_many(db, quantities):
+        raise_batch_reservation_error(db, quantities)
+
+    upsert_cart_lines(db, cart_id, quantities)
+    apply_cart_totals(db, cart_id, quantities)
+    db.commit()
+    return _cart_lines_payload(db, cart_id, list(quantities))
+
+def update_cart_items(db: Session, cart_id: int, lines: List[schemas.CartItemBase]) -> List[schemas.CartItem]:
+    # La última cantidad indicada para un ítem es la que se aplica
+    quantities = {line.item_id: line.quantity for line in lines}
+    if not quantities:
+        return []
+
+    existing = _get_cart_lines(db, cart_id, quantities)
+    for item_id in quantities:
+        if item_id not in existing:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="CartItem not found")
+
+    deltas = {item_id: quantity - existing[item_id][1] for item_id, quantity in quantities.items()}
+    to_reserve = {item_id: delta for item_id, delta in deltas.items() if delta > 0}
+    to_release = {item_id: -delta for item_id, delta in deltas.items() if delta < 0}
+    if to_reserve and not reserve_stock_many(db, to_reserve):
+        raise_batch_reservation_error(db, to_reserve)
+    if to_release:
+        release_stock_many(db, to_release)
+
+    # Compare-and-set por lotes: cada línea debe seguir teniendo la cantidad leída
+    previous = case({line_id: quantity for line_id, quantity in existing.values()}, value=models.CartItem.id)
+    removed = [existing[item_id][0] for item_id, quantity in quantities.items() if quantity == 0]
+    kept = {existing[item_id][0]: quantity for item_id, quantity in quantities.items() if quantity > 0}
+    changed = 0
+    if removed:
+        changed += db.execute(
+            delete(models.CartItem)
+            .where(models.CartItem.id.in_(removed), models.CartItem.quantity == previous)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    if kept:
+        changed += db.execute(
+            update(models.CartItem)
+            .where(models.CartItem.id.in_(kept), models.CartItem.quantity == previous)
+            .values(quantity=case(kept, value=models.CartItem.id))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    if changed != len(quantities):
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="CartItem was modified concurrently")
+    apply_cart_totals(db, cart_id, deltas)
+    db.commit()
+    return _cart_lines_payload(db, cart_id, [item_id for item_id, quantity in quantities.items() if quantity > 0])
+
+def remove_cart_items(db: Session, cart_id: int, item_ids: List[int]):
+    item_ids = list(dict.fromkeys(item_ids))
+    if not item_ids:
+        return {"detail": "Items removed from cart successfully."}
+
+    removed = db.execute(
+        delete(models.CartItem)
+        .where(models.CartItem.cart_id == cart_id, models.CartItem.item_id.in_(item_ids))
+        .returning(models.CartItem.item_id, models.CartItem.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+    released: Dict[int, int] = {}
+    for item_id, quantity in removed:
+        released[item_id] = released.get(item_id, 0) + quantity
+    if len(released) != len(item_ids):
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="CartItem not found")
+
+    release_stock_many(db, released)
+    apply_cart_totals(db, cart_id, {item_id: -quantity for item_id, quantity in released.items()})
+    db.commit()
+    return {"detail": "Items removed from cart successfully."}
+
 # Funciones CRUD para crear ítems
 def create_product(db: Session, product: schemas.ProductCreate):
     db_product = models.Product(
@@ -108,6 +596,7 @@ def create_product(db: Session, product: schemas.ProductCreate):
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    invalidate_catalog_item(db_product.id)
     return db_product
 
 def create_event(db: Session, event: schemas.EventCreate):
@@ -123,43 +612,93 @@ def create_event(db: Session, event: schemas.EventCreate):
     db.add(db_event)
     db.commit()
     db.refresh(db_event)
+    invalidate_catalog_item(db_event.id)
     return db_event
 
-def get_all_items(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Item).offset(skip).limit(limit).all()
+def encode_item_cursor(item_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": item_id}).encode()).decode().rstrip("=")
 
-def get_cart_invoice(db: Session, cart_id: int) -> schemas.CartInvoice:
-    cart = db.query(models.Cart).options(
-        joinedload(models.Cart.items).joinedload(models.CartItem.item)
-    ).filter(models.Cart.id == cart_id).first()
-    if not cart:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cart not found.")
-    
-    if not cart.items:
-        return schemas.CartInvoice(items=[], total_quantity=0, total_price=0.0)
-    
-    invoice_items = []
-    total_quantity = 0
-    total_price = 0.0
-
-    for cart_item in cart.items:
-        item = cart_item.item
-        subtotal = round(cart_item.quantity * item.price, 2)
-        invoice_item = schemas.CartItem(
-            id=cart_item.id,
-            cart_id=cart_item.cart_id,
-            item_id=item.id,
-            quantity=cart_item.quantity,
-            item=schemas.Item.from_orm(item),
-            subtotal=subtotal
-        )
-        invoice_items.append(invoice_item)
-        total_quantity += cart_item.quantity
-        total_price += subtotal
-
-    cart_invoice = schemas.CartInvoice(
-        items=invoice_items,
-        total_quantity=total_quantity,
-        total_price=round(total_price, 2)
+def decode_item_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        item_id = json.loads(base64.urlsafe_b64decode(padded))["id"]
+        if not isinstance(item_id, int):
+            raise ValueError(item_id)
+        return item_id
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def get_items_page(db: Session, limit: int = 100, cursor: Optional[str] = None,
+                   item_type: Optional[schemas.ItemType] = None) -> schemas.ItemPage:
+    """
+    Página del catálogo ordenada por items.id usando paginación por clave: la
+    consulta empieza en el último id devuelto (WHERE id > :cursor) en lugar de
+    descartar filas con OFFSET, así que la página N cuesta lo mismo que la 1.
+    """
+    query = db.query(
+        models.Item.id, models.Item.name, models.Item.description, models.Item.thumbnail,
+        models.Item.price, inventory.available_stock(), models.Item.type
     )
-    return cart_invoice
+    if item_type is not None:
+        query = query.filter(models.Item.type == models.ItemType(item_type.value))
+    if cursor is not None:
+        query = query.filter(models.Item.id > decode_item_cursor(cursor))
+    # Una fila de más indica si existe una página siguiente
+    rows = query.order_by(models.Item.id).limit(limit + 1).all()
+
+    items = [
+        schemas.Item(
+            id=row.id, name=row.name, description=row.description, thumbnail=row.thumbnail,
+            price=row.price, stock=row.stock, type=row.type.value
+        )
+        for row in rows[:limit]
+    ]
+    next_cursor = encode_item_cursor(items[-1].id) if len(rows) > limit else None
+    return schemas.ItemPage(items=items, next_cursor=next_cursor)
+
+class CartRead(NamedTuple):
+    # Lectura del carrito y la versión del carrito que refleja (para el ETag de la respuesta)
+    version: int
+    body: dict
+
+def get_cart_version(db: Session, cart_id: int) -> Optional[int]:
+    # Una lectura por clave primaria, sin líneas ni ítems: basta para responder 304
+    return db.query(models.Cart.version).filter(models.Cart.id == cart_id).scalar()
+
+def _get_cart_lines_flat(db: Session, cart_id: int) -> Tuple[Tuple[int, int, int], List[dict]]:
+    # Totales, versión y líneas en una sola consulta; un carrito vacío devuelve una fila con la línea a NULL
+    rows = db.query(
+        models.Cart.total_quantity, models.Cart.total_price_cents, models.Cart.version, *_CART_LINE_COLUMNS
+    ).outerjoin(
+        models.CartItem, models.CartItem.cart_id == models.Cart.id
+    ).outerjoin(
+        models.Item, models.CartItem.item_id == models.Item.id
+    ).filter(models.Cart.id == cart_id).order_by(models.CartItem.id).all()
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cart not found.")
+    header = (rows[0][0], rows[0][1], rows[0][2])
+    return header, [cart_line_payload(cart_id, row[3:]) for row in rows if row.name is not None]
+
+def get_cart_contents(db: Session, cart_id: int) -> CartRead:
+    """
+    Contenido del carrito con la forma de schemas.Cart, como diccionario listo
+    para FastJSONResponse: en carritos grandes construir y volver a validar un
+    modelo Pydantic por línea domina el coste de la respuesta.
+    """
+    (total_quantity, total_price_cents, version), lines = _get_cart_lines_flat(db, cart_id)
+    # Los totales se leen de la fila del carrito en lugar de recalcularse
+    return CartRead(version, {
+        "id": cart_id,
+        "items": lines,
+        "total_quantity": total_quantity,
+        "total_price": from_cents(total_price_cents)
+    })
+
+def get_cart_invoice(db: Session, cart_id: int) -> CartRead:
+    # Factura con la forma de schemas.CartInvoice (ver get_cart_contents)
+    (total_quantity, total_price_cents, version), lines = _get_cart_lines_flat(db, cart_id)
+    return CartRead(version, {
+        "items": lines,
+        "total_quantity": total_quantity,
+        "total_price": from_cents(total_price_cents)
+    })
@@ -0,0 +1,51 @@
+# app/crud_async.py
+"""
+Versiones asíncronas de las funciones de crud.py para el modo AsyncSession.
+
+Cada función ejecuta la implementación síncrona dentro de AsyncSession.run_sync:
+la lógica de negocio vive en un único sitio y las esperas a la base de datos
+ceden el event loop en lugar de bloquear un hilo del threadpool. Como fuera de
+run_sync no se pueden cargar relaciones perezosas, las funciones que alimentan
+una respuesta devuelven directamente el esquema Pydantic (o el diccionario ya
+listo para serializar, en las lecturas del carrito).
+"""
+
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import crud, models, schemas
+
+async def get_cart(db: AsyncSession, cart_id: int) -> Optional[models.Cart]:
+    return await db.get(models.Cart, cart_id)
+
+async def create_cart(db: AsyncSession) -> models.Cart:
+    return await db.run_sync(crud.create_cart)
+
+async def add_item_to_cart(db: AsyncSession, cart_id: int, item_id: int, quantity: int) -> schemas.CartItem:
+    return await db.run_sync(crud.add_item_to_cart, cart_id, item_id, quantity)
+
+async def update_cart_item(db: AsyncSession, cart_id: int, item_id: int, quantity: int) -> Optional[schemas.CartItem]:
+    return await db.run_sync(crud.update_cart_item, cart_id, item_id, quantity)
+
+async def remove_cart_item(db: AsyncSession, cart_id: int, item_id: int) -> dict:
+    return await db.run_sync(crud.remove_cart_item, cart_id, item_id)
+
+async def add_items_to_cart(db: AsyncSession, cart_id: int, lines: List[schemas.CartItemCreate]) -> List[schemas.CartItem]:
+    return await db.run_sync(crud.add_items_to_cart, cart_id, lines)
+
+async def update_cart_items(db: AsyncSession, cart_id: int, lines: List[schemas.CartItemBase]) -> List[schemas.CartItem]:
+    return await db.run_sync(crud.update_cart_items, cart_id, lines)
+
+async def remove_cart_items(db: AsyncSession, cart_id: int, item_ids: List[int]) -> dict:
+    return await db.run_sync(crud.remove_cart_items, cart_id, item_ids)
+
+async def get_cart_version(db: AsyncSession, cart_id: int) -> Optional[int]:
+    return await db.run_sync(crud.get_cart_version, cart_id)
+
+async def get_cart_contents(db: AsyncSession, cart_id: int) -> crud.CartRead:
+    return await db.run_sync(crud.get_cart_contents, cart_id)
+
+async def get_cart_summary(db: AsyncSession, cart_id: int) -> schemas.CartSummary:
+    return await db.run_sync(crud.get_cart_summary, cart_id)
+
+async def get_cart_invoice(db: AsyncSession, cart_id: int) -> crud.CartRead:
+    return await db.run_sync(crud.get_cart_invoice, cart_id)
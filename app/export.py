@@ -0,0 +1,100 @@
+# app/export.py
+"""
+Exportación en streaming de la factura de un carrito (NDJSON o CSV).
+
+GET /cart/{id}/invoice/ construye la factura completa en memoria antes de
+enviar el primer byte. La exportación recorre las líneas con un cursor del
+servidor (yield_per: en PostgreSQL un cursor con nombre) y codifica cada lote
+en cuanto llega, así que la memoria de la petición depende de EXPORT_BATCH_SIZE
+y no del número de líneas. Los totales se acumulan mientras se emiten las
+líneas y se escriben al final como registro de cierre: siempre cuadran con
+las líneas exportadas.
+"""
+
+import csv
+import io
+from typing import AsyncIterator, Iterable, Iterator, List
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+from . import crud, schemas
+from .money import from_cents, to_cents
+
+EXPORT_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {
+    schemas.InvoiceExportFormat.NDJSON: "application/x-ndjson",
+    schemas.InvoiceExportFormat.CSV: "text/csv; charset=utf-8",
+}
+
+CSV_COLUMNS = ["line_id", "item_id", "name", "type", "quantity", "price", "subtotal"]
+
+class InvoiceEncoder:
+    """Codifica la cabecera, cada lote de líneas y el registro de totales de un formato."""
+
+    def __init__(self, cart_id: int, export_format: schemas.InvoiceExportFormat):
+        self.cart_id = cart_id
+        self.format = export_format
+        self.line_count = 0
+        self.total_quantity = 0
+        self.total_price_cents = 0
+
+    def header(self) -> bytes:
+        return self._csv_rows([CSV_COLUMNS]) if self.format == schemas.InvoiceExportFormat.CSV else b""
+
+    def lines(self, rows: List[tuple]) -> bytes:
+        payloads = [crud.cart_line_payload(self.cart_id, row) for row in rows]
+        for payload in payloads:
+            self.line_count += 1
+            self.total_quantity += payload["quantity"]
+            self.total_price_cents += payload["quantity"] * to_cents(payload["item"]["price"])
+        if self.format == schemas.InvoiceExportFormat.CSV:
+            return self._csv_rows(
+                [line["id"], line["item_id"], line["item"]["name"], line["item"]["type"],
+                 line["quantity"], line["item"]["price"], line["subtotal"]]
+                for line in payloads
+            )
+        return b"".join(orjson.dumps(payload, option=orjson.OPT_APPEND_NEWLINE) for payload in payloads)
+
+    def trailer(self) -> bytes:
+        total_price = from_cents(self.total_price_cents)
+        if self.format == schemas.InvoiceExportFormat.CSV:
+            return self._csv_rows([["", "", "TOTAL", "", self.total_quantity, "", total_price]])
+        return orjson.dumps(
+            {"cart_id": self.cart_id, "lines": self.line_count,
+             "total_quantity": self.total_quantity, "total_price": total_price},
+            option=orjson.OPT_APPEND_NEWLINE
+        )
+
+    @staticmethod
+    def _csv_rows(rows: Iterable[list]) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+def _iter_export(encoder: InvoiceEncoder, partitions: Iterable[List[tuple]]) -> Iterator[bytes]:
+    yield encoder.header()
+    for rows in partitions:
+        yield encoder.lines(rows)
+    yield encoder.trailer()
+
+async def _aiter_export(encoder: InvoiceEncoder, partitions: AsyncIterator[List[tuple]]) -> AsyncIterator[bytes]:
+    yield encoder.header()
+    async for rows in partitions:
+        yield encoder.lines(rows)
+    yield encoder.trailer()
+
+def invoice_export_response(cart_id: int, export_format: schemas.InvoiceExportFormat, partitions) -> StreamingResponse:
+    """
+    Respuesta en streaming a partir de los lotes de filas de
+    crud.cart_invoice_lines_statement: Result.partitions() en una Session o su
+    equivalente asíncrono en una AsyncSession.
+    """
+    encoder = InvoiceEncoder(cart_id, export_format)
+    body = _aiter_export(encoder, partitions) if hasattr(partitions, "__aiter__") else _iter_export(encoder, partitions)
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="cart-{cart_id}-invoice.{export_format.value}"'}
+    )
@@ -0,0 +1,305 @@
+# app/idempotency.py
+"""
+Cabecera Idempotency-Key en las mutaciones del carrito.
+
+Un cliente que reintenta un POST/PUT/DELETE tras un timeout envía la misma
+cabecera Idempotency-Key: la primera petición se ejecuta y su respuesta (si
+es 2xx) se guarda; las repeticiones devuelven esa respuesta, con la cabecera
+Idempotent-Replayed, sin pasar por la ruta, es decir, sin abrir sesión ni
+tocar items o cart_items. Así un reintento no vuelve a reservar stock ni a
+sumar cantidad, y durante un pico de latencia los reintentos no multiplican
+la carga.
+
+- La clave se guarda junto con el método y la ruta, y con un SHA-256 del
+  cuerpo: reutilizarla con otro cuerpo responde 422.
+- Una repetición que llega mientras la original está en curso espera su
+  resultado (almacén en memoria) o recibe 409 (almacén SQL).
+- Las respuestas que no son 2xx no se guardan: la transacción se deshizo y
+  el reintento se ejecuta de nuevo.
+- Con la respuesta se guardan las versiones de carrito que escribió la
+  petición original: la repetición las vuelve a anunciar (X-Cart-Version y
+  la cookie cart_version, ver app/replica.py), así que un cliente cuya
+  respuesta original se perdió también lee lo que escribió.
+
+IDEMPOTENCY_STORE elige el almacén: 'memory' (por defecto, LRU en proceso
+acotada por IDEMPOTENCY_MAX_KEYS y con caducidad IDEMPOTENCY_TTL) o 'sql'
+(tabla idempotency_keys, compartida entre workers; añade un INSERT y un
+UPDATE a la primera ejecución de cada clave). 'off' desactiva la cabecera.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Callable, Dict, Mapping, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from . import models, replica
+from .cache import LRUCache
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Resultados de IdempotencyStore.begin
+NEW = "executed"
+REPLAY = "replayed"
+IN_PROGRESS = "conflict"
+MISMATCH = "mismatch"
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+    # carrito -> versión que escribió la petición original
+    cart_versions: Dict[int, int] = field(default_factory=dict)
+
+    def to_response(self) -> Response:
+        return Response(content=self.body, status_code=self.status_code,
+                        headers={**self.headers, REPLAYED_HEADER: "true"})
+
+class IdempotencyStore(ABC):
+    """Reserva una clave (begin), guarda su respuesta (complete) o la libera (release)."""
+
+    def __init__(self):
+        self.outcomes: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.outcomes)
+
+    @abstractmethod
+    async def begin(self, key: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        ...
+
+    @abstractmethod
+    async def complete(self, key: str, response: StoredResponse):
+        ...
+
+    @abstractmethod
+    async def release(self, key: str):
+        ...
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """
+    Respuestas en una LRUCache del proceso. Las claves en curso se registran
+    en el event loop, donde se ejecutan todas las llamadas, así que no
+    necesitan lock.
+    """
+
+    def __init__(self, max_keys: int = 10_000, ttl: float = 86_400, wait_timeout: float = 10.0):
+        super().__init__()
+        self.responses = LRUCache(maxsize=max_keys, ttl=ttl)
+        self.wait_timeout = wait_timeout
+        self._pending: Dict[str, Tuple[str, asyncio.Event]] = {}
+
+    async def begin(self, key: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        while True:
+            stored = self.responses.get(key)
+            if stored is not None:
+                return (REPLAY if stored.fingerprint == fingerprint else MISMATCH), stored
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = (fingerprint, asyncio.Event())
+                return NEW, None
+            if pending[0] != fingerprint:
+                return MISMATCH, None
+            # La misma petición está en curso: esperar a que guarde su respuesta o libere la clave
+            try:
+                await asyncio.wait_for(pending[1].wait(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                return IN_PROGRESS, None
+
+    async def complete(self, key: str, response: StoredResponse):
+        self.responses.set(key, response)
+        self._finish(key)
+
+    async def release(self, key: str):
+        self._finish(key)
+
+    def _finish(self, key: str):
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            pending[1].set()
+
+class SqlIdempotencyStore(IdempotencyStore):
+    """
+    Respuestas en la tabla idempotency_keys, compartida por todos los workers.
+    La clave se reserva con un INSERT (la clave primaria decide quién la
+    ejecuta); una fila sin status_code es una petición en curso, que se
+    considera abandonada pasados 'pending_timeout' segundos.
+    """
+
+    def __init__(self, engine: Engine, ttl: float = 86_400, pending_timeout: float = 60.0, purge_every: int = 1000):
+        super().__init__()
+        self.engine = engine
+        self.ttl = ttl
+        self.pending_timeout = pending_timeout
+        self.purge_every = purge_every
+        self._inserted = 0
+
+    async def begin(self, key: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        return await run_in_threadpool(self._begin, key, fingerprint)
+
+    async def complete(self, key: str, response: StoredResponse):
+        await run_in_threadpool(self._complete, key, response)
+
+    async def release(self, key: str):
+        await run_in_threadpool(self._release, key)
+
+    def _begin(self, key: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        table = models.IdempotencyKey.__table__
+        row = None
+        for _ in range(2):
+            now = models.utcnow()
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(insert(table).values(key=key, fingerprint=fingerprint, created_at=now))
+                self._after_insert(now)
+                return NEW, None
+            except IntegrityError:
+                pass
+            with self.engine.begin() as conn:
+                row = conn.execute(select(table).where(table.c.key == key)).first()
+                if row is None:
+                    continue  # liberada entretanto
+                expired = row.created_at < now - timedelta(seconds=self.ttl)
+                abandoned = row.status_code is None and row.created_at < now - timedelta(seconds=self.pending_timeout)
+                if not (expired or abandoned):
+                    break
+                # Borrar solo esa fila (la misma marca de tiempo) y volver a intentar el INSERT
+                conn.execute(delete(table).where(table.c.key == key, table.c.created_at == row.created_at))
+                row = None
+        if row is None:
+            # Otra petición tomó y liberó la clave en cada intento
+            return IN_PROGRESS, None
+        if row.fingerprint != fingerprint:
+            return MISMATCH, None
+        if row.status_code is None:
+            return IN_PROGRESS, None
+        # Las claves de un objeto JSON son cadenas
+        cart_versions = {int(cart_id): version for cart_id, version in json.loads(row.cart_versions or "{}").items()}
+        return REPLAY, StoredResponse(row.fingerprint, row.status_code, json.loads(row.headers), row.body, cart_versions)
+
+    def _after_insert(self, now):
+        # Limpieza ocasional de las claves caducadas, a cargo de la propia petición
+        self._inserted += 1
+        if self.purge_every and self._inserted % self.purge_every == 0:
+            self.purge_expired(now)
+
+    def purge_expired(self, now=None) -> int:
+        table = models.IdempotencyKey.__table__
+        cutoff = (now or models.utcnow()) - timedelta(seconds=self.ttl)
+        with self.engine.begin() as conn:
+            return conn.execute(delete(table).where(table.c.created_at < cutoff)).rowcount
+
+    def _complete(self, key: str, response: StoredResponse):
+        table = models.IdempotencyKey.__table__
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(table).where(table.c.key == key)
+                .values(status_code=response.status_code, headers=json.dumps(response.headers), body=response.body,
+                        cart_versions=json.dumps(response.cart_versions))
+            )
+
+    def _release(self, key: str):
+        table = models.IdempotencyKey.__table__
+        with self.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.key == key, table.c.status_code.is_(None)))
+
+IDEMPOTENCY_STORES = ("memory", "sql", "off")
+
+def store_from_env(engine: Engine, env: Mapping[str, str] = os.environ) -> Optional[IdempotencyStore]:
+    """
+    Almacén configurado con IDEMPOTENCY_STORE, IDEMPOTENCY_TTL (segundos,
+    por defecto 86400) e IDEMPOTENCY_MAX_KEYS (solo 'memory'). Con 'off' devuelve None.
+    """
+    kind = env.get("IDEMPOTENCY_STORE", "memory").lower()
+    if kind not in IDEMPOTENCY_STORES:
+        raise ValueError(f"IDEMPOTENCY_STORE no soportado: {kind} (opciones: {', '.join(IDEMPOTENCY_STORES)})")
+    ttl = float(env.get("IDEMPOTENCY_TTL", "86400"))
+    if kind == "memory":
+        return MemoryIdempotencyStore(max_keys=int(env.get("IDEMPOTENCY_MAX_KEYS", "10000")), ttl=ttl)
+    if kind == "sql":
+        return SqlIdempotencyStore(engine, ttl=ttl)
+    return None
+
+def _default_store() -> Optional[IdempotencyStore]:
+    from .database import engine
+    return store_from_env(engine)
+
+store = _default_store()
+
+def _error(status_code: int, detail: str) -> Response:
+    return JSONResponse(status_code=status_code, content={"detail": detail})
+
+class IdempotentRoute(APIRoute):
+    """
+    route_class de los routers del carrito: en las mutaciones con cabecera
+    Idempotency-Key, envuelve la ruta con el almacén 'store' de este módulo.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if not self.methods & MUTATING_METHODS:
+            return handler
+
+        async def idempotent_handler(request: Request) -> Response:
+            header = request.headers.get(HEADER)
+            current = store
+            if header is None or current is None:
+                return await handler(request)
+            if not header or len(header) > MAX_KEY_LENGTH:
+                return _error(400, f"{HEADER} must be between 1 and {MAX_KEY_LENGTH} characters")
+
+            key = f"{request.method} {request.url.path} {header}"
+            # Starlette guarda el cuerpo en la petición: la ruta lo vuelve a leer sin coste
+            fingerprint = hashlib.sha256(await request.body()).hexdigest()
+            outcome, stored = await current.begin(key, fingerprint)
+            current.record(outcome)
+            if outcome == REPLAY:
+                # ReadYourWritesMiddleware vuelve a añadir la cabecera y la cookie de la versión
+                for cart_id, version in stored.cart_versions.items():
+                    replica.record_cart_version(cart_id, version)
+                return stored.to_response()
+            if outcome == MISMATCH:
+                return _error(422, f"{HEADER} was already used with a different request")
+            if outcome == IN_PROGRESS:
+                return _error(409, f"A request with this {HEADER} is still in progress")
+
+            try:
+                response = await handler(request)
+            except BaseException:
+                await current.release(key)
+                raise
+            body = getattr(response, "body", None)
+            if 200 <= response.status_code < 300 and body is not None:
+                headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+                writes = replica.current_writes.get()
+                cart_versions = dict(writes.versions) if writes is not None else {}
+                await current.complete(key, StoredResponse(fingerprint, response.status_code, headers, body, cart_versions))
+            else:
+                await current.release(key)
+            return response
+
+        return idempotent_handler
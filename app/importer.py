@@ -0,0 +1,234 @@
+# app/importer.py
+"""
+Importación masiva del catálogo desde ficheros CSV o JSONL.
+
+El fichero se lee en bloques de 'chunk_size' registros, así que la memoria no
+depende del tamaño del catálogo. Cada bloque se vuelca a una tabla temporal
+(COPY en PostgreSQL con psycopg2, executemany en el resto) y desde ahí se
+aplica con sentencias INSERT ... SELECT sobre 'items', 'products' y 'events':
+los ids de las subclases se obtienen uniendo por 'name', la columna única.
+
+Uso:
+    python -m app.importer catalog.jsonl
+    python -m app.importer catalog.csv --chunk-size 10000 --on-conflict skip
+"""
+
+import argparse
+import csv
+import io
+import json
+import resource
+import time
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import BigInteger, Column, Float, Integer, MetaData, String, Table, insert, text
+from sqlalchemy.engine import Connection, Engine
+
+from .models import Item, ItemType
+from .money import to_cents
+
+FIELDS = ["position", "name", "description", "thumbnail", "price", "price_cents", "stock", "type", "care_instructions", "event_date"]
+
+_stage_metadata = MetaData()
+catalog_stage = Table(
+    "catalog_import_stage", _stage_metadata,
+    # Posición del registro en el fichero: si un nombre se repite gana el último
+    Column("position", Integer, nullable=False),
+    Column("name", String, nullable=False),
+    Column("description", String, nullable=False),
+    Column("thumbnail", String, nullable=False),
+    Column("price", Float, nullable=False),
+    Column("price_cents", BigInteger, nullable=False),
+    Column("stock", Integer, nullable=False),
+    Column("type", String(7), nullable=False),
+    Column("care_instructions", String),
+    Column("event_date", String),
+    prefixes=["TEMPORARY"],
+)
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    chunks: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+def iter_records(path: str, fmt: Optional[str] = None) -> Iterator[Dict]:
+    # Lectura perezosa, registro a registro
+    fmt = fmt or ("csv" if path.endswith(".csv") else "jsonl")
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def normalize_record(record: Dict, position: int) -> Dict:
+    try:
+        item_type = ItemType(str(record["type"]).upper())
+        row = {
+            "name": record["name"],
+            "description": record["description"],
+            "thumbnail": record["thumbnail"],
+            "price": float(record["price"]),
+            "stock": int(record["stock"]),
+            "type": item_type.name,
+            "care_instructions": record.get("care_instructions") or None,
+            "event_date": record.get("event_date") or None,
+        }
+    except (KeyError, ValueError, TypeError) as e:
+        raise ValueError(f"Registro {position} inválido: {e!r}")
+    if not row["name"] or row["stock"] < 0 or row["price"] < 0:
+        raise ValueError(f"Registro {position} inválido: {record!r}")
+    # Las sentencias INSERT ... SELECT no pasan por models.Item: los céntimos se calculan aquí
+    row["price_cents"] = to_cents(row["price"])
+    row["position"] = position
+    return row
+
+def _chunks(records: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _load_stage(conn: Connection, rows: List[Dict]):
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[field] for field in FIELDS])
+        buffer.seek(0)
+        cursor = conn.connection.dbapi_connection.cursor()
+        cursor.copy_expert(f"COPY catalog_import_stage ({', '.join(FIELDS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        conn.execute(insert(catalog_stage), rows)
+
+def _apply_stage(conn: Connection, on_conflict: str):
+    # 'WHERE true' es obligatorio en SQLite para un INSERT ... SELECT con ON CONFLICT
+    if on_conflict == "update":
+        items_conflict = """ON CONFLICT (name) DO UPDATE SET
+            description = excluded.description, thumbnail = excluded.thumbnail,
+            price = excluded.price, price_cents = excluded.price_cents, stock = excluded.stock, type = excluded.type"""
+        product_conflict = "ON CONFLICT (id) DO UPDATE SET care_instructions = excluded.care_instructions"
+        event_conflict = "ON CONFLICT (id) DO UPDATE SET event_date = excluded.event_date"
+    else:
+        items_conflict = "ON CONFLICT (name) DO NOTHING"
+        product_conflict = event_conflict = "ON CONFLICT (id) DO NOTHING"
+
+    # En PostgreSQL 'items.type' es un ENUM nativo y el texto del staging debe convertirse
+    type_expr = "type"
+    if conn.dialect.name == "postgresql":
+        type_expr = f"CAST(type AS {Item.__table__.c.type.type.name})"
+
+    # Un nombre repetido en el bloque: solo cuenta su último registro. Sin esto
+    # PostgreSQL rechaza el INSERT ... ON CONFLICT DO UPDATE ("cannot affect row
+    # a second time") y las subclases se insertarían dos veces. ROW_NUMBER()
+    # funciona en PostgreSQL y en SQLite desde la 3.25
+    conn.execute(text("""
+        DELETE FROM catalog_import_stage WHERE position IN (
+            SELECT position FROM (
+                SELECT position, ROW_NUMBER() OVER (PARTITION BY name ORDER BY position DESC) AS newer
+                FROM catalog_import_stage
+            ) ranked WHERE newer > 1
+        )
+    """))
+
+    if on_conflict == "update":
+        # El stock importado es el total del ítem: en los ítems repartidos va
+        # entero a items.stock y sus shards quedan a 0 hasta el siguiente reparto
+        conn.execute(text("""
+            UPDATE item_stock_shards SET stock = 0
+            WHERE item_id IN (SELECT i.id FROM items i JOIN catalog_import_stage s ON i.name = s.name)
+        """))
+    conn.execute(text(f"""
+        INSERT INTO items (name, description, thumbnail, price, price_cents, stock, type)
+        SELECT name, description, thumbnail, price, price_cents, stock, {type_expr} FROM catalog_import_stage WHERE true
+        {items_conflict}
+    """))
+    conn.execute(text(f"""
+        INSERT INTO products (id, care_instructions)
+        SELECT i.id, s.care_instructions FROM catalog_import_stage s JOIN items i ON i.name = s.name
+        WHERE s.type = 'PRODUCT' AND i.type = 'PRODUCT'
+        {product_conflict}
+    """))
+    conn.execute(text(f"""
+        INSERT INTO events (id, event_date)
+        SELECT i.id, s.event_date FROM catalog_import_stage s JOIN items i ON i.name = s.name
+        WHERE s.type = 'EVENT' AND i.type = 'EVENT'
+        {event_conflict}
+    """))
+    if on_conflict == "update":
+        # Un ítem que cambia de tipo no debe conservar la fila de la otra subclase
+        for table, other_type in (("products", "EVENT"), ("events", "PRODUCT")):
+            conn.execute(text(f"""
+                DELETE FROM {table} WHERE id IN (
+                    SELECT i.id FROM catalog_import_stage s JOIN items i ON i.name = s.name
+                    WHERE i.type = '{other_type}'
+                )
+            """))
+    conn.execute(text("DELETE FROM catalog_import_stage"))
+
+def import_catalog(engine: Engine, records: Iterable[Dict], chunk_size: int = 5000,
+                   on_conflict: str = "update",
+                   progress: Optional[Callable[[ImportStats], None]] = None) -> ImportStats:
+    """
+    Importa 'records' en transacciones de 'chunk_size' filas. Con
+    on_conflict="update" los ítems existentes (mismo 'name') se actualizan en
+    su sitio; con "skip" se dejan como están.
+    """
+    if on_conflict not in ("update", "skip"):
+        raise ValueError(f"on_conflict no soportado: {on_conflict}")
+    stats = ImportStats()
+    start = time.perf_counter()
+    normalized = (normalize_record(record, position) for position, record in enumerate(records, 1))
+    with engine.connect() as conn:
+        catalog_stage.create(conn, checkfirst=False)
+        conn.commit()
+        for chunk in _chunks(normalized, chunk_size):
+            with conn.begin():
+                _load_stage(conn, chunk)
+                _apply_stage(conn, on_conflict)
+            stats.rows += len(chunk)
+            stats.chunks += 1
+            stats.elapsed = time.perf_counter() - start
+            if progress:
+                progress(stats)
+        catalog_stage.drop(conn)
+        conn.commit()
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+def _print_progress(stats: ImportStats):
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{stats.rows} filas importadas ({stats.rows_per_second:.0f} filas/s, RSS máx. {rss_mb:.0f} MB)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa un catálogo CSV o JSONL en items/products/events.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--on-conflict", choices=["update", "skip"], default="update",
+                        help="update: actualiza ítems existentes por 'name'; skip: los deja como están")
+    args = parser.parse_args()
+
+    from .database import engine
+    from .startup import prepare_schema
+
+    # Como el arranque de la app: por defecto exige el esquema migrado (DB_SCHEMA_MODE)
+    prepare_schema(engine)
+    stats = import_catalog(
+        engine, iter_records(args.path, args.format),
+        chunk_size=args.chunk_size, on_conflict=args.on_conflict, progress=_print_progress,
+    )
+    print(f"Importación completada: {stats.rows} filas en {stats.elapsed:.1f}s ({stats.rows_per_second:.0f} filas/s)")
+
+if __name__ == "__main__":
+    main()
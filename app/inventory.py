@@ -0,0 +1,284 @@
+# app/inventory.py
+"""
+Stock repartido en varias filas para ítems muy disputados.
+
+Cuando sale a la venta un concierto, todas las reservas del mismo ítem
+actualizan la misma fila de 'items' y se serializan en su bloqueo hasta el
+commit de cada petición. Un ítem con items.stock_shards = N > 1 reparte su
+stock en N contadores:
+
+- el shard 0 es la propia columna items.stock;
+- los shards 1..N-1 son filas de item_stock_shards.
+
+El stock disponible es items.stock + SUM(item_stock_shards.stock)
+(available_stock), que es lo que la API sigue devolviendo como 'stock'. Una
+reserva (crud.reserve_stock) es un UPDATE condicional sobre un shard elegido
+al azar; si ese shard no llega, se prueban sus hermanos y, cerca de agotarse
+el ítem, se toma de varios a la vez. Un ítem sin repartir no tiene filas en
+item_stock_shards y su reserva es la misma sentencia de siempre sobre 'items'.
+
+Cada worker guarda N en stock_shard_cache, pero solo como pista para elegir
+el shard: un valor desactualizado reparte peor la carga, nunca vende de más
+ni de menos, porque el shard 0 existe siempre y las filas que falten se
+saltan.
+
+Las reservas vacían los shards de forma desigual. Con STOCK_REBALANCE_INTERVAL
+definido, cada worker arranca un hilo que cada ese número de segundos vuelve a
+repartir el stock de los ítems repartidos a partes iguales, un ítem por
+transacción y esperando como mucho STOCK_REBALANCE_LOCK_TIMEOUT por sus filas
+en PostgreSQL (si el ítem está muy disputado se salta hasta la siguiente
+pasada).
+
+Repartir el stock de un ítem (o volver a juntarlo con --shards 1):
+    python -m app.inventory --item 42 --shards 8
+"""
+
+import argparse
+import logging
+import os
+import random
+import threading
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, literal, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from . import models
+from .cache import stock_shard_cache
+
+logger = logging.getLogger(__name__)
+
+def available_stock():
+    # Stock disponible de la fila de 'items' de la consulta: shard 0 más el resto de shards
+    shards = select(func.sum(models.ItemStockShard.stock)).where(
+        models.ItemStockShard.item_id == models.Item.id
+    ).correlate_except(models.ItemStockShard).scalar_subquery()
+    return (models.Item.stock + func.coalesce(shards, 0)).label("stock")
+
+def shard_count(item_id: int) -> int:
+    return stock_shard_cache.get(item_id) or 1
+
+def _other_shards_stock(item_id: int, shard: int):
+    # Stock del ítem fuera de 'shard', para el RETURNING de un UPDATE sobre ese shard. Sin
+    # correlate(None) las subconsultas se enlazarían con la fila que se está actualizando
+    others = select(func.sum(models.ItemStockShard.stock)).where(
+        models.ItemStockShard.item_id == item_id, models.ItemStockShard.shard != shard
+    ).correlate(None).scalar_subquery()
+    base = select(models.Item.stock).where(models.Item.id == item_id).correlate(None).scalar_subquery()
+    return base + func.coalesce(others, 0)
+
+def _change(db: Session, item_id: int, shard: int, amount: int, required: int) -> Optional[int]:
+    """
+    Suma 'amount' (negativo al reservar) al shard indicado si tiene al menos
+    'required' unidades y devuelve el stock disponible resultante del ítem.
+    None si el shard no existe o no tiene suficiente.
+    """
+    if shard == 0:
+        row = db.execute(
+            update(models.Item)
+            .where(models.Item.id == item_id, models.Item.stock >= required)
+            .values(stock=models.Item.stock + amount)
+            .returning(available_stock(), models.Item.stock_shards)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if row is None:
+            return None
+        # Cada escritura en el shard 0 refresca el número de shards que conoce el worker
+        stock_shard_cache.set(item_id, row.stock_shards)
+        return row.stock
+    shards = models.ItemStockShard
+    return db.execute(
+        update(shards)
+        .where(shards.item_id == item_id, shards.shard == shard, shards.stock >= required)
+        .values(stock=shards.stock + amount)
+        .returning(shards.stock + _other_shards_stock(item_id, shard))
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
+def take(db: Session, item_id: int, shard: int, quantity: int) -> Optional[int]:
+    # Reserva condicional sobre un único shard
+    return _change(db, item_id, shard, -quantity, quantity)
+
+def give(db: Session, item_id: int, shard: int, quantity: int) -> Optional[int]:
+    # Devolución sin condición; None si el shard no existe (p. ej. tras reducir N)
+    return _change(db, item_id, shard, quantity, 0)
+
+def shard_stocks(db: Session, item_id: int) -> List[Tuple[int, int]]:
+    # (shard, stock) de todos los shards del ítem, ordenados; vacío si el ítem no existe
+    rows = db.execute(
+        select(literal(0).label("shard"), models.Item.stock).where(models.Item.id == item_id).union_all(
+            select(models.ItemStockShard.shard, models.ItemStockShard.stock).where(
+                models.ItemStockShard.item_id == item_id
+            )
+        )
+    ).all()
+    return sorted((shard, stock) for shard, stock in rows)
+
+def take_from_siblings(db: Session, item_id: int, quantity: int, tried: int) -> Optional[int]:
+    """
+    Reserva cuando el shard 'tried' no tenía 'quantity' unidades: primero un
+    hermano que las tenga (empezando por el siguiente a 'tried') y, si ninguno
+    llega por sí solo, tomando de varios en orden de shard (el mismo orden en
+    todas las transacciones, así que no se bloquean entre sí). Solo pasa cerca
+    de agotarse el ítem o con los shards desequilibrados.
+
+    Si devuelve None puede haber tomado parte de los shards: quien llama debe
+    deshacer la transacción (como crud.raise_reservation_error).
+    """
+    stocks = shard_stocks(db, item_id)
+    if sum(stock for _, stock in stocks) < quantity:
+        return None
+    siblings = sorted((shard for shard, stock in stocks if shard != tried and stock >= quantity),
+                      key=lambda shard: (shard < tried, shard))
+    for shard in siblings:
+        remaining = take(db, item_id, shard, quantity)
+        if remaining is not None:
+            return remaining
+    needed, remaining = quantity, None
+    for shard, stock in stocks:
+        amount = min(stock, needed)
+        if amount and (result := take(db, item_id, shard, amount)) is not None:
+            needed, remaining = needed - amount, result
+            if not needed:
+                return remaining
+    return None
+
+# Reparto
+
+def _balanced(stocks: Dict[int, int], shards: int) -> bool:
+    # Mismos shards que stock_shards y ninguno se aleja de su parte en más de la mitad
+    if set(stocks) != set(range(shards)):
+        return False
+    tolerance = max(1, sum(stocks.values()) // (2 * shards))
+    return max(stocks.values()) - min(stocks.values()) <= tolerance
+
+def rebalance_item(conn: Connection, item_id: int, force: bool = False) -> bool:
+    """
+    Reparte a partes iguales el stock de un ítem entre sus items.stock_shards
+    shards, creando o borrando filas de item_stock_shards si N ha cambiado, en
+    la transacción de 'conn'. En PostgreSQL bloquea antes la fila del ítem y
+    las de sus shards, así que el total no cambia mientras se reparte.
+    Devuelve False si el ítem no existe o ya estaba equilibrado.
+    """
+    items, shards = models.Item.__table__, models.ItemStockShard.__table__
+    lock = (lambda statement: statement.with_for_update()) if conn.dialect.name == "postgresql" else (lambda statement: statement)
+    row = conn.execute(lock(select(items.c.stock, items.c.stock_shards).where(items.c.id == item_id))).first()
+    if row is None:
+        return False
+    rows = dict(conn.execute(lock(
+        select(shards.c.shard, shards.c.stock).where(shards.c.item_id == item_id).order_by(shards.c.shard)
+    )).all())
+    stocks = {0: row.stock, **rows}
+    count = max(row.stock_shards, 1)
+    if not force and _balanced(stocks, count):
+        return False
+
+    total = sum(stocks.values())
+    target = [total // count + (1 if shard < total % count else 0) for shard in range(count)]
+    conn.execute(update(items).where(items.c.id == item_id).values(stock=target[0]))
+    if any(shard >= count for shard in rows):
+        conn.execute(delete(shards).where(shards.c.item_id == item_id, shards.c.shard >= count))
+    existing = {shard: target[shard] for shard in rows if shard < count}
+    if existing:
+        conn.execute(
+            update(shards)
+            .where(shards.c.item_id == item_id, shards.c.shard.in_(existing))
+            .values(stock=case(existing, value=shards.c.shard))
+        )
+    missing = [{"item_id": item_id, "shard": shard, "stock": target[shard]}
+               for shard in range(1, count) if shard not in rows]
+    if missing:
+        conn.execute(insert(shards), missing)
+    return True
+
+def set_stock_shards(engine: Engine, item_id: int, shards: int) -> bool:
+    """Reparte el stock del ítem en 'shards' filas (1 lo vuelve a juntar en items.stock)."""
+    if shards < 1:
+        raise ValueError(f"El número de shards debe ser al menos 1: {shards}")
+    with engine.begin() as conn:
+        if conn.execute(update(models.Item.__table__).where(models.Item.id == item_id).values(stock_shards=shards)).rowcount != 1:
+            return False
+        rebalance_item(conn, item_id, force=True)
+    stock_shard_cache.set(item_id, shards)
+    return True
+
+def rebalance(engine: Engine, lock_timeout: float = 0.1) -> int:
+    """Una pasada sobre los ítems repartidos; devuelve cuántos se han vuelto a repartir."""
+    with engine.connect() as conn:
+        item_ids = conn.execute(select(models.ItemStockShard.item_id).distinct()).scalars().all()
+    rebalanced = 0
+    for item_id in item_ids:
+        try:
+            with engine.begin() as conn:
+                if conn.dialect.name == "postgresql":
+                    conn.execute(text("SELECT set_config('lock_timeout', :value, true)"),
+                                 {"value": f"{int(lock_timeout * 1000)}ms"})
+                rebalanced += rebalance_item(conn, item_id)
+        except OperationalError as e:
+            # Las reservas tienen prioridad: el ítem se reparte en la siguiente pasada
+            logger.warning(f"Reparto del stock del ítem {item_id} aplazado por un bloqueo: {e.orig}")
+    return rebalanced
+
+class StockRebalancer:
+    """Hilo en segundo plano que ejecuta rebalance() cada 'interval' segundos."""
+
+    def __init__(self, engine: Engine, interval: float = 1.0, lock_timeout: float = 0.1):
+        self.engine = engine
+        self.interval = interval
+        self.lock_timeout = lock_timeout
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        # Primera pasada con un retraso aleatorio para que los workers no coincidan
+        delay = random.uniform(0, self.interval)
+        while not self._stop.wait(delay):
+            try:
+                rebalance(self.engine, lock_timeout=self.lock_timeout)
+            except Exception as e:
+                logger.error(f"Error inesperado al repartir el stock: {e}")
+            delay = self.interval
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stock-rebalancer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def rebalancer_from_env(engine: Engine, env: Mapping[str, str] = os.environ) -> Optional[StockRebalancer]:
+    """
+    StockRebalancer configurado con STOCK_REBALANCE_INTERVAL y
+    STOCK_REBALANCE_LOCK_TIMEOUT. Sin STOCK_REBALANCE_INTERVAL (o con 0)
+    devuelve None: los shards solo se reparten con el comando de este módulo.
+    """
+    interval = float(env.get("STOCK_REBALANCE_INTERVAL", "0"))
+    if interval <= 0:
+        return None
+    return StockRebalancer(
+        engine,
+        interval=interval,
+        lock_timeout=float(env.get("STOCK_REBALANCE_LOCK_TIMEOUT", "0.1")),
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Reparte el stock de un ítem en varias filas.")
+    parser.add_argument("--item", type=int, help="id del ítem")
+    parser.add_argument("--shards", type=int, help="número de shards (1 para volver a juntarlo)")
+    parser.add_argument("--rebalance", action="store_true", help="una pasada de reparto sobre todos los ítems repartidos")
+    args = parser.parse_args()
+
+    from .database import engine
+    if args.item is not None and args.shards is not None:
+        if not set_stock_shards(engine, args.item, args.shards):
+            parser.exit(1, f"No existe el ítem {args.item}\n")
+        print(f"Stock del ítem {args.item} repartido en {args.shards} shards")
+    if args.rebalance:
+        print(f"Repartidos {rebalance(engine)} ítems")
+
+if __name__ == "__main__":
+    main()
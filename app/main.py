@@ -1,18 +1,83 @@
 # app/main.py
 
+import time
+
+# Inicio de la fase 'import' del arranque (ver app/startup.py)
+IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .routers import cart
-from .database import Base, engine
+from fastapi.concurrency import run_in_threadpool
+from . import idempotency, inventory, startup, sweeper
+from .replica import ReadYourWritesMiddleware
+from .repository import cart_repository
+from .routers import items, system
+from .database import engine, async_engine, read_engine, pool_telemetry, async_pool_telemetry, read_pool_telemetry, ASYNC_MODE
+from .metrics import MetricsMiddleware, instrument_engine, registry
 
-# Importar todos los modelos para asegurar que las tablas se creen
-from . import models
+# Con un driver asíncrono en DATABASE_URL las rutas se sirven en el event loop;
+# solo se importa el router (y su pila de SQLAlchemy) del modo activo
+if ASYNC_MODE:
+    from .routers import cart_async as cart_router
+else:
+    from .routers import cart as cart_router
 
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El esquema se comprueba al arrancar el worker, no al importar el módulo. En el
+    # threadpool, que así queda iniciado antes de la primera petición síncrona
+    await run_in_threadpool(startup.run, engine)
+    # Recuperación de carritos abandonados, solo si CART_TTL_SECONDS está definido
+    cart_sweeper = sweeper.sweeper_from_env(engine)
+    if cart_sweeper is not None:
+        cart_sweeper.start()
+    # Reparto del stock de los ítems repartidos, solo si STOCK_REBALANCE_INTERVAL está definido
+    stock_rebalancer = inventory.rebalancer_from_env(engine)
+    if stock_rebalancer is not None:
+        stock_rebalancer.start()
+    # Volcado periódico de la capa en memoria (CART_STORE=memory); al parar se vuelca todo
+    cart_repository.start()
+    try:
+        yield
+    finally:
+        cart_repository.stop()
+        if cart_sweeper is not None:
+            cart_sweeper.stop()
+        if stock_rebalancer is not None:
+            stock_rebalancer.stop()
 
 app = FastAPI(
     title="Shopping Cart API",
     description="API para gestionar un carrito de la compra.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-app.include_router(cart.router)
+# Versión de los carritos modificados en las respuestas, para leer lo escrito
+# aunque las lecturas vayan a la réplica (ver app/replica.py)
+app.add_middleware(ReadYourWritesMiddleware)
+# Latencia, códigos de estado y consultas por ruta, servidos en /metrics
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+if read_engine is not None:
+    instrument_engine(read_engine)
+registry.add_pool(pool_telemetry)
+registry.add_pool(async_pool_telemetry)
+registry.add_pool(read_pool_telemetry)
+registry.add_startup(startup.report)
+registry.add_sweeper(sweeper.metrics)
+registry.add_cart_store(cart_repository)
+registry.add_reservations(cart_repository)
+if idempotency.store is not None:
+    registry.add_idempotency(idempotency.store)
+
+app.include_router(cart_router.router)
+# El catálogo es de solo lectura y usa la sesión síncrona en ambos modos
+app.include_router(items.router)
+# Telemetría del pool de conexiones y métricas de Prometheus
+app.include_router(system.router)
+app.include_router(system.metrics_router)
+
+startup.report.record("import", time.perf_counter() - IMPORT_STARTED)
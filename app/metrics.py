@@ -0,0 +1,309 @@
+# app/metrics.py
+"""
+Métricas de peticiones en formato de texto de Prometheus, sin dependencias.
+
+MetricsMiddleware (ASGI puro) registra por método y plantilla de ruta la
+latencia, los códigos de estado, las consultas SQL y el tiempo en base de
+datos de cada petición. Las consultas se cuentan con los eventos
+before/after_cursor_execute de los engines instrumentados con
+instrument_engine(); la petición en curso se localiza con una ContextVar,
+que se propaga al threadpool de las rutas síncronas y a run_sync.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .query_budget import get_query_budget
+from .telemetry import DEFAULT_BUCKETS, PoolTelemetry
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "query_started")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.query_started = 0.0
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+class RouteMetrics:
+    """Contadores de una combinación (método, ruta), protegidos por un único lock."""
+
+    __slots__ = ("latency_counts", "latency_sum", "query_counts", "queries", "db_seconds", "statuses",
+                 "over_budget", "lock")
+
+    def __init__(self):
+        self.latency_counts = [0] * (len(DEFAULT_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.query_counts = [0] * (len(QUERY_COUNT_BUCKETS) + 1)
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statuses: Dict[int, int] = {}
+        self.over_budget = 0
+        self.lock = threading.Lock()
+
+    def observe(self, status: int, seconds: float, queries: int, db_seconds: float, over_budget: bool = False):
+        latency_index = bisect.bisect_left(DEFAULT_BUCKETS, seconds)
+        query_index = bisect.bisect_left(QUERY_COUNT_BUCKETS, queries)
+        with self.lock:
+            self.latency_counts[latency_index] += 1
+            self.latency_sum += seconds
+            self.query_counts[query_index] += 1
+            self.queries += queries
+            self.db_seconds += db_seconds
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if over_budget:
+                self.over_budget += 1
+
+class MetricsRegistry:
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self._lock = threading.Lock()
+        self._pools: List[PoolTelemetry] = []
+        self._startup = None
+        self._sweeper = None
+        self._cart_store = None
+        self._idempotency = None
+        self._reservations = None
+
+    def route(self, method: str, path: str) -> RouteMetrics:
+        metrics = self._routes.get((method, path))
+        if metrics is None:
+            with self._lock:
+                metrics = self._routes.setdefault((method, path), RouteMetrics())
+        return metrics
+
+    def add_pool(self, telemetry: Optional[PoolTelemetry]):
+        if telemetry is not None:
+            self._pools.append(telemetry)
+
+    def add_startup(self, report):
+        # app.startup.StartupReport con la duración de cada fase del arranque
+        self._startup = report
+
+    def add_sweeper(self, metrics):
+        # app.sweeper.SweeperMetrics con lo recuperado de los carritos abandonados
+        self._sweeper = metrics
+
+    def add_cart_store(self, repository):
+        # Solo la capa en memoria (app.repository.MemoryCartRepository) tiene estadísticas
+        if hasattr(repository, "stats"):
+            self._cart_store = repository
+
+    def add_reservations(self, repository):
+        # Solo con RESERVATION_QUEUE=on: app.reservations.ReservationBatcher del repositorio SQL
+        reservations = getattr(repository, "reservations", None)
+        if reservations is not None:
+            self._reservations = reservations
+
+    def add_idempotency(self, store):
+        # app.idempotency.IdempotencyStore: peticiones con Idempotency-Key por resultado
+        self._idempotency = store
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            routes = sorted(self._routes.items())
+        snapshots = []
+        for (method, path), metrics in routes:
+            with metrics.lock:
+                snapshots.append((
+                    {"method": method, "route": path},
+                    list(metrics.latency_counts), metrics.latency_sum,
+                    list(metrics.query_counts), metrics.queries, metrics.db_seconds,
+                    metrics.over_budget, dict(metrics.statuses),
+                ))
+
+        lines += _header("http_requests_total", "counter", "Peticiones HTTP por ruta y código de estado.")
+        for labels, *_, statuses in snapshots:
+            for status, count in sorted(statuses.items()):
+                lines.append(_sample("http_requests_total", {**labels, "status": str(status)}, count))
+
+        lines += _header("http_request_duration_seconds", "histogram", "Latencia de las peticiones HTTP.")
+        for labels, latency_counts, latency_sum, *_ in snapshots:
+            lines += _histogram("http_request_duration_seconds", labels, DEFAULT_BUCKETS, latency_counts, latency_sum)
+
+        lines += _header("http_request_db_queries", "histogram", "Consultas SQL por petición.")
+        for labels, _, _, query_counts, queries, *_ in snapshots:
+            lines += _histogram("http_request_db_queries", labels, QUERY_COUNT_BUCKETS, query_counts, queries)
+
+        lines += _header("http_request_db_seconds_total", "counter", "Tiempo acumulado en base de datos.")
+        for labels, *_, db_seconds, _, _ in snapshots:
+            lines.append(_sample("http_request_db_seconds_total", labels, db_seconds))
+
+        lines += _header("http_request_query_budget_exceeded_total", "counter",
+                         "Peticiones que superaron el presupuesto de sentencias SQL de su ruta.")
+        for labels, *_, over_budget, _ in snapshots:
+            lines.append(_sample("http_request_query_budget_exceeded_total", labels, over_budget))
+
+        pools = [telemetry.snapshot() for telemetry in self._pools]
+        for name, kind, help_text, key in (
+            ("db_pool_checked_out", "gauge", "Conexiones del pool en uso.", "checked_out"),
+            ("db_pool_checkouts_total", "counter", "Conexiones entregadas por el pool.", "checkouts"),
+            ("db_pool_timeouts_total", "counter", "Esperas por conexión que agotaron el timeout.", "timeouts"),
+        ):
+            lines += _header(name, kind, help_text)
+            for pool in pools:
+                lines.append(_sample(name, {"pool": pool["name"]}, pool[key]))
+        lines += _header("db_pool_wait_seconds", "histogram", "Espera por una conexión del pool.")
+        for pool in pools:
+            wait = pool["wait_seconds"]
+            lines += [
+                _sample("db_pool_wait_seconds_bucket", {"pool": pool["name"], "le": le}, count)
+                for le, count in wait["buckets"].items()
+            ]
+            lines.append(_sample("db_pool_wait_seconds_sum", {"pool": pool["name"]}, wait["sum"]))
+            lines.append(_sample("db_pool_wait_seconds_count", {"pool": pool["name"]}, wait["count"]))
+
+        if self._startup is not None:
+            lines += _header("app_startup_seconds", "gauge", "Duración de cada fase del arranque del worker.")
+            for phase, seconds in self._startup.phases.items():
+                lines.append(_sample("app_startup_seconds", {"phase": phase}, seconds))
+
+        if self._sweeper is not None:
+            sweeper = self._sweeper.snapshot()
+            for name, kind, help_text, key in (
+                ("cart_sweeper_runs_total", "counter", "Pasadas del sweeper de carritos abandonados.", "runs"),
+                ("cart_sweeper_batches_total", "counter", "Lotes ejecutados por el sweeper.", "batches"),
+                ("cart_sweeper_skipped_batches_total", "counter", "Lotes abortados para no esperar a un bloqueo.", "skipped_batches"),
+                ("cart_sweeper_reclaimed_carts_total", "counter", "Carritos abandonados eliminados.", "carts"),
+                ("cart_sweeper_reclaimed_lines_total", "counter", "Líneas de carritos abandonados eliminadas.", "lines"),
+                ("cart_sweeper_reclaimed_units_total", "counter", "Unidades devueltas al stock.", "units"),
+                ("cart_sweeper_last_run_seconds", "gauge", "Duración de la última pasada del sweeper.", "last_run_seconds"),
+            ):
+                lines += _header(name, kind, help_text)
+                lines.append(f"{name} {sweeper[key]}")
+
+        if self._cart_store is not None:
+            store = self._cart_store.stats()
+            for name, kind, help_text, key in (
+                ("cart_store_carts", "gauge", "Carritos en la capa en memoria.", "carts"),
+                ("cart_store_dirty_carts", "gauge", "Carritos en memoria con cambios sin volcar a SQL.", "dirty"),
+                ("cart_store_hits_total", "counter", "Accesos a carritos que ya estaban en memoria.", "hits"),
+                ("cart_store_loads_total", "counter", "Carritos cargados desde SQL.", "loads"),
+                ("cart_store_evictions_total", "counter", "Carritos expulsados de memoria (LRU o inactividad).", "evictions"),
+                ("cart_store_flushes_total", "counter", "Volcados de un carrito a SQL.", "flushes"),
+                ("cart_store_flush_errors_total", "counter", "Volcados fallidos.", "flush_errors"),
+            ):
+                lines += _header(name, kind, help_text)
+                lines.append(f"{name} {store[key]}")
+
+        if self._reservations is not None:
+            queue = self._reservations.metrics.snapshot()
+            lines += _header("reservation_queue_pending", "gauge", "Peticiones de reserva esperando en la cola del worker.")
+            lines.append(f"reservation_queue_pending {self._reservations.pending}")
+            for name, help_text, key in (
+                ("reservation_queue_shed_total", "Peticiones rechazadas con 429 por la cola llena.", "shed"),
+                ("reservation_queue_fallbacks_total", "Lotes aplicados petición a petición tras fallar.", "fallbacks"),
+                ("reservation_queue_timeouts_total", "Peticiones que recibieron 503 por esperar demasiado a su lote.", "timeouts"),
+            ):
+                lines += _header(name, "counter", help_text)
+                lines.append(f"{name} {queue[key]}")
+            for name, help_text, key in (
+                ("reservation_queue_batch_size", "Peticiones por lote aplicado en una transacción.", "batch_sizes"),
+                ("reservation_queue_wait_seconds", "Espera de cada petición hasta que se aplica su lote.", "queue_wait"),
+            ):
+                histogram = queue[key]
+                lines += _header(name, "histogram", help_text)
+                lines += [f'{name}_bucket{{le="{le}"}} {count}' for le, count in histogram["buckets"].items()]
+                lines.append(f"{name}_sum {histogram['sum']}")
+                lines.append(f"{name}_count {histogram['count']}")
+
+        if self._idempotency is not None:
+            lines += _header("idempotency_requests_total", "counter",
+                             "Mutaciones con Idempotency-Key: ejecutadas, repetidas, en curso o con otro cuerpo.")
+            for outcome, count in sorted(self._idempotency.snapshot().items()):
+                lines.append(_sample("idempotency_requests_total", {"outcome": outcome}, count))
+        return "\n".join(lines) + "\n"
+
+def _header(name: str, kind: str, help_text: str) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _sample(name: str, labels: Dict[str, str], value) -> str:
+    rendered = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+    return f"{name}{{{rendered}}} {value}"
+
+def _histogram(name: str, labels: Dict[str, str], buckets: Sequence[float], counts: Iterable[int], total) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(tuple(buckets) + ("+Inf",), counts):
+        cumulative += count
+        lines.append(_sample(f"{name}_bucket", {**labels, "le": str(bound)}, cumulative))
+    lines.append(_sample(f"{name}_sum", labels, total))
+    lines.append(_sample(f"{name}_count", labels, cumulative))
+    return lines
+
+registry = MetricsRegistry()
+
+class MetricsMiddleware:
+    """Middleware ASGI que registra cada petición HTTP en 'registry'."""
+
+    def __init__(self, app, registry: MetricsRegistry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            # Plantilla de la ruta (/cart/{cart_id}/) para acotar la cardinalidad
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            budget = get_query_budget(scope.get("endpoint"))
+            over_budget = budget is not None and stats.queries > budget
+            if over_budget:
+                logger.warning(f"{scope['method']} {path} ejecutó {stats.queries} sentencias SQL (presupuesto {budget}).")
+            self.registry.route(scope["method"], path).observe(
+                status, elapsed, stats.queries, stats.db_seconds, over_budget
+            )
+
+def instrument_engine(engine: Engine):
+    """Cuenta las consultas y el tiempo en base de datos de la petición en curso."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = current_request.get()
+        if stats is not None:
+            stats.query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += time.perf_counter() - stats.query_started
@@ -1,10 +1,21 @@
 # app/models.py
 
-from sqlalchemy import Column, Integer, ForeignKey, Float, String, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, DateTime, Integer, ForeignKey, Float, LargeBinary, String, Enum, Index, func
+from sqlalchemy.orm import relationship, validates
 from .database import Base
+from .money import to_cents
+from datetime import datetime, timezone
 from enum import Enum as PyEnum
 
+def utcnow() -> datetime:
+    # Marcas de tiempo en UTC sin zona, iguales en SQLite y PostgreSQL
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def last_activity_column() -> Column:
+    # Se renueva en cada INSERT/UPDATE, también desde sentencias Core (onupdate);
+    # la usa app.sweeper para encontrar carritos abandonados
+    return Column(DateTime, nullable=False, default=utcnow, onupdate=utcnow, server_default=func.now(), index=True)
+
 class ItemType(PyEnum):
     PRODUCT = "PRODUCT"
     EVENT = "EVENT"
@@ -16,13 +27,27 @@ class Item(Base):
     description = Column(String, nullable=False)
     thumbnail = Column(String, nullable=False)
     price = Column(Float, nullable=False)
+    # El precio en céntimos (ver app/money.py), para sumar importes en SQL sin redondear allí
+    price_cents = Column(BigInteger, nullable=False)
     stock = Column(Integer, nullable=False)
+    # Contadores entre los que se reparte el stock (ver app/inventory.py); con 1
+    # todo el stock está en 'stock' y no hay filas en item_stock_shards
+    stock_shards = Column(Integer, nullable=False, default=1, server_default="1")
     type = Column(Enum(ItemType), nullable=False)
 
     __mapper_args__ = {
         'polymorphic_identity': 'item',
         'polymorphic_on': type
     }
+    # Paginación por clave (keyset) filtrando por tipo
+    __table_args__ = (
+        Index('ix_items_type_id', 'type', 'id'),
+    )
+
+    @validates('price')
+    def _set_price_cents(self, key, price):
+        self.price_cents = to_cents(price)
+        return price
 
 class Product(Item):
     __tablename__ = 'products'
@@ -42,9 +67,22 @@ class Event(Item):
         'polymorphic_identity': ItemType.EVENT
     }
 
+class ItemStockShard(Base):
+    # Shards 1..N-1 del stock de un ítem repartido; el shard 0 es items.stock
+    __tablename__ = 'item_stock_shards'
+    item_id = Column(Integer, ForeignKey('items.id', ondelete="CASCADE"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    stock = Column(Integer, nullable=False)
+
 class Cart(Base):
     __tablename__ = 'carts'
     id = Column(Integer, primary_key=True, index=True)
+    # Totales mantenidos por cada mutación en la misma transacción (lectura O(1))
+    total_quantity = Column(Integer, nullable=False, default=0, server_default="0")
+    # Importe en céntimos enteros (ver app/money.py)
+    total_price_cents = Column(BigInteger, nullable=False, default=0, server_default="0")
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    last_activity_at = last_activity_column()
     items = relationship(
         "CartItem",
         back_populates="cart",
@@ -58,6 +96,24 @@ class CartItem(Base):
     cart_id = Column(Integer, ForeignKey('carts.id', ondelete="CASCADE"), nullable=False)
     item_id = Column(Integer, ForeignKey('items.id', ondelete="CASCADE"), nullable=False)
     quantity = Column(Integer, nullable=False)
+    last_activity_at = last_activity_column()
+
+    # Una línea por ítem y carrito: lo usa el upsert de crud.upsert_cart_lines y,
+    # por su primera columna, sirve también las búsquedas por cart_id
+    __table_args__ = (
+        Index('ux_cart_items_cart_id_item_id', 'cart_id', 'item_id', unique=True),
+    )
 
     cart = relationship("Cart", back_populates="items")
     item = relationship("Item")
+
+class IdempotencyKey(Base):
+    # Respuestas de las mutaciones con cabecera Idempotency-Key (IDEMPOTENCY_STORE=sql, ver app/idempotency.py)
+    __tablename__ = 'idempotency_keys'
+    key = Column(String, primary_key=True)  # método, ruta y valor de la cabecera
+    fingerprint = Column(String(64), nullable=False)  # SHA-256 del cuerpo de la petición
+    status_code = Column(Integer)  # NULL mientras la petición original está en curso
+    headers = Column(String)
+    body = Column(LargeBinary)
+    cart_versions = Column(String)  # JSON {carrito: versión} escrito por la petición (ver app/replica.py)
+    created_at = Column(DateTime, nullable=False, default=utcnow, index=True)
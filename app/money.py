@@ -0,0 +1,31 @@
+# app/money.py
+"""
+Importes del carrito en céntimos enteros.
+
+items.price sigue siendo el precio con decimales que recibe y devuelve la
+API, pero los totales (carts.total_price_cents) y los subtotales se calculan
+con enteros: sumar y restar precios en coma flotante acumula error con cada
+mutación del carrito, mientras que la suma de céntimos es exacta en Python,
+SQLite y PostgreSQL.
+
+Un precio con más de dos decimales cuenta redondeado al céntimo, con la
+mitad hacia arriba (0.125 -> 0.13), sobre su representación decimal. El
+redondeo se hace solo aquí: items.price_cents se escribe con to_cents al
+fijar el precio (models.Item, importador) y las sumas en SQL usan esa
+columna. ROUND() de SQL no sirve, porque resuelve los empates de forma
+distinta en SQLite (alejándose de cero) y en PostgreSQL (al par).
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+_CENT = Decimal("0.01")
+
+def to_cents(price: float) -> int:
+    return int(Decimal(str(price)).quantize(_CENT, rounding=ROUND_HALF_UP) * 100)
+
+def from_cents(cents: int) -> float:
+    # El float más cercano al importe exacto: se serializa con dos decimales como mucho
+    return cents / 100
+
+def line_subtotal(quantity: int, price: float) -> float:
+    return from_cents(quantity * to_cents(price))
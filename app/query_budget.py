@@ -0,0 +1,99 @@
+# app/query_budget.py
+"""
+Presupuesto de sentencias SQL por ruta.
+
+Cada ruta declara con @query_budget(n) el máximo de sentencias que puede
+ejecutar. Las pruebas lo comprueban con QueryBudget (ver el fixture
+'assert_max_queries' de tests/conftest.py) y MetricsMiddleware cuenta en
+producción las peticiones que lo superan.
+
+QueryBudget detecta además patrones N+1: una misma forma de sentencia (SQL
+sin literales y con las listas IN / CASE colapsadas) repetida más de
+'max_repeats' veces en una sola llamada.
+"""
+
+import re
+from collections import Counter
+from typing import Callable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+def query_budget(max_queries: int) -> Callable:
+    """Declara el presupuesto de sentencias de una ruta (se coloca bajo @router.get/post...)."""
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+def get_query_budget(endpoint: Optional[Callable]) -> Optional[int]:
+    return getattr(endpoint, "query_budget", None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETER = re.compile(r"%\([^)]+\)s|%s|\$\d+|:\w+|\?")
+_PARAMETER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHEN_CLAUSES = re.compile(r"(?:WHEN \? THEN \?\s*)+")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_statement(statement: str) -> str:
+    """Forma de una sentencia: iguala parámetros, literales y listas de longitud variable."""
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _PARAMETER.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _WHITESPACE.sub(" ", shape).strip()
+    shape = _PARAMETER_LIST.sub("(?)", shape)
+    return _WHEN_CLAUSES.sub("WHEN ? THEN ? ", shape)
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+class QueryBudget:
+    """
+    Context manager que registra las sentencias ejecutadas sobre 'engine' y, al
+    salir, falla si superan 'max_queries' o si alguna forma se repite más de
+    'max_repeats' veces.
+
+        with QueryBudget(engine, max_queries=2):
+            client.get("/cart/1/")
+    """
+
+    def __init__(self, engine: Engine, max_queries: Optional[int] = None, max_repeats: Optional[int] = 2):
+        self.engine = engine
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.statements: List[str] = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def repeated_shapes(self) -> Counter:
+        shapes = Counter(normalize_statement(statement) for statement in self.statements)
+        limit = self.max_repeats if self.max_repeats is not None else 1
+        return Counter({shape: n for shape, n in shapes.items() if n > limit})
+
+    def __enter__(self) -> "QueryBudget":
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+        if exc_type is not None:
+            return False
+        if self.max_queries is not None and self.count > self.max_queries:
+            raise QueryBudgetExceeded(
+                f"{self.count} sentencias SQL, presupuesto {self.max_queries}:\n" + self._listing()
+            )
+        if self.max_repeats is not None:
+            repeated = self.repeated_shapes()
+            if repeated:
+                details = "\n".join(f"  {n}x {shape}" for shape, n in repeated.most_common())
+                raise QueryBudgetExceeded(f"Posible N+1, sentencias repetidas:\n{details}")
+        return False
+
+    def _listing(self) -> str:
+        return "\n".join(f"  {i}. {_WHITESPACE.sub(' ', statement)}" for i, statement in enumerate(self.statements, 1))
@@ -0,0 +1,134 @@
+# app/replica.py
+"""
+Lecturas desde una réplica con read-your-writes.
+
+Las rutas de solo lectura (contenido, resumen, factura y exportación del
+carrito, y el catálogo) piden su sesión con get_read_db. Con
+DATABASE_READ_URL definida es una sesión de la réplica; sin ella, la de
+get_db.
+
+La réplica va con retraso: un cliente que acaba de modificar su carrito
+podría no ver el cambio. Por eso cada mutación que cambia la versión de un
+carrito (Cart.version) responde con dos avisos, limitados a ese carrito:
+
+- la cabecera X-Cart-Version;
+- la cookie cart_version, con Path=/cart/{id}/ y una duración de
+  READ_YOUR_WRITES_WINDOW segundos (por defecto 5).
+
+Mientras una lectura traiga la cookie o la cabecera, get_read_db lee antes la
+versión del carrito en la réplica. Si ya llega a la indicada, la lectura va
+a la réplica; si no, al primario. Pasada la ventana, las lecturas vuelven
+siempre a la réplica.
+
+Las versiones escritas se recogen en una ContextVar con
+record_cart_version (crud.apply_cart_totals, crud.create_cart...). La fija
+ReadYourWritesMiddleware en cada petición y se propaga al threadpool, como
+app.metrics.current_request.
+"""
+
+import os
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from fastapi import Depends, Request
+from sqlalchemy.orm import Session
+from starlette.datastructures import MutableHeaders
+
+from . import database, models
+from .database import get_db
+
+HEADER = "X-Cart-Version"
+COOKIE = "cart_version"
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+
+class CartWrites:
+    """Versión final de cada carrito modificado por la petición."""
+
+    __slots__ = ("versions",)
+
+    def __init__(self):
+        self.versions: Dict[int, int] = {}
+
+    def record(self, cart_id: int, version: int):
+        self.versions[cart_id] = max(version, self.versions.get(cart_id, version))
+
+current_writes: ContextVar[Optional[CartWrites]] = ContextVar("current_writes", default=None)
+
+def record_cart_version(cart_id: int, version: int):
+    # Fuera de una petición HTTP (scripts, sweeper, pruebas directas de crud) no hay nada que avisar
+    writes = current_writes.get()
+    if writes is not None:
+        writes.record(cart_id, version)
+
+class ReadYourWritesMiddleware:
+    """Middleware ASGI que añade X-Cart-Version y la cookie cart_version a las mutaciones con éxito."""
+
+    def __init__(self, app, window: float = READ_YOUR_WRITES_WINDOW):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        writes = CartWrites()
+        token = current_writes.set(writes)
+
+        async def send_with_version(message):
+            if message["type"] == "http.response.start" and writes.versions and 200 <= message["status"] < 300:
+                headers = MutableHeaders(scope=message)
+                for cart_id, version in writes.versions.items():
+                    headers.append("set-cookie", f"{COOKIE}={version}; Max-Age={int(self.window)}; "
+                                                 f"Path=/cart/{cart_id}/; HttpOnly; SameSite=Lax")
+                if len(writes.versions) == 1:
+                    headers[HEADER] = str(next(iter(writes.versions.values())))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_version)
+        finally:
+            current_writes.reset(token)
+
+def required_version(request: Request) -> Optional[int]:
+    # Versión que el cliente ya ha visto escrita: cabecera explícita o cookie de la ventana
+    value = request.headers.get(HEADER) or request.cookies.get(COOKIE)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _replica_caught_up(db: Session, cart_id: int, version: int) -> bool:
+    # Como crud.get_cart_version: una lectura por clave primaria
+    replicated = db.query(models.Cart.version).filter(models.Cart.id == cart_id).scalar()
+    return replicated is not None and replicated >= version
+
+def _replica_session(request: Request) -> Optional[Session]:
+    # Sesión de la réplica, o None si no hay réplica o aún no tiene lo que el cliente escribió
+    if database.ReadSessionLocal is None:
+        return None
+    db = database.ReadSessionLocal()
+    version = required_version(request)
+    cart_id = request.path_params.get("cart_id", "")
+    if version is None or not cart_id.isdigit():
+        return db
+    caught_up = False
+    try:
+        caught_up = _replica_caught_up(db, int(cart_id), version)
+    finally:
+        if not caught_up:
+            db.close()
+    return db if caught_up else None
+
+# Dependencia de las rutas de solo lectura: la réplica si existe, salvo para
+# leer lo recién escrito; si no, la sesión del primario de get_db (que no abre
+# conexión si no se usa)
+def get_read_db(request: Request, db: Session = Depends(get_db)):
+    replica = _replica_session(request)
+    if replica is None:
+        yield db
+        return
+    try:
+        yield replica
+    finally:
+        replica.close()
@@ -0,0 +1,681 @@
+# app/repository.py
+"""
+Almacenamiento de los carritos para las rutas síncronas.
+
+Las rutas de app/routers/cart.py acceden a los carritos a través de un
+CartRepository (dependencia get_cart_repository). CART_STORE elige la
+implementación:
+
+- sql (por defecto): SqlCartRepository, las funciones de crud.py. Cada
+  lectura y cada mutación va a las tablas carts y cart_items.
+- memory: MemoryCartRepository, una capa en proceso con los carritos
+  activos. Las lecturas y las ediciones no tocan carts ni cart_items: el
+  resumen se sirve sin ninguna consulta y el contenido con una única lectura
+  por clave primaria de 'items' (el stock no se cachea). La reserva de stock
+  sigue siendo un UPDATE condicional sobre items.stock en la transacción de
+  la petición; solo una línea nueva se inserta en esa misma transacción, para
+  tener su id. Las cantidades y los totales se vuelcan a SQL en segundo plano
+  (write-behind) cada CART_STORE_FLUSH_INTERVAL segundos, al expulsar un
+  carrito (LRU, como mucho CART_STORE_MAX_CARTS en memoria, o inactivo más de
+  CART_STORE_IDLE_SECONDS) y al parar el worker.
+
+La capa en memoria es del proceso: solo es coherente si cada carrito lo sirve
+siempre el mismo worker (un único worker o un balanceador con afinidad por
+cart_id) y no admite el modo asíncrono. Un worker que muere pierde lo no
+volcado (como mucho un intervalo de cambios de cantidad, con su stock ya
+reservado), y CART_TTL_SECONDS del sweeper debe ser mayor que
+CART_STORE_IDLE_SECONDS para que no reclame un carrito que sigue en memoria.
+"""
+
+import logging
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Mapping, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import case, delete, insert, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import crud, inventory, models, schemas
+from .cache import catalog_cache
+from .money import from_cents, to_cents
+from .reservations import ReservationBatcher, batcher_from_env
+from .utils.exceptions import ItemNotFoundException
+
+logger = logging.getLogger(__name__)
+
+class CartRepository(ABC):
+    """Operaciones del carrito que usan las rutas; 'db' es la sesión de la petición."""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def flush(self, cart_id: int):
+        # Solo la capa en memoria tiene cambios pendientes de escribir en SQL
+        pass
+
+    @abstractmethod
+    def cart_exists(self, db: Session, cart_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def create_cart(self, db: Session) -> models.Cart:
+        ...
+
+    @abstractmethod
+    def add_item_to_cart(self, db: Session, cart_id: int, item_id: int, quantity: int) -> schemas.CartItem:
+        ...
+
+    @abstractmethod
+    def update_cart_item(self, db: Session, cart_id: int, item_id: int, quantity: int) -> Optional[schemas.CartItem]:
+        ...
+
+    @abstractmethod
+    def remove_cart_item(self, db: Session, cart_id: int, item_id: int) -> dict:
+        ...
+
+    @abstractmethod
+    def add_items_to_cart(self, db: Session, cart_id: int, lines: List[schemas.CartItemCreate]) -> List[schemas.CartItem]:
+        ...
+
+    @abstractmethod
+    def update_cart_items(self, db: Session, cart_id: int, lines: List[schemas.CartItemBase]) -> List[schemas.CartItem]:
+        ...
+
+    @abstractmethod
+    def remove_cart_items(self, db: Session, cart_id: int, item_ids: List[int]) -> dict:
+        ...
+
+    @abstractmethod
+    def get_cart_version(self, db: Session, cart_id: int) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def get_cart_contents(self, db: Session, cart_id: int) -> crud.CartRead:
+        ...
+
+    @abstractmethod
+    def get_cart_summary(self, db: Session, cart_id: int) -> schemas.CartSummary:
+        ...
+
+    @abstractmethod
+    def get_cart_invoice(self, db: Session, cart_id: int) -> crud.CartRead:
+        ...
+
+class SqlCartRepository(CartRepository):
+    """
+    Carritos en carts/cart_items: cada operación es la función equivalente de
+    crud.py. Con 'reservations' (ver app/reservations.py), añadir un ítem pasa
+    por la cola que agrupa las peticiones del mismo ítem.
+    """
+
+    def __init__(self, reservations: Optional[ReservationBatcher] = None):
+        self.reservations = reservations
+
+    def cart_exists(self, db: Session, cart_id: int) -> bool:
+        return crud.get_cart(db, cart_id) is not None
+
+    def create_cart(self, db: Session) -> models.Cart:
+        return crud.create_cart(db)
+
+    def add_item_to_cart(self, db: Session, cart_id: int, item_id: int, quantity: int) -> schemas.CartItem:
+        if self.reservations is not None:
+            return self.reservations.add_item_to_cart(db, cart_id, item_id, quantity)
+        return crud.add_item_to_cart(db, cart_id, item_id, quantity)
+
+    def update_cart_item(self, db: Session, cart_id: int, item_id: int, quantity: int) -> Optional[schemas.CartItem]:
+        return crud.update_cart_item(db, cart_id, item_id, quantity)
+
+    def remove_cart_item(self, db: Session, cart_id: int, item_id: int) -> dict:
+        return crud.remove_cart_item(db, cart_id, item_id)
+
+    def add_items_to_cart(self, db: Session, cart_id: int, lines: List[schemas.CartItemCreate]) -> List[schemas.CartItem]:
+        return crud.add_items_to_cart(db, cart_id, lines)
+
+    def update_cart_items(self, db: Session, cart_id: int, lines: List[schemas.CartItemBase]) -> List[schemas.CartItem]:
+        return crud.update_cart_items(db, cart_id, lines)
+
+    def remove_cart_items(self, db: Session, cart_id: int, item_ids: List[int]) -> dict:
+        return crud.remove_cart_items(db, cart_id, item_ids)
+
+    def get_cart_version(self, db: Session, cart_id: int) -> Optional[int]:
+        return crud.get_cart_version(db, cart_id)
+
+    def get_cart_contents(self, db: Session, cart_id: int) -> crud.CartRead:
+        return crud.get_cart_contents(db, cart_id)
+
+    def get_cart_summary(self, db: Session, cart_id: int) -> schemas.CartSummary:
+        return crud.get_cart_summary(db, cart_id)
+
+    def get_cart_invoice(self, db: Session, cart_id: int) -> crud.CartRead:
+        return crud.get_cart_invoice(db, cart_id)
+
+class HotLine:
+    __slots__ = ("id", "quantity", "stored")
+
+    def __init__(self, line_id: int, quantity: int, stored: int):
+        self.id = line_id
+        self.quantity = quantity  # 0: línea eliminada, se borra de cart_items al volcar
+        self.stored = stored      # cantidad en cart_items
+
+class HotCart:
+    """Estado en memoria de un carrito; se modifica siempre con 'lock' tomado."""
+
+    def __init__(self, cart_id: int, lines: Dict[int, HotLine], total_quantity: int,
+                 total_price_cents: int, version: int, stale_rows: List[int]):
+        self.id = cart_id
+        self.lines = lines  # item_id -> HotLine
+        self.total_quantity = total_quantity
+        self.total_price_cents = total_price_cents
+        self.version = version
+        self.stored_version = version
+        # Filas repetidas de un mismo ítem, fusionadas en una línea al cargar
+        self.stale_rows = stale_rows
+        self.lock = threading.Lock()
+        self.evicted = False
+        self.touched = time.monotonic()
+
+    @property
+    def dirty(self) -> bool:
+        return self.version != self.stored_version or bool(self.stale_rows)
+
+    def live_line(self, item_id: int) -> Optional[HotLine]:
+        line = self.lines.get(item_id)
+        return line if line is not None and line.quantity > 0 else None
+
+    def apply(self, deltas: Dict[int, int], prices: Dict[int, int]):
+        # Misma contabilidad que crud.apply_cart_totals, con 'prices' en céntimos
+        deltas = {item_id: delta for item_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        self.total_quantity += sum(deltas.values())
+        self.total_price_cents += sum(delta * prices[item_id] for item_id, delta in deltas.items())
+        self.version += 1
+
+class MemoryCartRepository(CartRepository):
+    """
+    Carritos activos en memoria con volcado diferido a SQL (ver el docstring
+    del módulo). Cada operación toma el lock de su carrito durante toda la
+    operación, incluida la reserva de stock, así que las mutaciones de un
+    mismo carrito se serializan sin compare-and-set ni 409.
+    """
+
+    def __init__(self, engine: Engine, max_carts: int = 10_000, flush_interval: float = 1.0,
+                 idle_seconds: float = 300.0):
+        self.engine = engine
+        self.max_carts = max_carts
+        self.flush_interval = flush_interval
+        self.idle_seconds = idle_seconds
+        self._carts: "OrderedDict[int, HotCart]" = OrderedDict()
+        # Expulsados cuyo volcado no ha terminado: hasta entonces SQL no está al día
+        self._evicting: Dict[int, HotCart] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.flushes = 0
+        self.flush_errors = 0
+
+    # Carga, expulsión y volcado
+
+    def _load(self, db: Session, cart_id: int) -> Optional[HotCart]:
+        rows = db.query(
+            models.Cart.total_quantity, models.Cart.total_price_cents, models.Cart.version,
+            models.CartItem.id, models.CartItem.item_id, models.CartItem.quantity
+        ).outerjoin(
+            models.CartItem, models.CartItem.cart_id == models.Cart.id
+        ).filter(models.Cart.id == cart_id).order_by(models.CartItem.id).all()
+        # Terminar la transacción de lectura: un volcado en otra conexión no debe esperarla
+        db.commit()
+        if not rows:
+            return None
+        lines: Dict[int, HotLine] = {}
+        stale_rows: List[int] = []
+        for *_, line_id, item_id, quantity in rows:
+            if line_id is None:
+                continue
+            line = lines.get(item_id)
+            if line is None:
+                lines[item_id] = HotLine(line_id, quantity, quantity)
+            else:
+                line.quantity += quantity
+                stale_rows.append(line_id)
+        total_quantity, total_price_cents, version = rows[0][:3]
+        return HotCart(cart_id, lines, total_quantity, total_price_cents, version, stale_rows)
+
+    def _lookup(self, db: Session, cart_id: int) -> Optional[HotCart]:
+        while True:
+            with self._lock:
+                cart = self._carts.get(cart_id)
+                if cart is not None:
+                    self._carts.move_to_end(cart_id)
+                    self.hits += 1
+                    return cart
+                pending = self._evicting.get(cart_id)
+                evictions = self.evictions
+            if pending is not None:
+                # Esperar a que termine su volcado antes de leerlo de SQL
+                with pending.lock:
+                    pass
+                continue
+            loaded = self._load(db, cart_id)
+            if loaded is None:
+                return None
+            with self._lock:
+                # Si entretanto se expulsó algún carrito, la lectura pudo ser anterior a su volcado
+                if cart_id in self._evicting or self.evictions != evictions:
+                    continue
+                cart = self._carts.setdefault(cart_id, loaded)
+                self.loads += 1
+                victims = self._pop_victims()
+            self._flush_victims(victims)
+            return cart
+
+    def _pop_victims(self) -> List[HotCart]:
+        victims = []
+        while len(self._carts) > self.max_carts:
+            _, victim = self._carts.popitem(last=False)
+            self._evicting[victim.id] = victim
+            victims.append(victim)
+        return victims
+
+    def _flush_victims(self, victims: List[HotCart]):
+        # Sin ningún otro lock de carrito tomado: no puede formarse un ciclo de esperas
+        for victim in victims:
+            with victim.lock:
+                try:
+                    if victim.dirty:
+                        self._flush(victim)
+                    victim.evicted = True
+                except Exception as e:
+                    # Conservarlo en memoria: descartarlo perdería los cambios no volcados
+                    logger.error(f"Error al volcar el carrito {victim.id} expulsado de memoria: {e}")
+                with self._lock:
+                    del self._evicting[victim.id]
+                    if victim.evicted:
+                        self.evictions += 1
+                    else:
+                        self._carts.setdefault(victim.id, victim)
+
+    def _flush(self, cart: HotCart):
+        """Escribe el carrito en carts/cart_items en una transacción (con cart.lock tomado)."""
+        changed = {line.id: line.quantity for line in cart.lines.values() if line.quantity and line.quantity != line.stored}
+        removed = [line.id for line in cart.lines.values() if not line.quantity] + cart.stale_rows
+        try:
+            with self.engine.begin() as conn:
+                if removed:
+                    conn.execute(delete(models.CartItem.__table__).where(models.CartItem.id.in_(removed)))
+                if changed:
+                    conn.execute(
+                        update(models.CartItem.__table__)
+                        .where(models.CartItem.id.in_(changed))
+                        .values(quantity=case(changed, value=models.CartItem.id))
+                    )
+                found = conn.execute(
+                    update(models.Cart.__table__)
+                    .where(models.Cart.id == cart.id)
+                    .values(total_quantity=cart.total_quantity, total_price_cents=cart.total_price_cents, version=cart.version)
+                ).rowcount
+        except Exception:
+            self.flush_errors += 1
+            raise
+        self.flushes += 1
+        cart.lines = {item_id: line for item_id, line in cart.lines.items() if line.quantity}
+        for line in cart.lines.values():
+            line.stored = line.quantity
+        cart.stale_rows = []
+        cart.stored_version = cart.version
+        if not found:
+            # Borrado en SQL mientras estaba en memoria (p. ej. por el sweeper)
+            logger.warning(f"El carrito {cart.id} ya no existe en la base de datos; se descarta de memoria.")
+            cart.evicted = True
+            with self._lock:
+                if self._carts.get(cart.id) is cart:
+                    del self._carts[cart.id]
+
+    def flush(self, cart_id: int):
+        """Vuelca a SQL un carrito concreto si está en memoria con cambios pendientes."""
+        with self._lock:
+            cart = self._carts.get(cart_id)
+        if cart is not None:
+            with cart.lock:
+                if cart.dirty and not cart.evicted:
+                    self._flush(cart)
+
+    def flush_all(self):
+        """Vuelca los carritos con cambios y expulsa los inactivos más de 'idle_seconds'."""
+        with self._lock:
+            carts = list(self._carts.values())
+            idle_before = time.monotonic() - self.idle_seconds
+            idle = [cart for cart in carts if cart.touched < idle_before]
+            for cart in idle:
+                del self._carts[cart.id]
+                self._evicting[cart.id] = cart
+        self._flush_victims(idle)
+        for cart in carts:
+            if cart in idle:
+                continue
+            try:
+                self.flush(cart.id)
+            except Exception as e:
+                logger.error(f"Error al volcar el carrito {cart.id}: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush_all()
+            except Exception as e:
+                logger.error(f"Error inesperado al volcar los carritos en memoria: {e}")
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cart-store-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            carts = list(self._carts.values())
+            snapshot = {
+                "carts": len(carts),
+                "max_carts": self.max_carts,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "flushes": self.flushes,
+                "flush_errors": self.flush_errors,
+            }
+        snapshot["dirty"] = sum(1 for cart in carts if cart.dirty)
+        return snapshot
+
+    @contextmanager
+    def _checkout(self, db: Session, cart_id: int) -> Iterator[HotCart]:
+        # Carrito en memoria (cargado si hace falta) con su lock tomado; 404 si no existe
+        while True:
+            cart = self._lookup(db, cart_id)
+            if cart is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cart not found.")
+            cart.lock.acquire()
+            if not cart.evicted:
+                break
+            cart.lock.release()
+        try:
+            cart.touched = time.monotonic()
+            yield cart
+            # Cerrar también la transacción de las lecturas hechas con el lock tomado: una sesión
+            # que luego espera el lock de un carrito no debe retener la base de datos
+            db.commit()
+        finally:
+            cart.lock.release()
+
+    # Respuestas
+
+    def _line_payloads(self, db: Session, cart_id: int, lines: List[tuple]) -> List[dict]:
+        # Catálogo y stock actual de todas las líneas con una lectura por clave primaria de 'items'
+        if not lines:
+            return []
+        rows = {
+            row.id: row for row in db.query(
+                models.Item.id, models.Item.name, models.Item.description, models.Item.thumbnail,
+                models.Item.price, inventory.available_stock(), models.Item.type
+            ).filter(models.Item.id.in_([item_id for item_id, _, _ in lines])).all()
+        }
+        # Ya que se han leído, las mutaciones siguientes las encuentran en la caché del catálogo
+        for row in rows.values():
+            catalog_cache.set(row.id, crud.CatalogEntry(
+                row.id, row.name, row.description, row.thumbnail, row.price, row.type.value
+            ))
+        return [
+            crud.cart_line_payload(cart_id, (line_id, item_id, quantity, *rows[item_id][1:]))
+            for item_id, line_id, quantity in lines if item_id in rows
+        ]
+
+    def _prices(self, db: Session, item_ids) -> Dict[int, int]:
+        # Precios en céntimos, para HotCart.apply
+        prices = {}
+        for item_id in item_ids:
+            entry = crud.get_catalog_entry(db, item_id)
+            if entry is None:
+                db.rollback()
+                raise ItemNotFoundException(item_id)
+            prices[item_id] = to_cents(entry.price)
+        return prices
+
+    # Lecturas
+
+    def cart_exists(self, db: Session, cart_id: int) -> bool:
+        return self._lookup(db, cart_id) is not None
+
+    def get_cart_version(self, db: Session, cart_id: int) -> Optional[int]:
+        # Sin el lock: la lectura de un entero no puede quedar a medias
+        cart = self._lookup(db, cart_id)
+        return cart.version if cart is not None else None
+
+    def get_cart_summary(self, db: Session, cart_id: int) -> schemas.CartSummary:
+        with self._checkout(db, cart_id) as cart:
+            return schemas.CartSummary(
+                id=cart.id,
+                total_quantity=cart.total_quantity,
+                total_price=from_cents(cart.total_price_cents),
+                version=cart.version
+            )
+
+    def _snapshot(self, db: Session, cart_id: int):
+        with self._checkout(db, cart_id) as cart:
+            lines = sorted(
+                ((item_id, line.id, line.quantity) for item_id, line in cart.lines.items() if line.quantity),
+                key=lambda line: line[1]
+            )
+            return lines, cart.total_quantity, cart.total_price_cents, cart.version
+
+    def get_cart_contents(self, db: Session, cart_id: int) -> crud.CartRead:
+        lines, total_quantity, total_price_cents, version = self._snapshot(db, cart_id)
+        return crud.CartRead(version, {
+            "id": cart_id,
+            "items": self._line_payloads(db, cart_id, lines),
+            "total_quantity": total_quantity,
+            "total_price": from_cents(total_price_cents)
+        })
+
+    def get_cart_invoice(self, db: Session, cart_id: int) -> crud.CartRead:
+        lines, total_quantity, total_price_cents, version = self._snapshot(db, cart_id)
+        return crud.CartRead(version, {
+            "items": self._line_payloads(db, cart_id, lines),
+            "total_quantity": total_quantity,
+            "total_price": from_cents(total_price_cents)
+        })
+
+    # Mutaciones: solo items.stock (y el INSERT de las líneas nuevas) en la transacción de la petición
+
+    def create_cart(self, db: Session) -> models.Cart:
+        db_cart = crud.create_cart(db)
+        with self._lock:
+            self._carts[db_cart.id] = HotCart(db_cart.id, {}, 0, 0, db_cart.version, [])
+            victims = self._pop_victims()
+        self._flush_victims(victims)
+        return db_cart
+
+    def add_item_to_cart(self, db: Session, cart_id: int, item_id: int, quantity: int) -> schemas.CartItem:
+        with self._checkout(db, cart_id) as cart:
+            remaining = crud.reserve_stock(db, item_id, quantity)
+            if remaining is None:
+                crud.raise_reservation_error(db, item_id)
+            prices = self._prices(db, [item_id])
+            line = cart.lines.get(item_id)
+            if line is None:
+                line_id = db.execute(
+                    insert(models.CartItem)
+                    .values(cart_id=cart_id, item_id=item_id, quantity=quantity)
+                    .returning(models.CartItem.id)
+                ).scalar()
+                db.commit()
+                line = cart.lines[item_id] = HotLine(line_id, quantity, quantity)
+            else:
+                db.commit()
+                line.quantity += quantity
+            cart.apply({item_id: quantity}, prices)
+            return crud.cart_line_schema(db, line.id, cart_id, item_id, line.quantity, remaining)
+
+    def update_cart_item(self, db: Session, cart_id: int, item_id: int, quantity: int) -> Optional[schemas.CartItem]:
+        if quantity < 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Quantity cannot be negative")
+        with self._checkout(db, cart_id) as cart:
+            line = cart.live_line(item_id)
+            if line is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="CartItem not found")
+            delta = quantity - line.quantity
+            remaining = None
+            if delta > 0:
+                remaining = crud.reserve_stock(db, item_id, delta)
+                if remaining is None:
+                    crud.raise_reservation_error(db, item_id)
+            if delta < 0:
+                remaining = crud.release_stock(db, item_id, -delta)
+            prices = self._prices(db, [item_id]) if delta else {}
+            db.commit()
+            line.quantity = quantity
+            cart.apply({item_id: delta}, prices)
+
+            if quantity == 0:
+                return None  # Devolver None si el ítem fue eliminado
+            if remaining is None:
+                remaining = db.query(inventory.available_stock()).filter(models.Item.id == item_id).scalar()
+            return crud.cart_line_schema(db, line.id, cart_id, item_id, quantity, remaining)
+
+    def remove_cart_item(self, db: Session, cart_id: int, item_id: int) -> dict:
+        with self._checkout(db, cart_id) as cart:
+            line = cart.live_line(item_id)
+            if line is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="CartItem not found")
+            crud.release_stock(db, item_id, line.quantity)
+            prices = self._prices(db, [item_id])
+            db.commit()
+            cart.apply({item_id: -line.quantity}, prices)
+            line.quantity = 0
+        return {"detail": "Item removed from cart successfully."}
+
+    def add_items_to_cart(self, db: Session, cart_id: int, lines: List[schemas.CartItemCreate]) -> List[schemas.CartItem]:
+        quantities: Dict[int, int] = {}
+        for line in lines:
+            quantities[line.item_id] = quantities.get(line.item_id, 0) + line.quantity
+        if not quantities:
+            return []
+        with self._checkout(db, cart_id) as cart:
+            if not crud.reserve_stock_many(db, quantities):
+                crud.raise_batch_reservation_error(db, quantities)
+            new_lines = [
+                {"cart_id": cart_id, "item_id": item_id, "quantity": quantity}
+                for item_id, quantity in quantities.items() if item_id not in cart.lines
+            ]
+            line_ids = {}
+            if new_lines:
+                line_ids = dict(db.execute(
+                    insert(models.CartItem).returning(models.CartItem.item_id, models.CartItem.id, sort_by_parameter_order=True),
+                    new_lines
+                ).all())
+            db.commit()
+            for item_id, quantity in quantities.items():
+                if item_id in line_ids:
+                    cart.lines[item_id] = HotLine(line_ids[item_id], quantity, quantity)
+                else:
+                    cart.lines[item_id].quantity += quantity
+            payloads = self._line_payloads(
+                db, cart_id, [(item_id, cart.lines[item_id].id, cart.lines[item_id].quantity) for item_id in quantities]
+            )
+            cart.apply(quantities, {payload["item_id"]: to_cents(payload["item"]["price"]) for payload in payloads})
+        return [schemas.CartItem(**payload) for payload in payloads]
+
+    def update_cart_items(self, db: Session, cart_id: int, lines: List[schemas.CartItemBase]) -> List[schemas.CartItem]:
+        quantities = {line.item_id: line.quantity for line in lines}
+        if not quantities:
+            return []
+        with self._checkout(db, cart_id) as cart:
+            if any(cart.live_line(item_id) is None for item_id in quantities):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="CartItem not found")
+            deltas = {item_id: quantity - cart.lines[item_id].quantity for item_id, quantity in quantities.items()}
+            to_reserve = {item_id: delta for item_id, delta in deltas.items() if delta > 0}
+            to_release = {item_id: -delta for item_id, delta in deltas.items() if delta < 0}
+            if to_reserve and not crud.reserve_stock_many(db, to_reserve):
+                crud.raise_batch_reservation_error(db, to_reserve)
+            if to_release:
+                crud.release_stock_many(db, to_release)
+            db.commit()
+            for item_id, quantity in quantities.items():
+                cart.lines[item_id].quantity = quantity
+            # La misma lectura de 'items' da los precios de los totales y el stock de la respuesta
+            payloads = self._line_payloads(
+                db, cart_id, [(item_id, cart.lines[item_id].id, quantity) for item_id, quantity in quantities.items()]
+            )
+            cart.apply(deltas, {payload["item_id"]: to_cents(payload["item"]["price"]) for payload in payloads})
+        return [schemas.CartItem(**payload) for payload in payloads if payload["quantity"] > 0]
+
+    def remove_cart_items(self, db: Session, cart_id: int, item_ids: List[int]) -> dict:
+        item_ids = list(dict.fromkeys(item_ids))
+        if not item_ids:
+            return {"detail": "Items removed from cart successfully."}
+        with self._checkout(db, cart_id) as cart:
+            if any(cart.live_line(item_id) is None for item_id in item_ids):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="CartItem not found")
+            released = {item_id: cart.lines[item_id].quantity for item_id in item_ids}
+            crud.release_stock_many(db, released)
+            prices = self._prices(db, item_ids)
+            db.commit()
+            cart.apply({item_id: -quantity for item_id, quantity in released.items()}, prices)
+            for item_id in item_ids:
+                cart.lines[item_id].quantity = 0
+        return {"detail": "Items removed from cart successfully."}
+
+CART_STORES = ("sql", "memory")
+
+def repository_from_env(engine: Engine, async_mode: bool = False,
+                        env: Mapping[str, str] = os.environ) -> CartRepository:
+    """
+    CartRepository configurado con CART_STORE (sql o memory) y, para la capa en
+    memoria, CART_STORE_MAX_CARTS, CART_STORE_FLUSH_INTERVAL y CART_STORE_IDLE_SECONDS.
+    Con RESERVATION_QUEUE=on, la de SQL agrupa las reservas (app/reservations.py).
+    """
+    store = env.get("CART_STORE", "sql").lower()
+    if store not in CART_STORES:
+        raise ValueError(f"CART_STORE no soportado: {store} (opciones: {', '.join(CART_STORES)})")
+    reservations = batcher_from_env(env)
+    if reservations is not None and (async_mode or store != "sql"):
+        raise ValueError("RESERVATION_QUEUE solo está disponible con CART_STORE=sql y un driver síncrono en DATABASE_URL")
+    if store == "sql":
+        return SqlCartRepository(reservations)
+    if async_mode:
+        raise ValueError("CART_STORE=memory solo está disponible con un driver síncrono en DATABASE_URL")
+    if env.get("DATABASE_READ_URL"):
+        # Un carrito cargado desde una réplica atrasada se volcaría encima de lo escrito
+        raise ValueError("CART_STORE=memory no admite DATABASE_READ_URL: los carritos deben cargarse del primario")
+    return MemoryCartRepository(
+        engine,
+        max_carts=int(env.get("CART_STORE_MAX_CARTS", "10000")),
+        flush_interval=float(env.get("CART_STORE_FLUSH_INTERVAL", "1")),
+        idle_seconds=float(env.get("CART_STORE_IDLE_SECONDS", "300")),
+    )
+
+def _default_repository() -> CartRepository:
+    from .database import ASYNC_MODE, engine
+    return repository_from_env(engine, async_mode=ASYNC_MODE)
+
+cart_repository = _default_repository()
+
+# Dependencia de las rutas del carrito (sustituible con app.dependency_overrides)
+def get_cart_repository() -> CartRepository:
+    return cart_repository
@@ -0,0 +1,266 @@
+# app/reservations.py
+"""
+Cola de admisión para las reservas de un mismo ítem (group commit).
+
+Durante una venta flash miles de POST /cart/{id}/items/ piden el mismo ítem y
+cada uno ejecuta su propia transacción, con su propio commit, sobre la misma
+fila de 'items'. Con RESERVATION_QUEUE=on las rutas síncronas pasan por un
+ReservationBatcher: las peticiones de un ítem se agrupan en un lote durante
+'window' segundos o hasta reunir 'max_batch', y el lote se aplica en una
+única transacción con crud.add_item_to_carts, que concede las peticiones en
+orden de llegada mientras quede stock (lo mismo que concedería ejecutarlas
+una tras otra). Cada petición recibe su propia respuesta o su propio error.
+
+No hay un hilo aparte: la primera petición de un lote lo aplica con su
+sesión y las demás esperan su resultado sin conexión. Mientras un lote de un
+ítem se aplica, el siguiente sigue aceptando peticiones, así que los lotes
+crecen con la contención. Si el lote falla (p. ej. el stock cambió mientras
+se calculaba lo concedido), sus peticiones se aplican una a una.
+
+Cada petición en espera ocupa un hilo del threadpool de anyio (40 por
+defecto), que comparten todas las rutas síncronas. Con 'max_pending'
+peticiones esperando (32 por defecto, por debajo de ese límite) las nuevas
+reciben 429 con Retry-After al momento, y quedan hilos para el resto de
+rutas. Ninguna espera sin límite: las transacciones de un lote llevan
+statement_timeout en PostgreSQL (en SQLite limita el timeout de bloqueo del
+driver), el lote espera al anterior del mismo ítem como mucho ese tiempo, y
+una petición cuyo lote no ha empezado tras 'window' más ese tiempo deja la
+cola y recibe 503. /metrics publica el tamaño de los lotes, la espera en la
+cola y las peticiones rechazadas o caducadas. Solo en las rutas síncronas y
+con CART_STORE=sql.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Dict, List, Mapping, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from . import crud, replica, schemas
+from .telemetry import DEFAULT_BUCKETS, Histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+# Por debajo de los 40 hilos del threadpool por defecto de anyio (ver el docstring)
+DEFAULT_MAX_PENDING = 32
+
+class PendingReservation:
+    __slots__ = ("cart_id", "quantity", "enqueued", "future", "writes")
+
+    def __init__(self, cart_id: int, quantity: int):
+        self.cart_id = cart_id
+        self.quantity = quantity
+        self.enqueued = time.perf_counter()
+        self.future: Future = Future()
+        # Versiones escritas de la petición que espera (ver app/replica.py)
+        self.writes = replica.current_writes.get()
+
+class ReservationBatch:
+    def __init__(self, item_id: int):
+        self.item_id = item_id
+        self.requests: List[PendingReservation] = []
+        self.full = threading.Event()
+
+class ReservationMetrics:
+    """Lotes, espera en la cola y peticiones rechazadas, para /metrics."""
+
+    def __init__(self):
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait = Histogram(DEFAULT_BUCKETS)
+        self.shed = 0
+        self.fallbacks = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record_batch(self, batch: ReservationBatch, started: float):
+        self.batch_sizes.observe(len(batch.requests))
+        for request in batch.requests:
+            self.queue_wait.observe(started - request.enqueued)
+
+    def record_shed(self):
+        with self._lock:
+            self.shed += 1
+
+    def record_fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+
+    def record_timeouts(self, count: int = 1):
+        with self._lock:
+            self.timeouts += count
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = {"shed": self.shed, "fallbacks": self.fallbacks, "timeouts": self.timeouts}
+        return {**counters, "batch_sizes": self.batch_sizes.snapshot(), "queue_wait": self.queue_wait.snapshot()}
+
+class ReservationBatcher:
+    """Agrupa por ítem las peticiones de añadir al carrito (ver el docstring del módulo)."""
+
+    def __init__(self, window: float = 0.002, max_batch: int = 64, max_pending: int = DEFAULT_MAX_PENDING,
+                 statement_timeout: float = 5.0, metrics: Optional[ReservationMetrics] = None):
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.statement_timeout = statement_timeout
+        self.metrics = metrics or ReservationMetrics()
+        self.pending = 0
+        self._open: Dict[int, ReservationBatch] = {}
+        self._lock = threading.Lock()
+        # Un lote en curso por ítem (por franja de ítems): el siguiente se llena mientras tanto
+        self._item_locks = [threading.Lock() for _ in range(64)]
+
+    def add_item_to_cart(self, db: Session, cart_id: int, item_id: int, quantity: int) -> schemas.CartItem:
+        request = PendingReservation(cart_id, quantity)
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.metrics.record_shed()
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many pending reservations, retry later",
+                    headers={"Retry-After": "1"}
+                )
+            self.pending += 1
+            batch = self._open.get(item_id)
+            leader = batch is None
+            if leader:
+                batch = self._open[item_id] = ReservationBatch(item_id)
+            batch.requests.append(request)
+            if len(batch.requests) >= self.max_batch:
+                self._close(batch)
+
+        # La conexión de la petición vuelve al pool mientras espera; el líder
+        # empieza además el lote en una transacción nueva, con su límite
+        db.rollback()
+        if leader:
+            self._lead(db, batch)
+        try:
+            return request.future.result(timeout=self.window + self.statement_timeout)
+        except FutureTimeout:
+            if not request.future.cancel():
+                # El lote ya se está aplicando: su resultado llega en lo que tarden sus sentencias
+                return request.future.result()
+        # Cancelada antes de empezar: el lote la descarta y no la cuenta
+        with self._lock:
+            self.pending -= 1
+        self.metrics.record_timeouts()
+        raise self._timeout_error()
+
+    def _timeout_error(self) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Reservation queue timed out, retry later",
+            headers={"Retry-After": "1"}
+        )
+
+    def _close(self, batch: ReservationBatch):
+        # Con self._lock tomado: las siguientes peticiones del ítem abren otro lote
+        if self._open.get(batch.item_id) is batch:
+            del self._open[batch.item_id]
+        batch.full.set()
+
+    def _lead(self, db: Session, batch: ReservationBatch):
+        batch.full.wait(self.window)
+        item_lock = self._item_locks[batch.item_id % len(self._item_locks)]
+        # El lote anterior del ítem tarda como mucho lo que sus sentencias
+        locked = item_lock.acquire(timeout=self.statement_timeout)
+        with self._lock:
+            self._close(batch)
+        # Las peticiones que dejaron de esperar (Future cancelado) salen del lote
+        batch.requests = [r for r in batch.requests if r.future.set_running_or_notify_cancel()]
+        if not locked:
+            self.metrics.record_timeouts(len(batch.requests))
+            self._settle(batch.requests, [self._timeout_error() for _ in batch.requests], {})
+            return
+        # Las versiones de carrito que escribe el lote se reparten después entre sus peticiones
+        written = replica.CartWrites()
+        token = replica.current_writes.set(written)
+        try:
+            self.metrics.record_batch(batch, time.perf_counter())
+            with self._statement_timeout(db):
+                outcomes = self._apply(db, batch)
+        except Exception as e:
+            logger.error(f"Error inesperado al aplicar un lote de reservas del ítem {batch.item_id}: {e}")
+            outcomes = [HTTPException(status_code=500, detail="Internal Server Error") for _ in batch.requests]
+        finally:
+            item_lock.release()
+            replica.current_writes.reset(token)
+        self._settle(batch.requests, outcomes, written.versions)
+
+    @contextmanager
+    def _statement_timeout(self, db: Session):
+        # Como el lock_timeout del sweeper: local a cada transacción del lote,
+        # también a las de la vuelta atrás petición a petición
+        if db.get_bind().dialect.name != "postgresql":
+            yield
+            return
+        value = f"{int(self.statement_timeout * 1000)}ms"
+
+        def set_timeout(session, transaction, connection):
+            connection.execute(text("SELECT set_config('statement_timeout', :value, true)"), {"value": value})
+
+        event.listen(db, "after_begin", set_timeout)
+        try:
+            yield
+        finally:
+            event.remove(db, "after_begin", set_timeout)
+
+    def _settle(self, requests: List[PendingReservation], outcomes: List[object], versions: Dict[int, int]):
+        with self._lock:
+            self.pending -= len(requests)
+        for request, outcome in zip(requests, outcomes):
+            if request.writes is not None and request.cart_id in versions:
+                request.writes.record(request.cart_id, versions[request.cart_id])
+            if isinstance(outcome, Exception):
+                request.future.set_exception(outcome)
+            else:
+                request.future.set_result(outcome)
+
+    def _apply(self, db: Session, batch: ReservationBatch) -> List[object]:
+        # Resultado (schemas.CartItem) o excepción de cada petición del lote, en orden
+        requests = batch.requests
+        if len(requests) == 1:
+            return [self._apply_one(db, batch.item_id, requests[0])]
+        try:
+            results = crud.add_item_to_carts(db, batch.item_id, [(r.cart_id, r.quantity) for r in requests])
+        except HTTPException as e:
+            # Ítem inexistente: el mismo error para todo el lote
+            return [HTTPException(status_code=e.status_code, detail=e.detail) for _ in requests]
+        except Exception as e:
+            logger.warning(f"Lote de {len(requests)} reservas del ítem {batch.item_id} fallido: {e}")
+            results = None
+        if results is None:
+            # El stock cambió durante el lote o este falló: una transacción por petición
+            self.metrics.record_fallback()
+            return [self._apply_one(db, batch.item_id, request) for request in requests]
+        return results
+
+    def _apply_one(self, db: Session, item_id: int, request: PendingReservation) -> object:
+        try:
+            return crud.add_item_to_cart(db, request.cart_id, item_id, request.quantity)
+        except Exception as e:
+            db.rollback()
+            return e
+
+def batcher_from_env(env: Mapping[str, str] = os.environ) -> Optional[ReservationBatcher]:
+    """
+    ReservationBatcher configurado con RESERVATION_BATCH_WINDOW (segundos, por
+    defecto 0.002), RESERVATION_BATCH_MAX_SIZE (64),
+    RESERVATION_QUEUE_MAX_PENDING (32) y RESERVATION_STATEMENT_TIMEOUT
+    (segundos, 5). Sin RESERVATION_QUEUE=on devuelve None.
+    """
+    if env.get("RESERVATION_QUEUE", "off").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    return ReservationBatcher(
+        window=float(env.get("RESERVATION_BATCH_WINDOW", "0.002")),
+        max_batch=int(env.get("RESERVATION_BATCH_MAX_SIZE", "64")),
+        max_pending=int(env.get("RESERVATION_QUEUE_MAX_PENDING", str(DEFAULT_MAX_PENDING))),
+        statement_timeout=float(env.get("RESERVATION_STATEMENT_TIMEOUT", "5")),
+    )
@@ -0,0 +1,49 @@
+# app/responses.py
+
+import hashlib
+from typing import Any, Optional
+import orjson
+from fastapi.responses import Response
+
+class FastJSONResponse(Response):
+    """
+    Respuesta JSON serializada con orjson.
+
+    Cuando una ruta devuelve directamente esta respuesta, FastAPI no vuelve a
+    validar el contenido contra 'response_model': el contenido debe tener ya la
+    forma del esquema declarado, que se sigue usando para la documentación OpenAPI.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+# Las lecturas del carrito se pueden guardar, pero hay que revalidarlas siempre (If-None-Match)
+CART_CACHE_CONTROL = "private, no-cache"
+
+def cart_etag(version: int, content: bytes) -> str:
+    """
+    ETag de una lectura del carrito: su versión, que incrementa cada mutación,
+    y un resumen del cuerpo ya serializado. La versión sola no basta: las
+    líneas incluyen datos vivos del ítem (nombre, precio, stock disponible...)
+    que cambian sin que cambie el carrito.
+    """
+    return f'W/"{version}-{hashlib.blake2b(content, digest_size=8).hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match usa la comparación débil: se ignora el prefijo W/
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+def cart_read_response(version: int, body: dict, if_none_match: Optional[str] = None) -> Response:
+    # Con If-None-Match se carga y serializa igual la lectura: el 304 ahorra el envío del cuerpo
+    content = orjson.dumps(body)
+    headers = {"ETag": cart_etag(version, content), "Cache-Control": CART_CACHE_CONTROL}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content, media_type=FastJSONResponse.media_type, headers=headers)
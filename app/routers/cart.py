@@ -1,50 +1,50 @@
 # app/routers/cart.py
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
-from typing import List, Union
-from .. import models, schemas, crud
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional, Union
+from .. import crud, schemas
+from ..export import EXPORT_BATCH_SIZE, invoice_export_response
+from ..idempotency import IdempotentRoute
 from ..database import get_db
+from ..replica import get_read_db
+from ..query_budget import query_budget
+from ..repository import CartRepository, get_cart_repository
+from ..responses import cart_read_response
 import logging
 
+# Las mutaciones admiten la cabecera Idempotency-Key (ver app/idempotency.py)
 router = APIRouter(
     prefix="/cart",
     tags=["cart"],
+    route_class=IdempotentRoute,
 )
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
-@router.post("/items/", response_model=schemas.CartItem)
-def add_item(cart_item: schemas.CartItemCreate, db: Session = Depends(get_db)):
-    logger.info(f"Agregando ítem ID {cart_item.item_id} con cantidad {cart_item.quantity} al carrito.")
-    cart = db.query(models.Cart).first()
-    if not cart:
-        cart = crud.create_cart(db)
+def check_cart_exists(carts: CartRepository, db: Session, cart_id: int):
+    # Cada carrito se resuelve por su clave primaria (o desde memoria, ver app/repository.py)
+    if not carts.cart_exists(db, cart_id):
+        raise HTTPException(status_code=404, detail="Cart not found.")
+
+@router.post("/", response_model=schemas.Cart, status_code=201)
+@query_budget(2)
+def create_cart(db: Session = Depends(get_db),
+        carts: CartRepository = Depends(get_cart_repository)):
+    logger.info("Creando un nuevo carrito.")
+    cart = carts.create_cart(db)
+    return schemas.Cart(id=cart.id, items=[], total_quantity=0, total_price=0.0)
+
+@router.post("/{cart_id}/items/", response_model=schemas.CartItem)
+@query_budget(5)
+def add_item(cart_id: int, cart_item: schemas.CartItemCreate, db: Session = Depends(get_db),
+        carts: CartRepository = Depends(get_cart_repository)):
+    logger.info(f"Agregando ítem ID {cart_item.item_id} con cantidad {cart_item.quantity} al carrito {cart_id}.")
+    check_cart_exists(carts, db, cart_id)
     try:
-        # Agregar el ítem al carrito
-        db_cart_item = crud.add_item_to_cart(db, cart.id, cart_item.item_id, cart_item.quantity)
-        
-        # Asegurar que 'item' está cargado para acceder a 'price'
-        db_cart_item = db.query(models.CartItem).options(joinedload(models.CartItem.item)).filter(models.CartItem.id == db_cart_item.id).first()
-        
-        if not db_cart_item.item:
-            raise HTTPException(status_code=404, detail="Item not found")
-        
-        # Calcular subtotal
-        subtotal = db_cart_item.quantity * db_cart_item.item.price
-        
-        # Crear la respuesta incluyendo 'subtotal'
-        response = schemas.CartItem(
-            id=db_cart_item.id,
-            cart_id=db_cart_item.cart_id,
-            item_id=db_cart_item.item_id,
-            quantity=db_cart_item.quantity,
-            item=db_cart_item.item,
-            subtotal=subtotal
-        )
-        
-        return response
+        # Agregar el ítem al carrito; la respuesta ya incluye el ítem y el 'subtotal'
+        return carts.add_item_to_cart(db, cart_id, cart_item.item_id, cart_item.quantity)
     except HTTPException as e:
         logger.error(f"Error al agregar ítem al carrito: {e.detail}")
         raise e
@@ -52,35 +52,69 @@ def add_item(cart_item: schemas.CartItemCreate, db: Session = Depends(get_db)):
         logger.error(f"Error inesperado al agregar ítem al carrito: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@router.put("/items/{item_id}/", response_model=Union[schemas.CartItem, dict])
-def update_item(item_id: int, cart_item: schemas.CartItemBase, db: Session = Depends(get_db)):
-    logger.info(f"Actualizando ítem ID {item_id} con nueva cantidad {cart_item.quantity}.")
-    cart = db.query(models.Cart).first()
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found.")
-    
+# Las rutas por lotes se declaran antes que /items/{item_id}/ para que 'batch'
+# no se interprete como un item_id
+@router.post("/{cart_id}/items/batch/", response_model=List[schemas.CartItem])
+@query_budget(5)
+def add_items(cart_id: int, cart_items: List[schemas.CartItemCreate], db: Session = Depends(get_db),
+        carts: CartRepository = Depends(get_cart_repository)):
+    logger.info(f"Agregando {len(cart_items)} líneas al carrito {cart_id}.")
+    check_cart_exists(carts, db, cart_id)
+    try:
+        return carts.add_items_to_cart(db, cart_id, cart_items)
+    except HTTPException as e:
+        logger.error(f"Error al agregar ítems al carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al agregar ítems al carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.put("/{cart_id}/items/batch/", response_model=List[schemas.CartItem])
+@query_budget(7)
+def update_items(cart_id: int, cart_items: List[schemas.CartItemBase], db: Session = Depends(get_db),
+        carts: CartRepository = Depends(get_cart_repository)):
+    logger.info(f"Actualizando {len(cart_items)} líneas del carrito {cart_id}.")
+    check_cart_exists(carts, db, cart_id)
+    try:
+        return carts.update_cart_items(db, cart_id, cart_items)
+    except HTTPException as e:
+        logger.error(f"Error al actualizar ítems del carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al actualizar ítems del carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.delete("/{cart_id}/items/batch/")
+@query_budget(4)
+def delete_items(cart_id: int, item_ids: List[int] = Body(...), db: Session = Depends(get_db),
+        carts: CartRepository = Depends(get_cart_repository)):
+    logger.info(f"Eliminando {len(item_ids)} ítems del carrito {cart_id}.")
+    check_cart_exists(carts, db, cart_id)
+    try:
+        return carts.remove_cart_items(db, cart_id, item_ids)
+    except HTTPException as e:
+        logger.error(f"Error al eliminar ítems del carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al eliminar ítems del carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.put("/{cart_id}/items/{item_id}/", response_model=Union[schemas.CartItem, dict])
+@query_budget(6)
+def update_item(cart_id: int, item_id: int, cart_item: schemas.CartItemUpdate, db: Session = Depends(get_db),
+        carts: CartRepository = Depends(get_cart_repository)):
+    logger.info(f"Actualizando ítem ID {item_id} del carrito {cart_id} con nueva cantidad {cart_item.quantity}.")
+    check_cart_exists(carts, db, cart_id)
+
     try:
         # Actualizar el ítem en el carrito
-        db_cart_item = crud.update_cart_item(db, cart.id, item_id, cart_item.quantity)
-        
+        db_cart_item = carts.update_cart_item(db, cart_id, item_id, cart_item.quantity)
+
         # Si el ítem fue eliminado (devuelve None), devolver un mensaje
         if db_cart_item is None:
             return {"message": "Item removed from cart"}
-        
-        # Calcular subtotal si el ítem fue actualizado
-        subtotal = db_cart_item.quantity * db_cart_item.item.price
-        
-        # Crear la respuesta incluyendo 'subtotal'
-        response = schemas.CartItem(
-            id=db_cart_item.id,
-            cart_id=db_cart_item.cart_id,
-            item_id=db_cart_item.item_id,
-            quantity=db_cart_item.quantity,
-            item=db_cart_item.item,
-            subtotal=subtotal
-        )
-        
-        return response
+
+        return db_cart_item
     except HTTPException as e:
         logger.error(f"Error al actualizar ítem en el carrito: {e.detail}")
         raise e
@@ -88,14 +122,14 @@ def update_item(item_id: int, cart_item: schemas.CartItemBase, db: Session = Dep
         logger.error(f"Error inesperado al actualizar ítem en el carrito: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@router.delete("/items/{item_id}/")
-def delete_item(item_id: int, db: Session = Depends(get_db)):
-    logger.info(f"Eliminando ítem ID {item_id} del carrito.")
-    cart = db.query(models.Cart).first()
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found.")
+@router.delete("/{cart_id}/items/{item_id}/")
+@query_budget(4)
+def delete_item(cart_id: int, item_id: int, db: Session = Depends(get_db),
+        carts: CartRepository = Depends(get_cart_repository)):
+    logger.info(f"Eliminando ítem ID {item_id} del carrito {cart_id}.")
+    check_cart_exists(carts, db, cart_id)
     try:
-        result = crud.remove_cart_item(db, cart.id, item_id)
+        result = carts.remove_cart_item(db, cart_id, item_id)
         return result
     except HTTPException as e:
         logger.error(f"Error al eliminar ítem del carrito: {e.detail}")
@@ -104,53 +138,62 @@ def delete_item(item_id: int, db: Session = Depends(get_db)):
         logger.error(f"Error inesperado al eliminar ítem del carrito: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@router.get("/", response_model=schemas.Cart)
-def get_cart(db: Session = Depends(get_db)):
-    logger.info("Obteniendo el carrito.")
-    cart = db.query(models.Cart).options(
-        joinedload(models.Cart.items).joinedload(models.CartItem.item)
-    ).first()
-    if not cart or not cart.items:
-        return schemas.Cart(items=[], total_quantity=0, total_price=0.0)
-    
-    items = []
-    total_quantity = 0
-    total_price = 0.0
-    for cart_item in cart.items:
-        if not cart_item.item:
-            logger.warning(f"El CartItem ID {cart_item.id} no tiene un ítem asociado.")
-            continue  # O maneja el error según tus necesidades
-        subtotal = round(cart_item.quantity * cart_item.item.price, 2)
-        item_schema = schemas.CartItem(
-            id=cart_item.id,
-            cart_id=cart_item.cart_id,
-            item_id=cart_item.item_id,
-            quantity=cart_item.quantity,
-            item=schemas.Item.from_orm(cart_item.item),
-            subtotal=subtotal
-        )
-        items.append(item_schema)
-        total_quantity += cart_item.quantity
-        total_price += subtotal
-    
-    return schemas.Cart(
-        items=items,
-        total_quantity=total_quantity,
-        total_price=round(total_price, 2)
-    )
-
-@router.get("/invoice/", response_model=schemas.CartInvoice)
-def get_cart_invoice(db: Session = Depends(get_db)):
-    logger.info("Obteniendo la factura del carrito.")
-    cart = db.query(models.Cart).options(joinedload(models.Cart.items).joinedload(models.CartItem.item)).first()
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found.")
+# Las lecturas completas llevan ETag, calculado sobre el cuerpo: con
+# If-None-Match cuestan lo mismo y, si nada cambió, responden 304 sin él. Las
+# lecturas van a la réplica si existe (get_read_db, ver app/replica.py): justo
+# después de una escritura del cliente, una consulta más para comprobar que la
+# réplica ya la tiene
+@router.get("/{cart_id}/", response_model=schemas.Cart)
+@query_budget(2)
+def get_cart(cart_id: int, db: Session = Depends(get_read_db),
+        carts: CartRepository = Depends(get_cart_repository),
+        if_none_match: Optional[str] = Header(None)):
+    logger.info(f"Obteniendo el carrito {cart_id}.")
+    # Diccionario ya con la forma de schemas.Cart: se serializa sin volver a validarlo
+    return cart_read_response(*carts.get_cart_contents(db, cart_id), if_none_match)
+
+@router.get("/{cart_id}/summary/", response_model=schemas.CartSummary)
+@query_budget(2)
+def get_cart_summary(cart_id: int, db: Session = Depends(get_read_db),
+        carts: CartRepository = Depends(get_cart_repository)):
+    logger.info(f"Obteniendo el resumen del carrito {cart_id}.")
+    return carts.get_cart_summary(db, cart_id)
+
+@router.get("/{cart_id}/invoice/", response_model=schemas.CartInvoice)
+@query_budget(2)
+def get_cart_invoice(cart_id: int, db: Session = Depends(get_read_db),
+        carts: CartRepository = Depends(get_cart_repository),
+        if_none_match: Optional[str] = Header(None)):
+    logger.info(f"Obteniendo la factura del carrito {cart_id}.")
     try:
-        invoice = crud.get_cart_invoice(db, cart.id)
-        return invoice
+        # carts.get_cart_invoice responde 404 si el carrito no existe: no hace falta cargarlo antes
+        return cart_read_response(*carts.get_cart_invoice(db, cart_id), if_none_match)
     except HTTPException as e:
         logger.error(f"Error al obtener la factura del carrito: {e.detail}")
         raise e
     except Exception as e:
         logger.error(f"Error inesperado al obtener la factura del carrito: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
+
+# Lectura de la versión (404 si no existe) y el cursor de las líneas; la
+# respuesta se escribe por lotes mientras se leen (ver app/export.py)
+@router.get("/{cart_id}/invoice/export/")
+@query_budget(3)
+def export_cart_invoice(cart_id: int,
+        format: schemas.InvoiceExportFormat = Query(schemas.InvoiceExportFormat.NDJSON),
+        db: Session = Depends(get_read_db),
+        carts: CartRepository = Depends(get_cart_repository)):
+    logger.info(f"Exportando la factura del carrito {cart_id} en formato {format.value}.")
+    try:
+        if carts.get_cart_version(db, cart_id) is None:
+            raise HTTPException(status_code=404, detail="Cart not found.")
+        # La exportación lee cart_items: la capa en memoria vuelca antes el carrito
+        carts.flush(cart_id)
+        partitions = db.execute(crud.cart_invoice_lines_statement(cart_id, EXPORT_BATCH_SIZE)).partitions()
+        return invoice_export_response(cart_id, format, partitions)
+    except HTTPException as e:
+        logger.error(f"Error al exportar la factura del carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al exportar la factura del carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -0,0 +1,182 @@
+# app/routers/cart_async.py
+"""
+Rutas del carrito para el modo asíncrono (DATABASE_URL con asyncpg o aiosqlite).
+
+Exponen las mismas URLs y esquemas que app/routers/cart.py, pero se ejecutan
+directamente en el event loop con una AsyncSession en lugar de ocupar un hilo
+del threadpool por petición.
+"""
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
+from .. import crud, models, schemas, crud_async
+from ..export import EXPORT_BATCH_SIZE, invoice_export_response
+from ..idempotency import IdempotentRoute
+from ..database import get_async_db
+from ..query_budget import query_budget
+from ..responses import cart_read_response
+import logging
+
+# Las mutaciones admiten la cabecera Idempotency-Key (ver app/idempotency.py)
+router = APIRouter(
+    prefix="/cart",
+    tags=["cart"],
+    route_class=IdempotentRoute,
+)
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+async def get_cart_or_404(db: AsyncSession, cart_id: int) -> models.Cart:
+    cart = await crud_async.get_cart(db, cart_id)
+    if not cart:
+        raise HTTPException(status_code=404, detail="Cart not found.")
+    return cart
+
+@router.post("/", response_model=schemas.Cart, status_code=201)
+@query_budget(2)
+async def create_cart(db: AsyncSession = Depends(get_async_db)):
+    logger.info("Creando un nuevo carrito.")
+    cart = await crud_async.create_cart(db)
+    return schemas.Cart(id=cart.id, items=[], total_quantity=0, total_price=0.0)
+
+@router.post("/{cart_id}/items/", response_model=schemas.CartItem)
+@query_budget(5)
+async def add_item(cart_id: int, cart_item: schemas.CartItemCreate, db: AsyncSession = Depends(get_async_db)):
+    logger.info(f"Agregando ítem ID {cart_item.item_id} con cantidad {cart_item.quantity} al carrito {cart_id}.")
+    cart = await get_cart_or_404(db, cart_id)
+    try:
+        return await crud_async.add_item_to_cart(db, cart.id, cart_item.item_id, cart_item.quantity)
+    except HTTPException as e:
+        logger.error(f"Error al agregar ítem al carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al agregar ítem al carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+# Las rutas por lotes se declaran antes que /items/{item_id}/ para que 'batch'
+# no se interprete como un item_id
+@router.post("/{cart_id}/items/batch/", response_model=List[schemas.CartItem])
+@query_budget(5)
+async def add_items(cart_id: int, cart_items: List[schemas.CartItemCreate], db: AsyncSession = Depends(get_async_db)):
+    logger.info(f"Agregando {len(cart_items)} líneas al carrito {cart_id}.")
+    cart = await get_cart_or_404(db, cart_id)
+    try:
+        return await crud_async.add_items_to_cart(db, cart.id, cart_items)
+    except HTTPException as e:
+        logger.error(f"Error al agregar ítems al carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al agregar ítems al carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.put("/{cart_id}/items/batch/", response_model=List[schemas.CartItem])
+@query_budget(7)
+async def update_items(cart_id: int, cart_items: List[schemas.CartItemBase], db: AsyncSession = Depends(get_async_db)):
+    logger.info(f"Actualizando {len(cart_items)} líneas del carrito {cart_id}.")
+    cart = await get_cart_or_404(db, cart_id)
+    try:
+        return await crud_async.update_cart_items(db, cart.id, cart_items)
+    except HTTPException as e:
+        logger.error(f"Error al actualizar ítems del carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al actualizar ítems del carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.delete("/{cart_id}/items/batch/")
+@query_budget(4)
+async def delete_items(cart_id: int, item_ids: List[int] = Body(...), db: AsyncSession = Depends(get_async_db)):
+    logger.info(f"Eliminando {len(item_ids)} ítems del carrito {cart_id}.")
+    cart = await get_cart_or_404(db, cart_id)
+    try:
+        return await crud_async.remove_cart_items(db, cart.id, item_ids)
+    except HTTPException as e:
+        logger.error(f"Error al eliminar ítems del carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al eliminar ítems del carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.put("/{cart_id}/items/{item_id}/", response_model=Union[schemas.CartItem, dict])
+@query_budget(6)
+async def update_item(cart_id: int, item_id: int, cart_item: schemas.CartItemUpdate, db: AsyncSession = Depends(get_async_db)):
+    logger.info(f"Actualizando ítem ID {item_id} del carrito {cart_id} con nueva cantidad {cart_item.quantity}.")
+    cart = await get_cart_or_404(db, cart_id)
+    try:
+        response = await crud_async.update_cart_item(db, cart.id, item_id, cart_item.quantity)
+        # Si el ítem fue eliminado (devuelve None), devolver un mensaje
+        if response is None:
+            return {"message": "Item removed from cart"}
+        return response
+    except HTTPException as e:
+        logger.error(f"Error al actualizar ítem en el carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al actualizar ítem en el carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.delete("/{cart_id}/items/{item_id}/")
+@query_budget(4)
+async def delete_item(cart_id: int, item_id: int, db: AsyncSession = Depends(get_async_db)):
+    logger.info(f"Eliminando ítem ID {item_id} del carrito {cart_id}.")
+    cart = await get_cart_or_404(db, cart_id)
+    try:
+        return await crud_async.remove_cart_item(db, cart.id, item_id)
+    except HTTPException as e:
+        logger.error(f"Error al eliminar ítem del carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al eliminar ítem del carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+# Mismos presupuestos que las lecturas síncronas, que con una réplica pueden
+# comprobar antes la versión del carrito (ver app/replica.py)
+@router.get("/{cart_id}/", response_model=schemas.Cart)
+@query_budget(2)
+async def get_cart(cart_id: int, db: AsyncSession = Depends(get_async_db),
+        if_none_match: Optional[str] = Header(None)):
+    logger.info(f"Obteniendo el carrito {cart_id}.")
+    # Diccionario ya con la forma de schemas.Cart: se serializa sin volver a validarlo
+    return cart_read_response(*await crud_async.get_cart_contents(db, cart_id), if_none_match)
+
+@router.get("/{cart_id}/summary/", response_model=schemas.CartSummary)
+@query_budget(2)
+async def get_cart_summary(cart_id: int, db: AsyncSession = Depends(get_async_db)):
+    logger.info(f"Obteniendo el resumen del carrito {cart_id}.")
+    return await crud_async.get_cart_summary(db, cart_id)
+
+@router.get("/{cart_id}/invoice/", response_model=schemas.CartInvoice)
+@query_budget(2)
+async def get_cart_invoice(cart_id: int, db: AsyncSession = Depends(get_async_db),
+        if_none_match: Optional[str] = Header(None)):
+    logger.info(f"Obteniendo la factura del carrito {cart_id}.")
+    try:
+        # get_cart_invoice responde 404 si el carrito no existe: no hace falta cargarlo antes
+        return cart_read_response(*await crud_async.get_cart_invoice(db, cart_id), if_none_match)
+    except HTTPException as e:
+        logger.error(f"Error al obtener la factura del carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al obtener la factura del carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@router.get("/{cart_id}/invoice/export/")
+@query_budget(3)
+async def export_cart_invoice(cart_id: int,
+        format: schemas.InvoiceExportFormat = Query(schemas.InvoiceExportFormat.NDJSON),
+        db: AsyncSession = Depends(get_async_db)):
+    logger.info(f"Exportando la factura del carrito {cart_id} en formato {format.value}.")
+    try:
+        if await crud_async.get_cart_version(db, cart_id) is None:
+            raise HTTPException(status_code=404, detail="Cart not found.")
+        # AsyncSession.stream: el mismo cursor por lotes que la ruta síncrona
+        result = await db.stream(crud.cart_invoice_lines_statement(cart_id, EXPORT_BATCH_SIZE))
+        return invoice_export_response(cart_id, format, result.partitions())
+    except HTTPException as e:
+        logger.error(f"Error al exportar la factura del carrito: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.error(f"Error inesperado al exportar la factura del carrito: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -0,0 +1,28 @@
+# app/routers/items.py
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from .. import schemas, crud
+from ..replica import get_read_db
+from ..query_budget import query_budget
+import logging
+
+router = APIRouter(
+    prefix="/items",
+    tags=["items"],
+)
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+@router.get("/", response_model=schemas.ItemPage)
+@query_budget(1)
+def list_items(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Valor 'next_cursor' de la página anterior"),
+    type: Optional[schemas.ItemType] = None,
+    db: Session = Depends(get_read_db),
+):
+    logger.info(f"Listando ítems (limit={limit}, type={type}).")
+    return crud.get_items_page(db, limit=limit, cursor=cursor, item_type=type)
@@ -0,0 +1,36 @@
+# app/routers/system.py
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from .. import schemas
+from ..database import async_pool_telemetry, pool_telemetry, read_pool_telemetry
+from ..metrics import registry
+from ..query_budget import query_budget
+import logging
+
+router = APIRouter(
+    prefix="/system",
+    tags=["system"],
+)
+
+# Prometheus espera /metrics en la raíz
+metrics_router = APIRouter(tags=["system"])
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+@router.get("/pool/", response_model=schemas.PoolStatsResponse)
+@query_budget(0)
+def get_pool_stats():
+    # Estadísticas en vivo de los pools de conexiones (síncrono y, si existen, asíncrono y de la réplica)
+    pools = [pool_telemetry.snapshot()]
+    for telemetry in (async_pool_telemetry, read_pool_telemetry):
+        if telemetry is not None:
+            pools.append(telemetry.snapshot())
+    return {"pools": pools}
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+@query_budget(0)
+def get_metrics():
+    # Formato de exposición de texto de Prometheus (versión 0.0.4)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
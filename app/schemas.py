@@ -1,13 +1,17 @@
 # app/schemas.py
 
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List, Optional
 from enum import Enum
 
 class ItemType(str, Enum):
     PRODUCT = "PRODUCT"
     EVENT = "EVENT"
 
+class InvoiceExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
 class ItemBase(BaseModel):
     name: str
     description: str
@@ -29,12 +33,20 @@ class Item(ItemBase):
         "from_attributes": True  # Para Pydantic v2
     }
 
+class ItemPage(BaseModel):
+    items: List[Item]
+    next_cursor: Optional[str] = Field(None, description="Cursor opaco de la página siguiente; null en la última")
+
 class CartItemBase(BaseModel):
     item_id: int
-    quantity: int = Field(..., ge=0, description="Cantidad debe ser mayor que 0")
+    quantity: int = Field(..., ge=0, description="Cantidad debe ser mayor o igual que 0 (0 elimina la línea)")
 
 class CartItemCreate(CartItemBase):
-    pass
+    # Añadir 0 unidades crearía una línea vacía que ocupa el índice único (cart_id, item_id)
+    quantity: int = Field(..., gt=0, description="Cantidad debe ser mayor que 0")
+
+class CartItemUpdate(BaseModel):
+    quantity: int = Field(..., ge=0, description="Cantidad debe ser mayor o igual que 0")
 
 class CartItem(BaseModel):
     id: int
@@ -49,6 +61,7 @@ class CartItem(BaseModel):
     }
 
 class Cart(BaseModel):
+    id: int
     items: List[CartItem]
     total_quantity: int
     total_price: float
@@ -65,3 +78,35 @@ class CartInvoice(BaseModel):
     model_config = {
         "from_attributes": True  # Para Pydantic v2
     }
+
+class CartSummary(BaseModel):
+    id: int
+    total_quantity: int
+    total_price: float
+    version: int
+
+    model_config = {
+        "from_attributes": True  # Para Pydantic v2
+    }
+
+class HistogramSnapshot(BaseModel):
+    count: int
+    sum: float
+    buckets: Dict[str, int] = Field(..., description="Observaciones acumuladas con duración <= límite (segundos)")
+
+class PoolStats(BaseModel):
+    name: str
+    pool_class: Optional[str]
+    size: Optional[int]
+    overflow: Optional[int]
+    checked_out: int
+    peak_checked_out: int
+    checkouts: int
+    connects: int
+    invalidations: int
+    timeouts: int
+    wait_seconds: HistogramSnapshot
+    connect_seconds: HistogramSnapshot
+
+class PoolStatsResponse(BaseModel):
+    pools: List[PoolStats]
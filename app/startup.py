@@ -0,0 +1,129 @@
+# app/startup.py
+"""
+Arranque de cada worker por fases, ejecutado desde el lifespan de app.main.
+
+DB_SCHEMA_MODE decide qué se hace con el esquema:
+- check (por defecto): una única consulta a alembic_version, comparada con
+  la revisión head de alembic/versions. Si no coinciden el worker no arranca.
+- create: Base.metadata.create_all, para desarrollo y pruebas locales.
+  Inspecciona cada tabla, así que no debe usarse en despliegues.
+- skip: ninguna comprobación.
+
+La duración de cada fase (import, schema, warmup) se registra en el log y
+en /metrics como app_startup_seconds.
+"""
+
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Mapping, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_MODES = ("check", "create", "skip")
+VERSIONS_DIR = Path(__file__).resolve().parent.parent / "alembic" / "versions"
+
+_REVISION = re.compile(r"^revision\b[^=]*=\s*['\"]([^'\"]+)['\"]", re.M)
+_DOWN_REVISION = re.compile(r"^down_revision\b[^=]*=(.*)$", re.M)
+_QUOTED = re.compile(r"['\"]([^'\"]+)['\"]")
+
+class SchemaMismatch(RuntimeError):
+    pass
+
+def schema_mode(env: Mapping[str, str] = os.environ) -> str:
+    mode = env.get("DB_SCHEMA_MODE", "check").lower()
+    if mode not in SCHEMA_MODES:
+        raise ValueError(f"DB_SCHEMA_MODE no soportado: {mode} (opciones: {', '.join(SCHEMA_MODES)})")
+    return mode
+
+def alembic_heads(versions_dir: Path = VERSIONS_DIR) -> Set[str]:
+    """
+    Revisiones head leyendo los ficheros de alembic/versions como texto:
+    importar Alembic cuesta más que el resto del arranque.
+    """
+    revisions: Set[str] = set()
+    parents: Set[str] = set()
+    for path in versions_dir.glob("*.py"):
+        source = path.read_text(encoding="utf-8")
+        revision = _REVISION.search(source)
+        if revision is None:
+            continue
+        revisions.add(revision.group(1))
+        down_revision = _DOWN_REVISION.search(source)
+        if down_revision is not None:
+            parents.update(_QUOTED.findall(down_revision.group(1)))
+    return revisions - parents
+
+def current_revisions(engine: Engine) -> Optional[Set[str]]:
+    """Revisiones aplicadas según alembic_version; None si la tabla no existe."""
+    with engine.connect() as conn:
+        try:
+            return set(conn.execute(text("SELECT version_num FROM alembic_version")).scalars())
+        except DBAPIError:
+            # Tabla inexistente (OperationalError en SQLite, ProgrammingError en PostgreSQL);
+            # los errores de conexión se propagan desde engine.connect()
+            return None
+
+def check_schema(engine: Engine, heads: Optional[Set[str]] = None):
+    expected = alembic_heads() if heads is None else heads
+    current = current_revisions(engine)
+    if current is None and not expected:
+        return
+    if current != expected:
+        applied = ", ".join(sorted(current)) if current else "ninguna"
+        raise SchemaMismatch(
+            f"La base de datos está en la revisión {applied} y el código espera "
+            f"{', '.join(sorted(expected))}: ejecute 'alembic upgrade head' "
+            "(o 'alembic stamp head' si el esquema se creó con create_all)."
+        )
+
+class StartupReport:
+    """Duración en segundos de cada fase del arranque, en orden."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.phases.items())
+        return f"{sum(self.phases.values()) * 1000:.1f} ms ({parts})"
+
+report = StartupReport()
+
+def prepare_schema(engine: Engine, mode: Optional[str] = None):
+    """Comprueba o crea el esquema según DB_SCHEMA_MODE (también para app.importer)."""
+    mode = mode or schema_mode()
+    if mode == "check":
+        check_schema(engine)
+    elif mode == "create":
+        from .database import Base
+        from . import models  # noqa: F401  (registra las tablas en Base.metadata)
+        Base.metadata.create_all(bind=engine)
+
+def run(engine: Engine, mode: Optional[str] = None, report: StartupReport = report):
+    """Fases de arranque que tocan la base de datos; la de import la registra app.main."""
+    mode = mode or schema_mode()
+    with report.phase("schema"):
+        prepare_schema(engine, mode)
+    with report.phase("warmup"):
+        # Configurar los mappers aquí en lugar de en la primera petición
+        from sqlalchemy.orm import configure_mappers
+        configure_mappers()
+    logger.info(f"Arranque en {report.summary()}, esquema: {mode}.")
@@ -0,0 +1,228 @@
+# app/sweeper.py
+"""
+Recuperación de carritos abandonados.
+
+Un carrito sin mutaciones durante CART_TTL_SECONDS (ver
+models.Cart.last_activity_at) se considera abandonado: su stock reservado
+vuelve a items.stock (el shard 0 si el stock del ítem está repartido, ver
+app/inventory.py) y se borran el carrito y sus líneas. Cada lote es una
+transacción con un número constante de sentencias, sea cual sea el número
+de carritos o de líneas:
+
+1. SELECT de hasta 'batch_size' carritos caducados (FOR UPDATE SKIP LOCKED
+   en PostgreSQL: los que una petición tiene bloqueados se saltan).
+2. UPDATE items ... FROM (SELECT item_id, SUM(quantity) ... GROUP BY item_id).
+3. DELETE de sus líneas.
+4. DELETE de los carritos, con RETURNING de las unidades recuperadas.
+
+Los pasos 2-4 vuelven a comprobar la caducidad, así que un carrito que recibe
+una petición entre el paso 1 y el 2 se conserva. Para no competir con el
+tráfico, los lotes se espacian 'pause' segundos y en PostgreSQL cada lote
+espera como mucho 'lock_timeout' por un bloqueo: si una petición tiene la
+fila de un ítem, el lote se aborta y se reintenta en la siguiente pasada en
+lugar de bloquearla (o de acabar en un deadlock cuya víctima fuera ella).
+
+Uso puntual (p. ej. desde cron):
+    python -m app.sweeper --ttl 86400
+"""
+
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Mapping, Optional
+
+from sqlalchemy import and_, delete, func, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class SweepStats:
+    carts: int = 0
+    lines: int = 0
+    units: int = 0
+    batches: int = 0
+    skipped_batches: int = 0  # abortados por un bloqueo; se reintentan en la siguiente pasada
+    elapsed: float = 0.0
+
+    def add(self, other: "SweepStats"):
+        for name in ("carts", "lines", "units", "batches", "skipped_batches", "elapsed"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+def reclaim_batch(conn: Connection, cutoff: datetime, batch_size: int) -> SweepStats:
+    """Recupera hasta 'batch_size' carritos inactivos desde antes de 'cutoff' en la transacción de 'conn'."""
+    candidates = (
+        select(models.Cart.id)
+        .where(models.Cart.last_activity_at < cutoff)
+        .order_by(models.Cart.last_activity_at)
+        .limit(batch_size)
+    )
+    if conn.dialect.name == "postgresql":
+        candidates = candidates.with_for_update(skip_locked=True)
+    cart_ids = conn.execute(candidates).scalars().all()
+    if not cart_ids:
+        return SweepStats(batches=1)
+
+    # Solo los que siguen inactivos: una petición pudo tocarlos tras el SELECT
+    idle = and_(models.Cart.id.in_(cart_ids), models.Cart.last_activity_at < cutoff)
+    reserved = (
+        select(models.CartItem.item_id, func.sum(models.CartItem.quantity).label("units"))
+        .join(models.Cart, models.Cart.id == models.CartItem.cart_id)
+        .where(idle)
+        .group_by(models.CartItem.item_id)
+        .subquery()
+    )
+    conn.execute(
+        update(models.Item.__table__)
+        .where(models.Item.id == reserved.c.item_id)
+        .values(stock=models.Item.stock + reserved.c.units)
+    )
+    lines = conn.execute(
+        delete(models.CartItem.__table__).where(models.CartItem.cart_id.in_(select(models.Cart.id).where(idle)))
+    ).rowcount
+    units = conn.execute(delete(models.Cart.__table__).where(idle).returning(models.Cart.total_quantity)).scalars().all()
+    return SweepStats(carts=len(units), lines=lines, units=sum(units), batches=1)
+
+def sweep(engine: Engine, ttl: float, batch_size: int = 500, pause: float = 0.1, lock_timeout: float = 0.1,
+          max_batches: Optional[int] = None, now: Optional[datetime] = None,
+          stop: Optional[threading.Event] = None) -> SweepStats:
+    """
+    Recupera por lotes los carritos sin actividad en los últimos 'ttl' segundos
+    hasta agotarlos, alcanzar 'max_batches' o recibir 'stop'.
+    """
+    cutoff = (now or models.utcnow()) - timedelta(seconds=ttl)
+    stop = stop or threading.Event()
+    stats = SweepStats()
+    started = time.perf_counter()
+    while not stop.is_set() and (max_batches is None or stats.batches < max_batches):
+        try:
+            with engine.begin() as conn:
+                if conn.dialect.name == "postgresql":
+                    conn.execute(text("SELECT set_config('lock_timeout', :value, true)"),
+                                 {"value": f"{int(lock_timeout * 1000)}ms"})
+                batch = reclaim_batch(conn, cutoff, batch_size)
+        except OperationalError as e:
+            # lock_timeout en PostgreSQL, 'database is locked' en SQLite: ceder ante el tráfico
+            logger.warning(f"Lote de carritos abandonados abortado por un bloqueo: {e.orig}")
+            stats.batches += 1
+            stats.skipped_batches += 1
+            break
+        stats.add(batch)
+        if batch.carts < batch_size:
+            break
+        stop.wait(pause)
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+class SweeperMetrics:
+    """Contadores acumulados de las pasadas del sweeper, para /metrics."""
+
+    def __init__(self):
+        self.runs = 0
+        self.totals = SweepStats()
+        self.last_run_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, stats: SweepStats):
+        with self._lock:
+            self.runs += 1
+            self.totals.add(stats)
+            self.last_run_seconds = stats.elapsed
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "batches": self.totals.batches,
+                "skipped_batches": self.totals.skipped_batches,
+                "carts": self.totals.carts,
+                "lines": self.totals.lines,
+                "units": self.totals.units,
+                "last_run_seconds": self.last_run_seconds,
+            }
+
+metrics = SweeperMetrics()
+
+class CartSweeper:
+    """Hilo en segundo plano que ejecuta sweep() cada 'interval' segundos."""
+
+    def __init__(self, engine: Engine, ttl: float, interval: float = 60.0, batch_size: int = 500,
+                 pause: float = 0.1, lock_timeout: float = 0.1, metrics: SweeperMetrics = metrics):
+        self.engine = engine
+        self.ttl = ttl
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.lock_timeout = lock_timeout
+        self.metrics = metrics
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> SweepStats:
+        stats = sweep(self.engine, self.ttl, batch_size=self.batch_size, pause=self.pause,
+                      lock_timeout=self.lock_timeout, stop=self._stop)
+        self.metrics.record(stats)
+        if stats.carts:
+            logger.info(f"Recuperados {stats.carts} carritos abandonados ({stats.units} unidades) en {stats.elapsed:.2f}s.")
+        return stats
+
+    def _run(self):
+        # Primera pasada con un retraso aleatorio para que los workers no coincidan
+        delay = random.uniform(0, self.interval)
+        while not self._stop.wait(delay):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error inesperado al recuperar carritos abandonados: {e}")
+            delay = self.interval
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="cart-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def sweeper_from_env(engine: Engine, env: Mapping[str, str] = os.environ) -> Optional[CartSweeper]:
+    """
+    CartSweeper configurado con CART_TTL_SECONDS, CART_SWEEP_INTERVAL,
+    CART_SWEEP_BATCH_SIZE, CART_SWEEP_PAUSE y CART_SWEEP_LOCK_TIMEOUT. Sin
+    CART_TTL_SECONDS (o con 0) los carritos no caducan y devuelve None.
+    """
+    ttl = float(env.get("CART_TTL_SECONDS", "0"))
+    if ttl <= 0:
+        return None
+    return CartSweeper(
+        engine,
+        ttl=ttl,
+        interval=float(env.get("CART_SWEEP_INTERVAL", "60")),
+        batch_size=int(env.get("CART_SWEEP_BATCH_SIZE", "500")),
+        pause=float(env.get("CART_SWEEP_PAUSE", "0.1")),
+        lock_timeout=float(env.get("CART_SWEEP_LOCK_TIMEOUT", "0.1")),
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Recupera el stock de los carritos abandonados.")
+    parser.add_argument("--ttl", type=float, required=True, help="segundos sin actividad")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.1, help="segundos entre lotes")
+    parser.add_argument("--lock-timeout", type=float, default=0.1)
+    args = parser.parse_args()
+
+    from .database import engine
+    stats = sweep(engine, args.ttl, batch_size=args.batch_size, pause=args.pause, lock_timeout=args.lock_timeout)
+    print(f"Recuperados {stats.carts} carritos, {stats.lines} líneas y {stats.units} unidades "
+          f"en {stats.batches} lotes ({stats.skipped_batches} abortados) y {stats.elapsed:.2f}s")
+
+if __name__ == "__main__":
+    main()
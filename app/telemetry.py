@@ -0,0 +1,181 @@
+# app/telemetry.py
+"""
+Telemetría del pool de conexiones.
+
+Los contadores se alimentan de los eventos de SQLAlchemy (checkout, checkin,
+connect, invalidate y do_connect para la latencia de conexión). La espera por
+una conexión no tiene evento propio, así que se mide envolviendo _do_get en
+una subclase de la clase de pool configurada (ver instrumented_pool_class).
+"""
+
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Type
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+# Límites superiores (segundos) de los buckets, al estilo de Prometheus
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Histograma acumulativo de duraciones, seguro entre hilos."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # el último es +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def quantile(self, q: float) -> Optional[float]:
+        # Aproximación por el límite superior del bucket que contiene el cuantil
+        with self._lock:
+            counts = list(self._counts)
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+        cumulative: List[int] = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return {
+            "count": running,
+            "sum": round(total_sum, 6),
+            "buckets": {
+                **{str(bound): value for bound, value in zip(self.buckets, cumulative)},
+                "+Inf": running,
+            },
+        }
+
+class PoolTelemetry:
+    """Estadísticas en vivo de un pool: uso actual, pico, esperas y conexiones."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine: Optional[Engine] = None
+        self.wait_seconds = Histogram()
+        self.connect_seconds = Histogram()
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def attach(self, engine: Engine):
+        # Los eventos del pool se copian al pool nuevo cuando engine.dispose() lo recrea
+        self.engine = engine
+
+        @event.listens_for(engine, "do_connect")
+        def _connect_started(dialect, connection_record, cargs, cparams):
+            connection_record.info["connect_started"] = time.perf_counter()
+
+        @event.listens_for(engine.pool, "connect")
+        def _connected(dbapi_connection, connection_record):
+            started = connection_record.info.pop("connect_started", None)
+            if started is not None:
+                self.connect_seconds.observe(time.perf_counter() - started)
+            with self._lock:
+                self.connects += 1
+
+        @event.listens_for(engine.pool, "checkout")
+        def _checked_out(dbapi_connection, connection_record, connection_proxy):
+            with self._lock:
+                self.checkouts += 1
+                self.checked_out += 1
+                self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+        @event.listens_for(engine.pool, "checkin")
+        def _checked_in(dbapi_connection, connection_record):
+            with self._lock:
+                self.checked_out -= 1
+
+        @event.listens_for(engine.pool, "invalidate")
+        def _invalidated(dbapi_connection, connection_record, exception):
+            with self._lock:
+                self.invalidations += 1
+
+    def observe_wait(self, seconds: float, timed_out: bool = False):
+        self.wait_seconds.observe(seconds)
+        if timed_out:
+            with self._lock:
+                self.timeouts += 1
+
+    def snapshot(self) -> Dict:
+        pool = self.engine.pool if self.engine is not None else None
+        with self._lock:
+            stats = {
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+            }
+        return {
+            "name": self.name,
+            # La clase instrumentada hereda de la configurada
+            "pool_class": type(pool).__mro__[1].__name__ if pool is not None else None,
+            "size": _pool_stat(pool, "size"),
+            "overflow": _pool_stat(pool, "overflow"),
+            **stats,
+            "wait_seconds": self.wait_seconds.snapshot(),
+            "connect_seconds": self.connect_seconds.snapshot(),
+        }
+
+def _pool_stat(pool: Optional[Pool], name: str) -> Optional[int]:
+    # size()/overflow() solo existen en QueuePool (SingletonThreadPool tiene un atributo 'size')
+    value = getattr(pool, name, None)
+    return value() if callable(value) else value
+
+def instrumented_pool_class(pool_class: Type[Pool], telemetry: PoolTelemetry) -> Type[Pool]:
+    """
+    Subclase de 'pool_class' que mide cuánto tarda cada checkout en obtener una
+    conexión (incluida su apertura si hace falta). Pool.recreate() reutiliza
+    self.__class__, así que la medición sobrevive a engine.dispose().
+    """
+    reentry = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get puede llamarse a sí mismo: solo se mide la llamada externa
+        if getattr(reentry, "active", False):
+            return pool_class._do_get(self)
+        reentry.active = True
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return pool_class._do_get(self)
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            reentry.active = False
+            telemetry.observe_wait(time.perf_counter() - started, timed_out)
+
+    return type(f"Instrumented{pool_class.__name__}", (pool_class,), {"_do_get": _do_get})
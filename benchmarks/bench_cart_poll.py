@@ -0,0 +1,75 @@
+# benchmarks/bench_cart_poll.py
+"""
+Sondeo de GET /cart/{id}/ y /invoice/ con y sin If-None-Match.
+
+Simula frontends que consultan el carrito continuamente: cada carrito se
+sondea '--polls' veces y, con probabilidad '--mutation-rate', entre sondeo y
+sondeo cambia una cantidad. La variante 'plain' descarga siempre la lectura
+completa (el comportamiento anterior); 'etag' reenvía el último ETag y recibe
+304 mientras el carrito no cambia. Se cuentan sentencias SQL y bytes del cuerpo.
+
+Uso:
+    python -m benchmarks.bench_cart_poll [--carts 50] [--lines 50] [--polls 100] [--mutation-rate 0.05]
+"""
+
+import argparse
+import random
+
+from benchmarks.common import print_table, seed_carts, summarize, timed, use_temp_sqlite
+
+use_temp_sqlite()
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.database import engine
+from app.main import app
+
+def run(variant: str, n_carts: int, lines: int, polls: int, mutation_rate: float, seed: int) -> list:
+    item_ids = seed_carts(engine, n_carts=n_carts, lines_per_cart=lines)
+    rng = random.Random(seed)
+    statements = []
+    listener = lambda *args: statements.append(1)
+    rows = []
+    with TestClient(app) as client:
+        for resource in ("", "invoice/"):
+            etags = {}
+            samples, body_bytes, not_modified = [], 0, 0
+            statements.clear()
+            for _ in range(polls):
+                for cart_id in range(1, n_carts + 1):
+                    if rng.random() < mutation_rate:
+                        client.put(f"/cart/{cart_id}/items/{rng.choice(item_ids)}/", json={"quantity": rng.randint(1, 3)})
+                    headers = {"If-None-Match": etags[cart_id]} if variant == "etag" and cart_id in etags else {}
+                    event.listen(engine, "before_cursor_execute", listener)
+                    elapsed, response = timed(client.get, f"/cart/{cart_id}/{resource}", headers=headers)
+                    event.remove(engine, "before_cursor_execute", listener)
+                    assert response.status_code in (200, 304), response.text
+                    etags[cart_id] = response.headers["ETag"]
+                    not_modified += response.status_code == 304
+                    body_bytes += len(response.content)
+                    samples.append(elapsed)
+            rows.append({
+                "resource": resource or "cart", "variant": variant,
+                "queries": round(len(statements) / len(samples), 2),
+                "304_pct": round(100 * not_modified / len(samples), 1),
+                "kb_per_poll": round(body_bytes / len(samples) / 1024, 2),
+                **summarize(samples),
+            })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--carts", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=50)
+    parser.add_argument("--polls", type=int, default=100)
+    parser.add_argument("--mutation-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rows = []
+    for variant in ("plain", "etag"):
+        rows.extend(run(variant, args.carts, args.lines, args.polls, args.mutation_rate, args.seed))
+    print_table(rows, ["resource", "variant", "queries", "304_pct", "kb_per_poll", "n", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/bench_cart_read.py
+"""
+GET /cart/{id}/: carga ORM polimórfica frente a la proyección plana del catálogo.
+
+La variante 'orm' reproduce la lectura anterior (joinedload de Cart.items y
+CartItem.item, con entidades Product/Event y Item.from_orm); la variante
+'flat' es crud.get_cart_contents, que lee solo columnas de cart_items e items.
+Se cuentan las sentencias SQL de cada petición.
+
+Uso:
+    python -m benchmarks.bench_cart_read [--lines 1 50 500] [--requests 200]
+"""
+
+import argparse
+
+from benchmarks.common import use_temp_sqlite, seed_carts, timed, summarize, print_table
+
+use_temp_sqlite()
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+from app import crud, models, schemas
+from app.database import engine
+from app.main import app
+from app.money import from_cents
+
+def orm_get_cart_contents(db, cart_id: int) -> dict:
+    # Implementación previa, conservada solo para la comparación (la ruta espera un diccionario)
+    cart = db.query(models.Cart).options(
+        joinedload(models.Cart.items).joinedload(models.CartItem.item)
+    ).filter(models.Cart.id == cart_id).first()
+    return schemas.Cart(
+        id=cart.id,
+        items=[
+            schemas.CartItem(
+                id=line.id, cart_id=line.cart_id, item_id=line.item_id, quantity=line.quantity,
+                item=schemas.Item.model_validate(line.item),
+                subtotal=round(line.quantity * line.item.price, 2),
+            )
+            for line in cart.items if line.item
+        ],
+        total_quantity=cart.total_quantity,
+        total_price=from_cents(cart.total_price_cents),
+    ).model_dump(mode="json")
+
+def run(lines: int, n_requests: int):
+    seed_carts(engine, n_carts=10, lines_per_cart=lines)
+    statements = []
+    listener = lambda *args: statements.append(1)
+    event.listen(engine, "before_cursor_execute", listener)
+    rows = []
+    flat_get_cart_contents = crud.get_cart_contents
+    try:
+        with TestClient(app) as client:
+            for variant, fn in (("orm", orm_get_cart_contents), ("flat", flat_get_cart_contents)):
+                crud.get_cart_contents = fn
+                samples = []
+                statements.clear()
+                for _ in range(n_requests):
+                    elapsed, response = timed(client.get, "/cart/1/")
+                    assert response.status_code == 200, response.text
+                    assert len(response.json()["items"]) == lines
+                    samples.append(elapsed)
+                rows.append({
+                    "lines": lines, "variant": variant,
+                    "queries": round(len(statements) / n_requests, 1), **summarize(samples),
+                })
+    finally:
+        crud.get_cart_contents = flat_get_cart_contents
+        event.remove(engine, "before_cursor_execute", listener)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = []
+    for lines in args.lines:
+        rows.extend(run(lines, args.requests))
+    print_table(rows, ["lines", "variant", "queries", "n", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+
+if __name__ == "__main__":
+    main()
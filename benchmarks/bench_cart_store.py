@@ -0,0 +1,92 @@
+# benchmarks/bench_cart_store.py
+"""
+Rutas del carrito con CART_STORE=sql frente a CART_STORE=memory.
+
+Cada iteración ejecuta sobre un carrito ya activo las operaciones más
+frecuentes (añadir a una línea existente, cambiar una cantidad, resumen y
+contenido). Se cuentan las sentencias SQL por petición y, en la variante
+'memory', el coste del volcado final a SQL.
+
+Uso:
+    python -m benchmarks.bench_cart_store [--carts 200] [--lines 5] [--rounds 20]
+"""
+
+import argparse
+import time
+
+from benchmarks.common import print_table, seed_carts, summarize, timed, use_temp_sqlite
+
+use_temp_sqlite()
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.database import engine
+from app.main import app
+from app.repository import MemoryCartRepository, SqlCartRepository, get_cart_repository
+
+OPERATIONS = ("add", "update", "summary", "contents")
+
+def request(client, operation: str, cart_id: int, item_id: int, round_no: int):
+    if operation == "add":
+        return client.post(f"/cart/{cart_id}/items/", json={"item_id": item_id, "quantity": 1})
+    if operation == "update":
+        return client.put(f"/cart/{cart_id}/items/{item_id}/", json={"quantity": round_no + 1})
+    if operation == "summary":
+        return client.get(f"/cart/{cart_id}/summary/")
+    return client.get(f"/cart/{cart_id}/")
+
+def run(variant: str, n_carts: int, lines: int, rounds: int) -> list:
+    item_ids = seed_carts(engine, n_carts=n_carts, lines_per_cart=lines)
+    store = MemoryCartRepository(engine, max_carts=n_carts) if variant == "memory" else SqlCartRepository()
+    app.dependency_overrides[get_cart_repository] = lambda: store
+    statements = []
+    listener = lambda *args: statements.append(1)
+    samples = {operation: [] for operation in OPERATIONS}
+    queries = {operation: 0 for operation in OPERATIONS}
+    try:
+        with TestClient(app) as client:
+            # Primer acceso: la capa en memoria carga cada carrito una vez
+            for cart_id in range(1, n_carts + 1):
+                assert client.get(f"/cart/{cart_id}/summary/").status_code == 200
+            event.listen(engine, "before_cursor_execute", listener)
+            for round_no in range(rounds):
+                for cart_id in range(1, n_carts + 1):
+                    item_id = item_ids[cart_id % lines]
+                    for operation in OPERATIONS:
+                        statements.clear()
+                        elapsed, response = timed(request, client, operation, cart_id, item_id, round_no)
+                        assert response.status_code == 200, response.text
+                        samples[operation].append(elapsed)
+                        queries[operation] += len(statements)
+            event.remove(engine, "before_cursor_execute", listener)
+            flush_ms = 0.0
+            if variant == "memory":
+                start = time.perf_counter()
+                store.flush_all()
+                flush_ms = round((time.perf_counter() - start) * 1000, 1)
+    finally:
+        del app.dependency_overrides[get_cart_repository]
+    return [
+        {
+            "store": variant, "operation": operation,
+            "queries": round(queries[operation] / len(samples[operation]), 2),
+            **summarize(samples[operation]),
+            "final_flush_ms": flush_ms,
+        }
+        for operation in OPERATIONS
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--carts", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = []
+    for variant in ("sql", "memory"):
+        rows.extend(run(variant, args.carts, args.lines, args.rounds))
+    print_table(rows, ["store", "operation", "queries", "n", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "final_flush_ms"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# benchmarks/bench_cart_summary.py
+"""
+Coste de GET /cart/{id}/summary/ frente a GET /cart/{id}/ según el número de líneas.
+
+El resumen lee solo la fila de 'carts' con los totales mantenidos por cada
+mutación, así que su latencia no depende del número de líneas del carrito.
+
+Uso:
+    python -m benchmarks.bench_cart_summary [--lines 1 100 500] [--requests 200]
+"""
+
+import argparse
+
+from benchmarks.common import use_temp_sqlite, seed_carts, timed, summarize, print_table
+
+use_temp_sqlite()
+
+from fastapi.testclient import TestClient
+from app.database import engine
+from app.main import app
+
+def run(lines: int, n_requests: int):
+    seed_carts(engine, n_carts=10, lines_per_cart=lines)
+    rows = []
+    with TestClient(app) as client:
+        for route in ("/cart/1/", "/cart/1/summary/"):
+            samples = []
+            for _ in range(n_requests):
+                elapsed, response = timed(client.get, route)
+                assert response.status_code == 200, response.text
+                samples.append(elapsed)
+            rows.append({"lines": lines, "route": route, **summarize(samples)})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 100, 500])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = []
+    for lines in args.lines:
+        rows.extend(run(lines, args.requests))
+    print_table(rows, ["lines", "route", "n", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# benchmarks/bench_cart_upsert.py
+"""
+Escritura de una línea del carrito sobre una tabla cart_items grande.
+
+- update_insert: camino anterior, UPDATE de la línea y, si no existía,
+  INSERT (dos sentencias para una línea nueva y posibles duplicados con
+  peticiones concurrentes), con el índice simple sobre cart_id.
+- upsert: crud.upsert_cart_lines, un INSERT ... ON CONFLICT (cart_id,
+  item_id) DO UPDATE sobre el índice único de la migración 0004.
+
+Entre ambas fases se aplica la migración (fusión de duplicados y creación
+del índice) y se mide su duración. Cada operación es una transacción con
+commit, sin la reserva de stock ni los totales.
+
+Uso:
+    python -m benchmarks.bench_cart_upsert [--rows 10000000] [--lines 5] [--ops 2000]
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.common import print_table, seed_carts, summarize, use_temp_sqlite
+
+use_temp_sqlite()
+
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.orm import Session
+from app import crud, models
+from app.database import engine
+
+def update_insert(db, cart_id: int, item_id: int, quantity: int) -> int:
+    # Implementación previa, conservada solo para la comparación
+    line = db.execute(
+        update(models.CartItem)
+        .where(models.CartItem.cart_id == cart_id, models.CartItem.item_id == item_id)
+        .values(quantity=models.CartItem.quantity + quantity)
+        .returning(models.CartItem.id, models.CartItem.quantity)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if line is None:
+        line = db.execute(
+            insert(models.CartItem)
+            .values(cart_id=cart_id, item_id=item_id, quantity=quantity)
+            .returning(models.CartItem.id, models.CartItem.quantity)
+        ).first()
+    return line.id
+
+def upsert(db, cart_id: int, item_id: int, quantity: int) -> int:
+    return crud.upsert_cart_lines(db, cart_id, {item_id: quantity})[item_id][0]
+
+def previous_schema():
+    # Índices de cart_items anteriores a la migración 0004
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ux_cart_items_cart_id_item_id"))
+        conn.execute(text("CREATE INDEX ix_cart_items_cart_id ON cart_items (cart_id)"))
+
+def migrate() -> float:
+    # La migración real, con Alembic, sobre la base de datos del benchmark
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option("script_location", "alembic")
+    with engine.connect() as conn:
+        config.attributes["connection"] = conn
+        command.stamp(config, "0003")
+        start = time.perf_counter()
+        command.upgrade(config, "0004")
+        conn.commit()
+        return time.perf_counter() - start
+
+def run(strategy, n_carts: int, item_ids, new_item_id: int, n_ops: int, rng: random.Random) -> list:
+    rows = []
+    for kind in ("existing", "new"):
+        samples = []
+        for _ in range(n_ops):
+            cart_id = rng.randint(1, n_carts)
+            item_id = rng.choice(item_ids) if kind == "existing" else new_item_id
+            with Session(engine) as db:
+                before = db.execute(select(func.count()).select_from(models.CartItem).where(
+                    models.CartItem.cart_id == cart_id, models.CartItem.item_id == item_id
+                )).scalar() if kind == "new" else 1
+                if kind == "new" and before:
+                    continue  # el carrito ya recibió el ítem nuevo en otra iteración
+                start = time.perf_counter()
+                strategy(db, cart_id, item_id, 1)
+                db.commit()
+                samples.append(time.perf_counter() - start)
+        rows.append({"strategy": strategy.__name__, "line": kind, **summarize(samples)})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    n_carts = args.rows // args.lines
+    start = time.perf_counter()
+    item_ids = seed_carts(engine, n_carts=n_carts, lines_per_cart=args.lines)
+    with Session(engine) as db:
+        extra = models.Product(name="Bench new line", description="-", thumbnail="-", price=1.0,
+                               stock=10**9, type=models.ItemType.PRODUCT, care_instructions="-")
+        db.add(extra)
+        db.commit()
+        new_item_id = extra.id
+    previous_schema()
+    print(f"Sembradas {n_carts * args.lines} líneas en {time.perf_counter() - start:.0f}s")
+
+    rows = run(update_insert, n_carts, item_ids, new_item_id, args.ops, random.Random(args.seed))
+    migration_seconds = migrate()
+    rows += run(upsert, n_carts, item_ids, new_item_id, args.ops, random.Random(args.seed + 1))
+    print_table(rows, ["strategy", "line", "n", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+    print(f"Migración 0004 (fusión de duplicados + índice único) sobre {n_carts * args.lines} líneas: {migration_seconds:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/bench_catalog_cache.py
+"""
+Latencia de POST /cart/{id}/items/ con la caché de catálogo activada y desactivada.
+
+Con la caché activa, la respuesta toma nombre, precio y tipo de la caché en
+proceso y solo el stock (devuelto por el propio UPDATE de la reserva) sale de
+la base de datos.
+
+Uso:
+    python -m benchmarks.bench_catalog_cache [--items 100] [--requests 1000]
+"""
+
+import argparse
+import random
+
+from benchmarks.common import use_temp_sqlite, seed_carts, timed, summarize, print_table
+
+use_temp_sqlite()
+
+from fastapi.testclient import TestClient
+from app.cache import catalog_cache
+from app.database import engine
+from app.main import app
+
+def run(enabled: bool, item_ids, n_carts: int, n_requests: int):
+    maxsize = catalog_cache.maxsize
+    catalog_cache.clear()
+    if not enabled:
+        catalog_cache.maxsize = 0
+    before = catalog_cache.stats()
+    rng = random.Random(3)
+    samples = []
+    try:
+        with TestClient(app) as client:
+            for _ in range(n_requests):
+                elapsed, response = timed(
+                    client.post, f"/cart/{rng.randint(1, n_carts)}/items/",
+                    json={"item_id": rng.choice(item_ids), "quantity": 1},
+                )
+                assert response.status_code == 200, response.text
+                samples.append(elapsed)
+    finally:
+        catalog_cache.maxsize = maxsize
+    after = catalog_cache.stats()
+    return {
+        "cache": "on" if enabled else "off",
+        **summarize(samples),
+        "hits": after["hits"] - before["hits"],
+        "misses": after["misses"] - before["misses"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--carts", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1_000)
+    args = parser.parse_args()
+
+    item_ids = seed_carts(engine, args.carts, lines_per_cart=args.items)
+    rows = [run(enabled, item_ids, args.carts, args.requests) for enabled in (False, True)]
+    print_table(rows, ["cache", "n", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "hits", "misses"])
+
+if __name__ == "__main__":
+    main()
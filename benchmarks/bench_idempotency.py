@@ -0,0 +1,77 @@
+# benchmarks/bench_idempotency.py
+"""
+Coste de los reintentos de POST /cart/{id}/items/ con y sin Idempotency-Key.
+
+Cada operación se envía una vez y se reintenta '--retries' veces. Sin
+cabecera cada reintento vuelve a ejecutar la ruta (y a reservar stock); con
+cabecera, los reintentos devuelven la respuesta guardada por el almacén en
+memoria o por la tabla idempotency_keys.
+
+Uso:
+    python -m benchmarks.bench_idempotency [--operations 500] [--retries 3]
+"""
+
+import argparse
+
+from benchmarks.common import print_table, seed_carts, summarize, timed, use_temp_sqlite
+
+use_temp_sqlite()
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app import idempotency
+from app.database import engine
+from app.main import app
+
+def run(variant: str, operations: int, retries: int) -> list:
+    item_ids = seed_carts(engine, n_carts=operations, lines_per_cart=1)
+    idempotency.store = {
+        "none": None,
+        "memory": idempotency.MemoryIdempotencyStore(),
+        "sql": idempotency.SqlIdempotencyStore(engine),
+    }[variant]
+    statements = []
+    listener = lambda *args: statements.append(1)
+    samples = {"first": [], "retry": []}
+    queries = {"first": 0, "retry": 0}
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        with TestClient(app) as client:
+            for cart_id in range(1, operations + 1):
+                headers = {"Idempotency-Key": f"op-{cart_id}"} if variant != "none" else {}
+                for attempt in range(retries + 1):
+                    kind = "first" if attempt == 0 else "retry"
+                    statements.clear()
+                    elapsed, response = timed(
+                        client.post, f"/cart/{cart_id}/items/", json={"item_id": item_ids[0], "quantity": 1}, headers=headers
+                    )
+                    assert response.status_code == 200, response.text
+                    samples[kind].append(elapsed)
+                    queries[kind] += len(statements)
+            summary = client.get("/cart/1/summary/").json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return [
+        {
+            "store": variant, "request": kind,
+            "queries": round(queries[kind] / len(samples[kind]), 2),
+            # Unidades reservadas por operación: 1 si los reintentos no se ejecutan
+            "units_per_op": summary["total_quantity"] - 1,
+            **summarize(samples[kind]),
+        }
+        for kind in ("first", "retry")
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--operations", type=int, default=500)
+    parser.add_argument("--retries", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for variant in ("none", "memory", "sql"):
+        rows.extend(run(variant, args.operations, args.retries))
+    print_table(rows, ["store", "request", "queries", "units_per_op", "n", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+
+if __name__ == "__main__":
+    main()
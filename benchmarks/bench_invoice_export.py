@@ -0,0 +1,102 @@
+# benchmarks/bench_invoice_export.py
+"""
+GET /cart/{id}/invoice/ frente a /invoice/export/ (NDJSON y CSV) según el
+número de líneas del carrito.
+
+La aplicación se llama directamente por ASGI, descartando cada fragmento del
+cuerpo al recibirlo (como un cliente que lo escribe a disco), para medir el
+tiempo hasta el primer byte, el tiempo total y el pico de memoria Python
+asignada durante la petición (tracemalloc).
+
+Uso:
+    python -m benchmarks.bench_invoice_export [--lines 10 1000 100000] [--requests 5]
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from benchmarks.common import print_table, seed_carts, use_temp_sqlite
+
+use_temp_sqlite()
+
+from fastapi.testclient import TestClient
+from app.database import engine
+from app.main import app
+
+VARIANTS = {
+    "invoice": ("/cart/1/invoice/", b""),
+    "export_ndjson": ("/cart/1/invoice/export/", b"format=ndjson"),
+    "export_csv": ("/cart/1/invoice/export/", b"format=csv"),
+}
+
+async def request(path: str, query: bytes) -> dict:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query, "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    stats = {"first_byte": None, "bytes": 0, "status": None}
+    requested, finished = False, asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # StreamingResponse espera aquí una desconexión: llega al terminar el cuerpo
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            stats["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            if message.get("body") and stats["first_byte"] is None:
+                stats["first_byte"] = time.perf_counter()
+            stats["bytes"] += len(message.get("body", b""))
+            if not message.get("more_body"):
+                finished.set()
+
+    await app(scope, receive, send)
+    return stats
+
+def measure(variant: str, n_requests: int) -> dict:
+    path, query = VARIANTS[variant]
+    ttfb, total, peak = [], [], []
+    for _ in range(n_requests):
+        tracemalloc.start()
+        start = time.perf_counter()
+        stats = asyncio.run(request(path, query))
+        end = time.perf_counter()
+        peak.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        assert stats["status"] == 200, stats
+        ttfb.append(stats["first_byte"] - start)
+        total.append(end - start)
+    middle = lambda values: sorted(values)[len(values) // 2]
+    return {
+        "variant": variant, "kb": round(stats["bytes"] / 1024),
+        "ttfb_ms": round(middle(ttfb) * 1000, 1), "total_ms": round(middle(total) * 1000, 1),
+        "peak_mb": round(middle(peak) / 2**20, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lines", type=int, nargs="+", default=[10, 1000, 100_000])
+    parser.add_argument("--requests", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for lines in args.lines:
+        seed_carts(engine, n_carts=1, lines_per_cart=lines)
+        # El arranque (esquema, caché) con TestClient; las peticiones van directas por ASGI
+        with TestClient(app):
+            for variant in VARIANTS:
+                rows.append({"lines": lines, **measure(variant, args.requests)})
+    print_table(rows, ["lines", "variant", "kb", "ttfb_ms", "total_ms", "peak_mb"])
+
+if __name__ == "__main__":
+    main()
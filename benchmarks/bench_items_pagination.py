@@ -0,0 +1,72 @@
+# benchmarks/bench_items_pagination.py
+"""
+Paginación del catálogo: OFFSET (el listado anterior) frente a keyset (crud.get_items_page).
+
+Carga un catálogo de 'rows' ítems y mide el coste de leer una página a
+distintas profundidades. Con OFFSET la base de datos recorre y descarta todas
+las filas anteriores; con keyset la página N cuesta lo mismo que la 1.
+
+Uso:
+    python -m benchmarks.bench_items_pagination [--rows 1000000] [--page-size 100]
+"""
+
+import argparse
+
+from benchmarks.common import use_temp_sqlite, timed, summarize, print_table
+
+use_temp_sqlite()
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app import crud, models
+from app.database import Base, engine
+
+def offset_page(db: Session, skip: int, limit: int):
+    # Listado anterior a la paginación por clave (ORM con OFFSET)
+    return db.query(models.Item).offset(skip).limit(limit).all()
+
+def seed(rows: int):
+    # Solo la tabla base 'items': el listado no lee 'products' ni 'events'
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    chunk = 50_000
+    with engine.begin() as conn:
+        for start in range(1, rows + 1, chunk):
+            conn.execute(insert(models.Item.__table__), [
+                {
+                    "id": i, "name": f"Item {i}", "description": "-", "thumbnail": "-",
+                    "price": 9.99, "price_cents": 999, "stock": 10,
+                    "type": models.ItemType.EVENT.name if i % 4 == 0 else models.ItemType.PRODUCT.name,
+                }
+                for i in range(start, min(start + chunk, rows + 1))
+            ])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    elapsed, _ = timed(seed, args.rows)
+    print(f"Catálogo de {args.rows} filas cargado en {elapsed:.1f}s")
+
+    depths = [d for d in (0, 10_000, 100_000, 500_000, args.rows - args.page_size) if d < args.rows]
+    rows = []
+    with Session(engine) as db:
+        for depth in depths:
+            offset = [timed(offset_page, db, skip=depth, limit=args.page_size)[0] for _ in range(args.repeat)]
+            db.expunge_all()
+            cursor = crud.encode_item_cursor(depth) if depth else None
+            keyset = [timed(crud.get_items_page, db, limit=args.page_size, cursor=cursor)[0] for _ in range(args.repeat)]
+            events = [
+                timed(crud.get_items_page, db, limit=args.page_size, cursor=cursor, item_type=models.ItemType.EVENT)[0]
+                for _ in range(args.repeat)
+            ]
+            rows.append({"depth": depth, "strategy": "offset", **summarize(offset)})
+            rows.append({"depth": depth, "strategy": "keyset", **summarize(keyset)})
+            rows.append({"depth": depth, "strategy": "keyset type=EVENT", **summarize(events)})
+    print_table(rows, ["depth", "strategy", "n", "mean_ms", "p50_ms", "p95_ms"])
+
+if __name__ == "__main__":
+    main()
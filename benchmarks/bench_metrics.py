@@ -0,0 +1,92 @@
+# benchmarks/bench_metrics.py
+"""
+Coste de registrar métricas: MetricsMiddleware y los eventos de cursor por consulta.
+
+- middleware: la misma aplicación ASGI mínima llamada directamente, con y sin
+  MetricsMiddleware; la diferencia es el coste de registro por petición.
+- cursor: 'SELECT 1' sobre SQLite en memoria con y sin instrument_engine,
+  dentro de una petición en curso; la diferencia es el coste por consulta.
+  La fila 'empty listeners' aísla lo que cuesta a SQLAlchemy despachar
+  cualquier evento de cursor, con oyentes que no hacen nada.
+
+Uso:
+    python -m benchmarks.bench_metrics [--iterations 200000] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, event
+from app.metrics import MetricsMiddleware, MetricsRegistry, RequestStats, current_request, instrument_engine
+from benchmarks.common import print_table
+
+class FakeRoute:
+    path = "/cart/{cart_id}/"
+
+async def bare_app(scope, receive, send):
+    scope["route"] = FakeRoute
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+async def send(message):
+    pass
+
+def time_asgi(app, iterations: int) -> float:
+    async def loop():
+        for _ in range(iterations):
+            await app({"type": "http", "method": "GET", "path": "/cart/1/"}, receive, send)
+
+    start = time.perf_counter()
+    asyncio.run(loop())
+    return (time.perf_counter() - start) / iterations
+
+def empty_listeners(engine):
+    event.listen(engine, "before_cursor_execute", lambda *args: None)
+    event.listen(engine, "after_cursor_execute", lambda *args: None)
+
+def time_queries(instrument, iterations: int) -> float:
+    engine = create_engine("sqlite://")
+    if instrument is not None:
+        instrument(engine)
+    token = current_request.set(RequestStats())
+    try:
+        with engine.connect() as conn:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                conn.exec_driver_sql("SELECT 1")
+            elapsed = time.perf_counter() - start
+    finally:
+        current_request.reset(token)
+        engine.dispose()
+    return elapsed / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    middleware = MetricsMiddleware(bare_app, registry=MetricsRegistry())
+    rows = []
+    bare = min(time_asgi(bare_app, args.iterations) for _ in range(args.repeat))
+    measured = min(time_asgi(middleware, args.iterations) for _ in range(args.repeat))
+    rows.append({"what": "per request", "without_us": round(bare * 1e6, 3), "with_us": round(measured * 1e6, 3),
+                 "overhead_us": round((measured - bare) * 1e6, 3)})
+
+    query_iterations = args.iterations // 4
+    plain = min(time_queries(None, query_iterations) for _ in range(args.repeat))
+    for what, instrument in (("per query (empty listeners)", empty_listeners), ("per query", instrument_engine)):
+        hooked = min(time_queries(instrument, query_iterations) for _ in range(args.repeat))
+        rows.append({"what": what, "without_us": round(plain * 1e6, 3), "with_us": round(hooked * 1e6, 3),
+                     "overhead_us": round((hooked - plain) * 1e6, 3)})
+    print_table(rows, ["what", "without_us", "with_us", "overhead_us"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# benchmarks/bench_multi_cart.py
+"""
+Latencia por petición en función del número de carritos.
+
+Cada carrito se resuelve por su clave primaria, así que la latencia de
+GET /cart/{id}/ y POST /cart/{id}/items/ debería mantenerse plana aunque
+la tabla 'carts' crezca varios órdenes de magnitud.
+
+Uso:
+    python -m benchmarks.bench_multi_cart [--carts 1 1000 100000] [--requests 500]
+"""
+
+import argparse
+import random
+
+from benchmarks.common import use_temp_sqlite, seed_carts, timed, summarize, print_table
+
+use_temp_sqlite()
+
+from fastapi.testclient import TestClient
+from app.database import engine
+from app.main import app
+
+def run(n_carts: int, n_requests: int):
+    item_id = seed_carts(engine, n_carts)[0]
+    rng = random.Random(42)
+    reads, writes = [], []
+    with TestClient(app) as client:
+        for _ in range(n_requests):
+            cart_id = rng.randint(1, n_carts)
+            elapsed, response = timed(client.get, f"/cart/{cart_id}/")
+            assert response.status_code == 200, response.text
+            reads.append(elapsed)
+            elapsed, response = timed(
+                client.post, f"/cart/{cart_id}/items/",
+                json={"item_id": item_id, "quantity": 1},
+            )
+            assert response.status_code == 200, response.text
+            writes.append(elapsed)
+    rows = []
+    for route, samples in (("GET /cart/{id}/", reads), ("POST /cart/{id}/items/", writes)):
+        rows.append({"carts": n_carts, "route": route, **summarize(samples)})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--carts", type=int, nargs="+", default=[1, 1_000, 100_000])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    rows = []
+    for n in args.carts:
+        rows.extend(run(n, args.requests))
+    print_table(rows, ["carts", "route", "n", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/bench_serialization.py
+"""
+Serialización de la respuesta del carrito: modelos Pydantic frente a FastJSONResponse.
+
+No usa base de datos: parte de filas sintéticas con la forma de las que
+devuelve la consulta del carrito y mide solo la construcción y serialización.
+
+- 'pydantic': un schemas.CartItem por línea dentro de schemas.Cart, validado
+  de nuevo contra response_model y volcado a JSON, como hace FastAPI.
+- 'fast': diccionarios de crud.cart_line_payload serializados con orjson.
+
+Uso:
+    python -m benchmarks.bench_serialization [--lines 1 50 500 5000] [--repeat 200]
+"""
+
+import argparse
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from pydantic import TypeAdapter
+from app import crud, models, schemas
+from app.responses import FastJSONResponse
+from benchmarks.common import timed, print_table
+
+CART_ID = 1
+cart_adapter = TypeAdapter(schemas.Cart)
+
+def synthetic_rows(lines: int):
+    return [
+        (i, i, 1 + i % 5, f"Item {i}", "Artículo de catálogo", "https://example.com/t.jpg",
+         9.99 + i % 7, 100, models.ItemType.PRODUCT if i % 2 else models.ItemType.EVENT)
+        for i in range(1, lines + 1)
+    ]
+
+def pydantic_response(rows) -> bytes:
+    cart = schemas.Cart(
+        id=CART_ID,
+        items=[crud._cart_line_from_row(CART_ID, row) for row in rows],
+        total_quantity=sum(row[2] for row in rows),
+        total_price=12.5,
+    )
+    validated = cart_adapter.validate_python(cart, from_attributes=True)
+    return cart_adapter.dump_json(validated)
+
+def fast_response(rows) -> bytes:
+    payload = {
+        "id": CART_ID,
+        "items": [crud.cart_line_payload(CART_ID, row) for row in rows],
+        "total_quantity": sum(row[2] for row in rows),
+        "total_price": 12.5,
+    }
+    return FastJSONResponse(payload).body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 50, 500, 5000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = []
+    for lines in args.lines:
+        data = synthetic_rows(lines)
+        assert pydantic_response(data) == fast_response(data)
+        for variant, fn in (("pydantic", pydantic_response), ("fast", fast_response)):
+            best = min(timed(fn, data)[0] for _ in range(args.repeat))
+            rows.append({
+                "lines": lines, "variant": variant,
+                "total_ms": round(best * 1000, 3), "us_per_line": round(best * 1e6 / lines, 2),
+            })
+    print_table(rows, ["lines", "variant", "total_ms", "us_per_line"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# benchmarks/bench_startup.py
+"""
+Arranque en frío de un worker: del primer import de app.main a la primera
+respuesta.
+
+Cada repetición es un proceso Python nuevo que importa app.main, ejecuta el
+lifespan de la aplicación y sirve GET /cart/1/summary/ en proceso (ASGI). La
+base de datos es un SQLite en fichero con el esquema ya migrado, como la de
+un worker que arranca durante un despliegue. Se mide con cada valor de
+DB_SCHEMA_MODE; el tiempo por fase que registra la propia app se ve en
+/metrics (app_startup_seconds).
+
+Uso:
+    python -m benchmarks.bench_startup [--repeat 15] [--modes check create skip]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import print_table, use_temp_sqlite
+
+# Se ejecuta en el proceso hijo: tiempos en milisegundos desde su arranque
+CHILD = r"""
+import asyncio, json, time
+import httpx
+t0 = time.perf_counter()
+from app.main import app
+t_import = time.perf_counter()
+
+async def first_request():
+    async with app.router.lifespan_context(app):
+        t_startup = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get("/cart/1/summary/")
+        assert response.status_code == 200, response.text
+        return t_startup, time.perf_counter()
+
+t_startup, t_first = asyncio.run(first_request())
+try:
+    from app.startup import report
+    phases = {f"{name}_ms": seconds * 1000 for name, seconds in report.phases.items() if name != "import"}
+except ImportError:
+    phases = {}
+print(json.dumps({
+    **phases,
+    "import_ms": (t_import - t0) * 1000,
+    "startup_ms": (t_startup - t_import) * 1000,
+    "first_request_ms": (t_first - t_startup) * 1000,
+    "total_ms": (t_first - t0) * 1000,
+}))
+"""
+
+def prepare_database(url: str):
+    """Esquema migrado con Alembic (como en un despliegue) y un carrito."""
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import create_engine, text
+    from app.database import Base
+    from app import models
+
+    engine = create_engine(url)
+    config = Config()
+    config.set_main_option("script_location", "alembic")
+    with engine.begin() as conn:
+        config.attributes["connection"] = conn
+        command.upgrade(config, "head")
+    # Sin migraciones en el árbol el esquema solo puede venir de create_all
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO carts (id, total_quantity, total_price_cents, version) VALUES (1, 0, 0, 0)"))
+    engine.dispose()
+
+def run_child(env: dict) -> dict:
+    output = subprocess.run([sys.executable, "-c", CHILD], env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--modes", nargs="+", default=["check", "create"], help="valores de DB_SCHEMA_MODE")
+    args = parser.parse_args()
+
+    url = use_temp_sqlite("startup.db")
+    prepare_database(url)
+    rows = []
+    for mode in args.modes:
+        env = {**os.environ, "DATABASE_URL": url, "DB_SCHEMA_MODE": mode}
+        samples = [run_child(env) for _ in range(args.repeat)]
+        row = {"schema_mode": mode}
+        for key in samples[0]:
+            row[key] = round(statistics.median(sample[key] for sample in samples), 1)
+        rows.append(row)
+    # schema_ms y warmup_ms son las fases que registra la propia app (incluidas en startup_ms)
+    print_table(rows, ["schema_mode", "import_ms", "startup_ms", "schema_ms", "warmup_ms", "first_request_ms", "total_ms"])
+
+if __name__ == "__main__":
+    main()
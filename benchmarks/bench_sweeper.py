@@ -0,0 +1,99 @@
+# benchmarks/bench_sweeper.py
+"""
+Recuperación de carritos abandonados: sweep() por lotes frente a borrado por filas con el ORM.
+
+- orm: carga cada carrito caducado, devuelve el stock línea a línea con
+  release_stock y lo borra con session.delete (cascada del ORM), con un
+  commit por lote.
+- sweep: app.sweeper.sweep, cuatro sentencias por lote (UPDATE ... FROM con
+  el agregado por ítem y DELETE de líneas y carritos).
+
+La duración de cada lote es el tiempo que la transacción retiene los
+bloqueos de escritura (en SQLite, toda la base de datos), es decir, lo que
+como mucho espera una petición que coincide con él.
+
+Uso:
+    python -m benchmarks.bench_sweeper [--carts 20000] [--lines 5] [--batch-sizes 100 500 2000]
+"""
+
+import argparse
+import time
+from datetime import timedelta
+
+from benchmarks.common import print_table, seed_carts, summarize, use_temp_sqlite
+
+use_temp_sqlite()
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from app import crud, models
+from app.database import engine
+from app.sweeper import reclaim_batch
+
+TTL = 3600
+
+def prepare(n_carts: int, lines: int):
+    seed_carts(engine, n_carts=n_carts, lines_per_cart=lines)
+    with engine.begin() as conn:
+        conn.execute(update(models.Cart).values(last_activity_at=models.utcnow() - timedelta(seconds=TTL * 2)))
+
+def total_stock() -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.sum(models.Item.stock))).scalar()
+
+def orm_batch(cutoff, batch_size: int) -> int:
+    with Session(engine) as db:
+        carts = db.query(models.Cart).filter(models.Cart.last_activity_at < cutoff).limit(batch_size).all()
+        for cart in carts:
+            for line in cart.items:
+                crud.release_stock(db, line.item_id, line.quantity)
+            db.delete(cart)
+        db.commit()
+        return len(carts)
+
+def sweep_batch(cutoff, batch_size: int) -> int:
+    with engine.begin() as conn:
+        return reclaim_batch(conn, cutoff, batch_size).carts
+
+def run(strategy, batch_size: int, n_carts: int, lines: int) -> dict:
+    prepare(n_carts, lines)
+    stock_before = total_stock()
+    cutoff = models.utcnow() - timedelta(seconds=TTL)
+    durations = []
+    reclaimed = 0
+    start = time.perf_counter()
+    while True:
+        batch_start = time.perf_counter()
+        carts = strategy(cutoff, batch_size)
+        durations.append(time.perf_counter() - batch_start)
+        reclaimed += carts
+        if carts < batch_size:
+            break
+    elapsed = time.perf_counter() - start
+    assert reclaimed == n_carts
+    assert total_stock() - stock_before == n_carts * lines
+    batch = summarize(durations)
+    return {
+        "strategy": strategy.__name__.replace("_batch", ""),
+        "batch_size": batch_size,
+        "carts_per_s": round(reclaimed / elapsed),
+        "elapsed_s": round(elapsed, 2),
+        "batch_p50_ms": batch["p50_ms"],
+        "batch_max_ms": round(max(durations) * 1000, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--carts", type=int, default=20_000)
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 500, 2000])
+    args = parser.parse_args()
+
+    rows = []
+    for batch_size in args.batch_sizes:
+        for strategy in (orm_batch, sweep_batch):
+            rows.append(run(strategy, batch_size, args.carts, args.lines))
+    print_table(rows, ["strategy", "batch_size", "carts_per_s", "elapsed_s", "batch_p50_ms", "batch_max_ms"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/common.py
+
+import os
+import statistics
+import tempfile
+import time
+
+def use_temp_sqlite(name: str = "bench.db") -> str:
+    """
+    Apunta DATABASE_URL a un fichero SQLite temporal. Debe llamarse antes de
+    importar 'app', ya que el engine se construye al importar 'app.database'.
+    Los benchmarks crean el esquema con create_all, no con Alembic, así que
+    el arranque de la app lo crea en lugar de comprobar la revisión.
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="cart_bench_"), name)
+    url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("DB_SCHEMA_MODE", "create")
+    return url
+
+def seed_carts(engine, n_carts: int, lines_per_cart: int = 1, stock: int = 10**9):
+    """
+    Recrea el esquema y carga 'lines_per_cart' productos y 'n_carts' carritos
+    con una línea por producto, usando inserciones masivas. Devuelve los ids
+    de los productos creados.
+    """
+    from sqlalchemy import insert
+    from sqlalchemy.orm import Session
+    from app import models
+    from app.database import Base
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        db.add_all([
+            models.Product(
+                name=f"Bench product {i}", description="-", thumbnail="-",
+                price=9.99, stock=stock, type=models.ItemType.PRODUCT,
+                care_instructions="-",
+            )
+            for i in range(lines_per_cart)
+        ])
+        db.commit()
+        item_ids = [row.id for row in db.query(models.Item.id).order_by(models.Item.id)]
+        chunk = 50_000
+        for start in range(1, n_carts + 1, chunk):
+            ids = range(start, min(start + chunk, n_carts + 1))
+            db.execute(insert(models.Cart), [
+                {"id": i, "total_quantity": len(item_ids), "total_price_cents": 999 * len(item_ids)}
+                for i in ids
+            ])
+            db.execute(insert(models.CartItem), [
+                {"cart_id": i, "item_id": item_id, "quantity": 1}
+                for i in ids for item_id in item_ids
+            ])
+        db.commit()
+    return item_ids
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def summarize(samples):
+    """Resume una lista de latencias (segundos) en milisegundos."""
+    ordered = sorted(samples)
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(pct(0.50), 3),
+        "p95_ms": round(pct(0.95), 3),
+        "p99_ms": round(pct(0.99), 3),
+    }
+
+def print_table(rows, columns):
+    widths = [max(len(str(c)), *(len(str(r.get(c, ""))) for r in rows)) for c in columns]
+    print("  ".join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for r in rows:
+        print("  ".join(str(r.get(c, "")).ljust(w) for c, w in zip(columns, widths)))
@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from app.database import SessionLocal, engine
 from app import models
+from app.importer import import_catalog
 from dotenv import load_dotenv
 
 # Cargar variables de entorno desde .env.docker
@@ -48,7 +49,16 @@ def seed_items(db: Session):
         deleted_items = db.query(models.Item).delete()
         print(f"Eliminados {deleted_items} Items existentes.")
 
-        # Confirmar las eliminaciones
+        # Los carritos se conservan vacíos: totales a cero y nueva versión, para
+        # que el resumen sea correcto y los ETag guardados por los clientes caduquen
+        emptied_carts = db.query(models.Cart).update({
+            models.Cart.total_quantity: 0,
+            models.Cart.total_price_cents: 0,
+            models.Cart.version: models.Cart.version + 1,
+        }, synchronize_session=False)
+        print(f"Vaciados {emptied_carts} Carts existentes.")
+
+        # Confirmar las eliminaciones (en la misma transacción que los totales)
         db.commit()
 
         # 5. Reiniciar la secuencia de items_id_seq a 1
@@ -57,30 +67,28 @@ def seed_items(db: Session):
         # Confirmar el reinicio de la secuencia
         db.commit()
 
-        # 6. Crear nuevos ítems de prueba
-        item1 = models.Product(
-            name="Gafas de sol Carey",
-            description="Gafas de sol de alta calidad con protección UV.",
-            thumbnail="https://example.com/thumbnails/gafas_carey.jpg",
-            price=39.99,
-            stock=10,
-            type=models.ItemType.PRODUCT,
-            care_instructions="Limpiar con un paño suave y almacenar en un estuche."
-        )
-        item2 = models.Event(
-            name="Red Hot Chili Peppers en Madrid",
-            description="Concierto de Red Hot Chili Peppers en el estadio Santiago Bernabéu.",
-            thumbnail="https://example.com/thumbnails/red_hot_chili_peppers.jpg",
-            price=60.00,
-            stock=20,
-            type=models.ItemType.EVENT,
-            event_date="2024-12-31"
-        )
-
-        # Agregar los nuevos ítems a la sesión
-        db.add_all([item1, item2])
-        db.commit()
-        print("Ítems de prueba insertados correctamente.")
+        # 6. Crear nuevos ítems de prueba con el importador masivo
+        stats = import_catalog(engine, [
+            {
+                "name": "Gafas de sol Carey",
+                "description": "Gafas de sol de alta calidad con protección UV.",
+                "thumbnail": "https://example.com/thumbnails/gafas_carey.jpg",
+                "price": 39.99,
+                "stock": 10,
+                "type": models.ItemType.PRODUCT.value,
+                "care_instructions": "Limpiar con un paño suave y almacenar en un estuche.",
+            },
+            {
+                "name": "Red Hot Chili Peppers en Madrid",
+                "description": "Concierto de Red Hot Chili Peppers en el estadio Santiago Bernabéu.",
+                "thumbnail": "https://example.com/thumbnails/red_hot_chili_peppers.jpg",
+                "price": 60.00,
+                "stock": 20,
+                "type": models.ItemType.EVENT.value,
+                "event_date": "2024-12-31",
+            },
+        ])
+        print(f"{stats.rows} ítems de prueba insertados correctamente.")
 
     except Exception as e:
         db.rollback()
@@ -1,19 +1,35 @@
 # tests/conftest.py
 
+import os
+
+# La app crea su propio engine al importarse; evitar que apunte a PostgreSQL
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+# Sin migraciones en la base de datos en memoria de la app: crear las tablas al arrancar
+os.environ.setdefault("DB_SCHEMA_MODE", "create")
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.cache import catalog_cache, stock_shard_cache
 from app.database import Base, get_db
 from app.main import app
+from app.metrics import instrument_engine
+from app.query_budget import QueryBudget
 
-# Usar una base de datos en memoria para las pruebas
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+# Una base de datos en memoria (StaticPool: una sola conexión) compartida por
+# todos los módulos de pruebas: lo que crea un módulo sigue ahí en los siguientes
+SQLALCHEMY_DATABASE_URL = "sqlite://"
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Como en app.main, para que /metrics cuente las consultas de las pruebas
+instrument_engine(engine)
 
 # Crear las tablas
 Base.metadata.create_all(bind=engine)
@@ -30,11 +46,33 @@ def db():
 # Fixture para el cliente de pruebas
 @pytest.fixture(scope="module")
 def client(db):
+    # La sesión es compartida por el módulo; la cierra el fixture 'db'
     def override_get_db():
-        try:
-            yield db
-        finally:
-            db.close()
+        yield db
     app.dependency_overrides[get_db] = override_get_db
     with TestClient(app) as c:
         yield c
+
+# Fixture para un carrito nuevo por módulo
+@pytest.fixture(scope="module")
+def cart_id(client):
+    response = client.post("/cart/")
+    assert response.status_code == 201
+    return response.json()["id"]
+
+# Algunos módulos usan además bases de datos propias (ficheros temporales) cuyos
+# ids coinciden con los de la compartida: no arrastrar entradas de catálogo
+@pytest.fixture(scope="module", autouse=True)
+def clear_catalog_cache():
+    catalog_cache.clear()
+    stock_shard_cache.clear()
+    yield
+    catalog_cache.clear()
+    stock_shard_cache.clear()
+
+# Presupuesto de sentencias SQL: with assert_max_queries(2): client.get(...)
+@pytest.fixture
+def assert_max_queries():
+    def _assert_max_queries(max_queries, max_repeats=2):
+        return QueryBudget(engine, max_queries=max_queries, max_repeats=max_repeats)
+    return _assert_max_queries
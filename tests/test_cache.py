@@ -0,0 +1,58 @@
+# tests/test_cache.py
+
+from app import crud, models, schemas
+from app.cache import LRUCache, catalog_cache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_lru_eviction_and_counters():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    assert cache.get(1) == "a"  # 1 pasa a ser el más reciente
+    cache.set(3, "c")
+    assert cache.get(2) is None
+    assert cache.get(3) == "c"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["size"]) == (2, 1, 1, 2)
+
+def test_ttl_expiration_and_invalidation():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+    cache.set("k", 1)
+    clock.now = 4.9
+    assert cache.get("k") == 1
+    clock.now = 5.0
+    assert cache.get("k") is None
+    assert cache.stats()["expirations"] == 1
+
+    cache.set("k", 2)
+    cache.invalidate("k")
+    assert cache.get("k") is None
+    assert cache.stats()["invalidations"] == 1
+
+def test_disabled_cache_never_stores():
+    cache = LRUCache(maxsize=0, ttl=60)
+    cache.set(1, "a")
+    assert cache.get(1) is None
+    assert cache.stats()["size"] == 0
+
+def test_catalog_entry_is_cached_and_invalidated(db):
+    product = crud.create_product(db, schemas.ProductCreate(
+        name="Gorra", description="-", thumbnail="-", price=15.0, stock=5,
+        type=schemas.ItemType.PRODUCT, care_instructions="-"
+    ))
+    hits = catalog_cache.hits
+    assert crud.get_catalog_entry(db, product.id).price == 15.0
+    assert crud.get_catalog_entry(db, product.id).price == 15.0
+    assert catalog_cache.hits == hits + 1
+
+    # Un cambio de precio a través del ORM invalida la entrada
+    db.get(models.Item, product.id).price = 12.5
+    db.commit()
+    assert crud.get_catalog_entry(db, product.id).price == 12.5
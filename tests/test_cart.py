@@ -1,7 +1,12 @@
 # tests/test_cart.py
 
+import csv
+import io
+import json
+
 import pytest
-from app import models, schemas
+from app import crud, models, schemas
+from app.routers import cart as cart_router
 from sqlalchemy.orm import Session
 
 @pytest.fixture(scope="module")
@@ -32,39 +37,326 @@ def test_items(db: Session):
     db.refresh(item2)
     return [item1, item2]
 
-def test_add_item_to_cart(client, test_items):
-    response = client.post("/cart/items/", json={"item_id": test_items[0].id, "quantity": 3})
+def test_add_item_to_cart(client, cart_id, test_items):
+    response = client.post(f"/cart/{cart_id}/items/", json={"item_id": test_items[0].id, "quantity": 3})
     assert response.status_code == 200
     data = response.json()
     assert data["item_id"] == test_items[0].id
     assert data["quantity"] == 3
 
-def test_add_existing_item_to_cart(client, test_items):
-    response = client.post("/cart/items/", json={"item_id": test_items[0].id, "quantity": 2})
+def test_add_existing_item_to_cart(client, cart_id, test_items):
+    response = client.post(f"/cart/{cart_id}/items/", json={"item_id": test_items[0].id, "quantity": 2})
     assert response.status_code == 200
     data = response.json()
     assert data["quantity"] == 5  # 3 + 2
 
-def test_add_item_out_of_stock(client, test_items):
-    response = client.post("/cart/items/", json={"item_id": test_items[0].id, "quantity": 100})
+def test_add_item_out_of_stock(client, cart_id, test_items):
+    response = client.post(f"/cart/{cart_id}/items/", json={"item_id": test_items[0].id, "quantity": 100})
     assert response.status_code == 400
     assert response.json()["detail"] == f"Item with id {test_items[0].id} is out of stock."
 
-def test_update_item_quantity(client, test_items):
-    response = client.put(f"/cart/items/{test_items[0].id}/", json={"quantity": 2})
+def test_add_zero_quantity_is_rejected(client, cart_id, test_items):
+    # Sin líneas vacías: 0 unidades no se pueden añadir, ni de una en una ni por lotes
+    line = {"item_id": test_items[1].id, "quantity": 0}
+    assert client.post(f"/cart/{cart_id}/items/", json=line).status_code == 422
+    assert client.post(f"/cart/{cart_id}/items/batch/", json=[line]).status_code == 422
+
+def test_update_item_quantity(client, cart_id, test_items):
+    response = client.put(f"/cart/{cart_id}/items/{test_items[0].id}/", json={"quantity": 2})
     assert response.status_code == 200
     data = response.json()
     assert data["quantity"] == 2
 
-def test_remove_item_from_cart(client, test_items):
-    response = client.delete(f"/cart/items/{test_items[0].id}/")
+def test_remove_item_from_cart(client, cart_id, test_items):
+    response = client.delete(f"/cart/{cart_id}/items/{test_items[0].id}/")
     assert response.status_code == 200
     assert response.json()["detail"] == "Item removed from cart successfully."
 
-def test_get_empty_cart(client):
-    response = client.get("/cart/")
+def test_get_empty_cart(client, cart_id):
+    response = client.get(f"/cart/{cart_id}/")
     assert response.status_code == 200
     data = response.json()
+    assert data["id"] == cart_id
     assert data["items"] == []
     assert data["total_quantity"] == 0
     assert data["total_price"] == 0.0
+
+def test_carts_are_independent(client, cart_id, test_items):
+    other_cart_id = client.post("/cart/").json()["id"]
+    assert other_cart_id != cart_id
+    response = client.post(f"/cart/{other_cart_id}/items/", json={"item_id": test_items[1].id, "quantity": 1})
+    assert response.status_code == 200
+    assert response.json()["cart_id"] == other_cart_id
+    assert client.get(f"/cart/{cart_id}/").json()["items"] == []
+    assert len(client.get(f"/cart/{other_cart_id}/").json()["items"]) == 1
+
+def test_unknown_cart_returns_404(client, test_items):
+    response = client.post("/cart/999999/items/", json={"item_id": test_items[0].id, "quantity": 1})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Cart not found."
+    assert client.get("/cart/999999/").status_code == 404
+    assert client.get("/cart/999999/invoice/").status_code == 404
+
+def test_batch_add_items(client, test_items):
+    batch_cart_id = client.post("/cart/").json()["id"]
+    response = client.post(f"/cart/{batch_cart_id}/items/batch/", json=[
+        {"item_id": test_items[0].id, "quantity": 2},
+        {"item_id": test_items[1].id, "quantity": 3},
+        {"item_id": test_items[0].id, "quantity": 1},
+    ])
+    assert response.status_code == 200
+    data = response.json()
+    assert [(line["item_id"], line["quantity"]) for line in data] == [(test_items[0].id, 3), (test_items[1].id, 3)]
+    assert data[0]["subtotal"] == round(3 * 39.99, 2)
+    assert data[0]["item"]["stock"] == 7
+
+    # Todo o nada: si una línea falla no se aplica ninguna
+    response = client.post(f"/cart/{batch_cart_id}/items/batch/", json=[
+        {"item_id": test_items[0].id, "quantity": 1},
+        {"item_id": test_items[1].id, "quantity": 1000},
+    ])
+    assert response.status_code == 400
+    assert response.json()["detail"] == f"Item with id {test_items[1].id} is out of stock."
+    assert client.get(f"/cart/{batch_cart_id}/").json()["total_quantity"] == 6
+
+    response = client.put(f"/cart/{batch_cart_id}/items/batch/", json=[
+        {"item_id": test_items[0].id, "quantity": 0},
+        {"item_id": test_items[1].id, "quantity": 5},
+    ])
+    assert response.status_code == 200
+    assert [(line["item_id"], line["quantity"]) for line in response.json()] == [(test_items[1].id, 5)]
+
+    response = client.request("DELETE", f"/cart/{batch_cart_id}/items/batch/", json=[test_items[1].id])
+    assert response.status_code == 200
+    assert client.get(f"/cart/{batch_cart_id}/").json()["items"] == []
+    assert client.get(f"/cart/{batch_cart_id}/").json()["total_quantity"] == 0
+
+def test_batch_add_uses_constant_statements(client, db):
+    from sqlalchemy import event
+    from tests.conftest import engine
+
+    items = [
+        models.Product(
+            name=f"Lote {i}", description="-", thumbnail="-", price=1.0,
+            stock=100, type=models.ItemType.PRODUCT, care_instructions="-"
+        )
+        for i in range(20)
+    ]
+    db.add_all(items)
+    db.commit()
+    item_ids = [item.id for item in items]
+
+    def statements_for(lines):
+        batch_cart_id = client.post("/cart/").json()["id"]
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = client.post(f"/cart/{batch_cart_id}/items/batch/", json=[
+                {"item_id": item_id, "quantity": 1} for item_id in item_ids[:lines]
+            ])
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert response.status_code == 200
+        assert len(response.json()) == lines
+        return len(statements)
+
+    assert statements_for(2) == statements_for(20)
+
+def test_cart_summary_tracks_mutations(client, test_items):
+    summary_cart_id = client.post("/cart/").json()["id"]
+    summary = client.get(f"/cart/{summary_cart_id}/summary/").json()
+    assert summary == {"id": summary_cart_id, "total_quantity": 0, "total_price": 0.0, "version": 0}
+
+    client.post(f"/cart/{summary_cart_id}/items/", json={"item_id": test_items[0].id, "quantity": 2})
+    client.post(f"/cart/{summary_cart_id}/items/batch/", json=[{"item_id": test_items[1].id, "quantity": 1}])
+    client.put(f"/cart/{summary_cart_id}/items/{test_items[0].id}/", json={"quantity": 1})
+    summary = client.get(f"/cart/{summary_cart_id}/summary/").json()
+    assert summary["total_quantity"] == 2
+    assert summary["total_price"] == 99.99
+    assert summary["version"] == 3
+
+    cart = client.get(f"/cart/{summary_cart_id}/").json()
+    assert (cart["total_quantity"], cart["total_price"]) == (summary["total_quantity"], summary["total_price"])
+
+    client.delete(f"/cart/{summary_cart_id}/items/{test_items[0].id}/")
+    client.delete(f"/cart/{summary_cart_id}/items/{test_items[1].id}/")
+    summary = client.get(f"/cart/{summary_cart_id}/summary/").json()
+    assert (summary["total_quantity"], summary["total_price"], summary["version"]) == (0, 0.0, 5)
+    assert client.get("/cart/999999/summary/").status_code == 404
+
+def test_cart_totals_are_exact_cents(client, db):
+    # 0.1 y 0.07 no son exactos en coma flotante: cien sumas en float se desvían
+    cheap = [
+        models.Product(name=f"Céntimos {price}", description="-", thumbnail="-", price=price,
+                       stock=1000, type=schemas.ItemType.PRODUCT, care_instructions="-")
+        for price in (0.1, 0.07)
+    ]
+    db.add_all(cheap)
+    db.commit()
+    cents_cart_id = client.post("/cart/").json()["id"]
+    for _ in range(100):
+        client.post(f"/cart/{cents_cart_id}/items/", json={"item_id": cheap[0].id, "quantity": 1})
+        client.post(f"/cart/{cents_cart_id}/items/batch/", json=[{"item_id": cheap[1].id, "quantity": 3}])
+    client.put(f"/cart/{cents_cart_id}/items/{cheap[1].id}/", json={"quantity": 299})
+
+    invoice = client.get(f"/cart/{cents_cart_id}/invoice/").json()
+    assert [line["subtotal"] for line in invoice["items"]] == [10.0, 20.93]
+    assert invoice["total_price"] == 30.93
+    db.expire_all()
+    assert db.get(models.Cart, cents_cart_id).total_price_cents == 3093
+    crud.recalculate_cart_totals(db, cents_cart_id)
+    db.expire_all()
+    assert db.get(models.Cart, cents_cart_id).total_price_cents == 3093
+
+def test_half_cent_prices_round_the_same_in_lines_and_totals(client, db):
+    # Medio céntimo: redondeado en Python y en SQL debe dar el mismo importe
+    half_cents = [
+        models.Product(name=f"Medio céntimo {price}", description="-", thumbnail="-", price=price,
+                       stock=100, type=schemas.ItemType.PRODUCT, care_instructions="-")
+        for price in (0.125, 1.005, 2.675)
+    ]
+    db.add_all(half_cents)
+    db.commit()
+    assert [item.price_cents for item in half_cents] == [13, 101, 268]
+    half_cart_id = client.post("/cart/").json()["id"]
+    added = [client.post(f"/cart/{half_cart_id}/items/", json={"item_id": item.id, "quantity": 3}).json()
+             for item in half_cents]
+    assert [line["subtotal"] for line in added] == [0.39, 3.03, 8.04]
+
+    lines_total = round(sum(line["subtotal"] for line in added), 2)
+    assert lines_total == 11.46
+    for path in (f"/cart/{half_cart_id}/", f"/cart/{half_cart_id}/summary/", f"/cart/{half_cart_id}/invoice/"):
+        assert client.get(path).json()["total_price"] == lines_total
+    invoice = client.get(f"/cart/{half_cart_id}/invoice/").json()
+    assert [line["subtotal"] for line in invoice["items"]] == [0.39, 3.03, 8.04]
+    crud.recalculate_cart_totals(db, half_cart_id)
+    db.expire_all()
+    assert db.get(models.Cart, half_cart_id).total_price_cents == 1146
+
+def test_conditional_get_answers_304_while_nothing_changes(client, db, test_items, assert_max_queries):
+    etag_cart_id = client.post("/cart/").json()["id"]
+    client.post(f"/cart/{etag_cart_id}/items/", json={"item_id": test_items[1].id, "quantity": 1})
+    for path in (f"/cart/{etag_cart_id}/", f"/cart/{etag_cart_id}/invoice/"):
+        first = client.get(path)
+        etag = first.headers["ETag"]
+        assert etag.startswith('W/"1-') and first.headers["Cache-Control"] == "private, no-cache"
+
+        # Sin cambios: la misma lectura, pero sin cuerpo
+        with assert_max_queries(1):
+            cached = client.get(path, headers={"If-None-Match": etag})
+        assert cached.status_code == 304 and cached.content == b"" and cached.headers["ETag"] == etag
+        assert client.get(path, headers={"If-None-Match": f'"0", {etag.removeprefix("W/")}'}).status_code == 304
+
+    client.put(f"/cart/{etag_cart_id}/items/{test_items[1].id}/", json={"quantity": 2})
+    changed = client.get(f"/cart/{etag_cart_id}/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"].startswith('W/"2-')
+    assert changed.json()["total_quantity"] == 2
+    assert client.get("/cart/999999/", headers={"If-None-Match": etag}).status_code == 404
+
+    # El stock y el precio del ítem cambian sin que cambie la versión del carrito
+    item = db.get(models.Item, test_items[1].id)
+    for change, undo in ((lambda: setattr(item, "stock", item.stock + 1), lambda: setattr(item, "stock", item.stock - 1)),
+                         (lambda: setattr(item, "price", 61.0), lambda: setattr(item, "price", 60.0))):
+        etag = client.get(f"/cart/{etag_cart_id}/").headers["ETag"]
+        change()
+        db.commit()
+        stale = client.get(f"/cart/{etag_cart_id}/", headers={"If-None-Match": etag})
+        assert stale.status_code == 200 and stale.headers["ETag"] != etag
+        assert stale.headers["ETag"].startswith('W/"2-')
+        undo()
+        db.commit()
+    assert client.get(f"/cart/{etag_cart_id}/", headers={"If-None-Match": etag}).status_code == 304
+
+def test_invoice_export_streams_lines_and_totals(client, test_items, monkeypatch):
+    # Lotes de 2 líneas: la exportación recorre varias particiones del cursor
+    monkeypatch.setattr(cart_router, "EXPORT_BATCH_SIZE", 2)
+    export_cart_id = client.post("/cart/").json()["id"]
+    client.post(f"/cart/{export_cart_id}/items/batch/", json=[
+        {"item_id": test_items[0].id, "quantity": 1}, {"item_id": test_items[1].id, "quantity": 2}
+    ])
+    invoice = client.get(f"/cart/{export_cart_id}/invoice/").json()
+
+    response = client.get(f"/cart/{export_cart_id}/invoice/export/")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    *lines, trailer = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == invoice["items"]
+    assert trailer == {"cart_id": export_cart_id, "lines": 2, "total_quantity": 3, "total_price": 159.99}
+
+    response = client.get(f"/cart/{export_cart_id}/invoice/export/", params={"format": "csv"})
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["line_id", "item_id", "name", "type", "quantity", "price", "subtotal"]
+    assert [row[4] for row in rows[1:-1]] == ["1", "2"]
+    assert rows[-1] == ["", "", "TOTAL", "", "3", "", "159.99"]
+
+    assert client.get(f"/cart/{export_cart_id}/invoice/export/", params={"format": "xml"}).status_code == 422
+    assert client.get("/cart/999999/invoice/export/").status_code == 404
+
+def test_list_items_keyset_pagination(client, test_items):
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/items/", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= 2
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == sorted(seen)
+    assert len(seen) == len(set(seen))
+    assert {test_items[0].id, test_items[1].id} <= set(seen)
+
+    events = client.get("/items/", params={"type": "EVENT"}).json()["items"]
+    assert events and all(item["type"] == "EVENT" for item in events)
+    assert client.get("/items/", params={"cursor": "not-a-cursor"}).status_code == 400
+
+def test_get_cart_reads_flat_projection_in_one_statement(client, db, test_items):
+    from sqlalchemy import event
+    from tests.conftest import engine
+
+    read_cart_id = client.post("/cart/").json()["id"]
+    assert client.get(f"/cart/{read_cart_id}/").json()["items"] == []
+
+    product = crud.create_product(db, schemas.ProductCreate(
+        name="Bufanda", description="-", thumbnail="-", price=12.0, stock=5,
+        type=schemas.ItemType.PRODUCT, care_instructions="-"
+    ))
+    for item_id in (test_items[0].id, test_items[1].id, product.id):
+        client.post(f"/cart/{read_cart_id}/items/", json={"item_id": item_id, "quantity": 1})
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        cart = client.get(f"/cart/{read_cart_id}/").json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len(statements) == 1
+    assert [line["item_id"] for line in cart["items"]] == [test_items[0].id, test_items[1].id, product.id]
+    assert cart["items"][2]["item"] == {
+        "id": product.id, "name": "Bufanda", "description": "-", "thumbnail": "-",
+        "price": 12.0, "stock": 4, "type": "PRODUCT"
+    }
+
+def test_cart_fast_path_matches_response_model(client, test_items):
+    fast_cart_id = client.post("/cart/").json()["id"]
+    client.post(f"/cart/{fast_cart_id}/items/", json={"item_id": test_items[0].id, "quantity": 3})
+    client.post(f"/cart/{fast_cart_id}/items/", json={"item_id": test_items[1].id, "quantity": 1})
+
+    # Mismos bytes que produciría la validación contra response_model
+    for route, schema in ((f"/cart/{fast_cart_id}/", schemas.Cart), (f"/cart/{fast_cart_id}/invoice/", schemas.CartInvoice)):
+        response = client.get(route)
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == schema.model_validate_json(response.content).model_dump_json().encode()
+
+    # El esquema OpenAPI sigue declarando los modelos de respuesta
+    paths = client.get("/openapi.json").json()["paths"]
+    schema_ref = lambda path: paths[path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]["$ref"]
+    assert schema_ref("/cart/{cart_id}/") == "#/components/schemas/Cart"
+    assert schema_ref("/cart/{cart_id}/invoice/") == "#/components/schemas/CartInvoice"
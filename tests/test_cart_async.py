@@ -0,0 +1,80 @@
+# tests/test_cart_async.py
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from app import models
+from app.database import Base, get_async_db
+from app.routers import cart_async
+
+@pytest.fixture(scope="module")
+def async_client(tmp_path_factory):
+    path = tmp_path_factory.mktemp("async") / "cart.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=sync_engine)
+    db = sessionmaker(bind=sync_engine)()
+    db.add_all([
+        models.Product(
+            name="Gafas de sol Carey", description="Descripción", thumbnail="url",
+            price=39.99, stock=10, type=models.ItemType.PRODUCT, care_instructions="-"
+        ),
+        models.Event(
+            name="Concierto", description="Descripción", thumbnail="url",
+            price=60.00, stock=20, type=models.ItemType.EVENT, event_date="2024-12-31"
+        ),
+    ])
+    db.commit()
+    db.close()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(cart_async.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    with TestClient(app) as c:
+        yield c
+    sync_engine.dispose()
+
+def test_async_cart_flow(async_client):
+    cart_id = async_client.post("/cart/").json()["id"]
+
+    response = async_client.post(f"/cart/{cart_id}/items/", json={"item_id": 1, "quantity": 3})
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 3
+    assert response.json()["subtotal"] == 119.97
+
+    response = async_client.post(f"/cart/{cart_id}/items/", json={"item_id": 1, "quantity": 100})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Item with id 1 is out of stock."
+
+    response = async_client.put(f"/cart/{cart_id}/items/1/", json={"quantity": 2})
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 2
+
+    async_client.post(f"/cart/{cart_id}/items/", json={"item_id": 2, "quantity": 1})
+    data = async_client.get(f"/cart/{cart_id}/").json()
+    assert data["total_quantity"] == 3
+    assert data["total_price"] == 139.98
+
+    invoice = async_client.get(f"/cart/{cart_id}/invoice/")
+    assert invoice.json()["total_price"] == 139.98
+    etag = invoice.headers["ETag"]
+    assert async_client.get(f"/cart/{cart_id}/invoice/", headers={"If-None-Match": etag}).status_code == 304
+    exported = async_client.get(f"/cart/{cart_id}/invoice/export/", params={"format": "csv"}).text.splitlines()
+    assert len(exported) == 4 and exported[-1] == ",,TOTAL,,3,,139.98"
+
+    response = async_client.delete(f"/cart/{cart_id}/items/1/")
+    assert response.json()["detail"] == "Item removed from cart successfully."
+    assert async_client.get("/cart/999999/").status_code == 404
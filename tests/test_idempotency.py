@@ -0,0 +1,110 @@
+# tests/test_idempotency.py
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from app import idempotency, models
+from app.idempotency import (
+    IN_PROGRESS, MISMATCH, NEW, REPLAY, IdempotencyStore, MemoryIdempotencyStore, SqlIdempotencyStore, StoredResponse, store_from_env
+)
+from tests.conftest import engine
+
+@pytest.fixture
+def memory_store(monkeypatch):
+    store = MemoryIdempotencyStore()
+    monkeypatch.setattr(idempotency, "store", store)
+    return store
+
+@pytest.fixture(scope="module")
+def idempotent_item(db):
+    item = models.Product(
+        name="Reintentos", description="-", thumbnail="-", price=4.0,
+        stock=100, type=models.ItemType.PRODUCT, care_instructions="-"
+    )
+    db.add(item)
+    db.commit()
+    return item.id
+
+def stock(db, item_id):
+    db.expire_all()
+    return db.get(models.Item, item_id).stock
+
+def test_replay_returns_stored_response_without_queries(client, db, cart_id, idempotent_item, memory_store, assert_max_queries):
+    headers = {"Idempotency-Key": "add-1"}
+    body = {"item_id": idempotent_item, "quantity": 2}
+    first = client.post(f"/cart/{cart_id}/items/", json=body, headers=headers)
+    assert first.status_code == 200 and "Idempotent-Replayed" not in first.headers
+
+    with assert_max_queries(0):
+        replay = client.post(f"/cart/{cart_id}/items/", json=body, headers=headers)
+    assert replay.status_code == 200
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.json() == first.json()
+    assert stock(db, idempotent_item) == 98
+
+    # Misma clave con otro cuerpo; la misma clave en otra ruta es otra operación
+    assert client.post(f"/cart/{cart_id}/items/", json={**body, "quantity": 5}, headers=headers).status_code == 422
+    assert client.put(f"/cart/{cart_id}/items/{idempotent_item}/", json={"quantity": 1}, headers=headers).status_code == 200
+    assert memory_store.snapshot() == {NEW: 2, REPLAY: 1, MISMATCH: 1}
+
+def test_failed_requests_are_not_stored(client, cart_id, idempotent_item, memory_store):
+    headers = {"Idempotency-Key": "remove-1"}
+    client.delete(f"/cart/{cart_id}/items/{idempotent_item}/")
+    assert client.delete(f"/cart/{cart_id}/items/{idempotent_item}/", headers=headers).status_code == 404
+    client.post(f"/cart/{cart_id}/items/", json={"item_id": idempotent_item, "quantity": 1})
+    # El reintento se ejecuta de nuevo: la primera respuesta no cambió nada
+    assert client.delete(f"/cart/{cart_id}/items/{idempotent_item}/", headers=headers).status_code == 200
+    assert client.post(f"/cart/{cart_id}/items/", json={}, headers={"Idempotency-Key": "x" * 300}).status_code == 400
+
+def test_concurrent_retries_reserve_stock_once(client, db, idempotent_item, memory_store):
+    cart = client.post("/cart/").json()["id"]
+    before = stock(db, idempotent_item)
+
+    def retry(_):
+        return client.post(
+            f"/cart/{cart}/items/", json={"item_id": idempotent_item, "quantity": 3},
+            headers={"Idempotency-Key": "burst"}
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(retry, range(16)))
+    assert {response.status_code for response in responses} == {200}
+    assert {response.json()["quantity"] for response in responses} == {3}
+    assert sum(response.headers.get("Idempotent-Replayed") == "true" for response in responses) == 15
+    assert stock(db, idempotent_item) == before - 3
+    assert client.get(f"/cart/{cart}/summary/").json()["total_quantity"] == 3
+
+def test_sql_store_shares_keys_between_workers():
+    # Dos instancias sobre la misma tabla, como dos workers
+    first, second = SqlIdempotencyStore(engine), SqlIdempotencyStore(engine)
+    response = StoredResponse("abc", 200, {"content-type": "application/json"}, b'{"id": 1}', {1: 3})
+
+    async def scenario():
+        assert await first.begin("POST /cart/1/items/ k", "abc") == (NEW, None)
+        assert await second.begin("POST /cart/1/items/ k", "abc") == (IN_PROGRESS, None)
+        await first.complete("POST /cart/1/items/ k", response)
+        assert await second.begin("POST /cart/1/items/ k", "abc") == (REPLAY, response)
+        assert (await second.begin("POST /cart/1/items/ k", "other"))[0] == MISMATCH
+        # Una clave liberada (respuesta no 2xx) se puede volver a ejecutar
+        assert await first.begin("DELETE /cart/1/items/2/ k", "def") == (NEW, None)
+        await first.release("DELETE /cart/1/items/2/ k")
+        assert await second.begin("DELETE /cart/1/items/2/ k", "def") == (NEW, None)
+
+    asyncio.run(scenario())
+    expired = SqlIdempotencyStore(engine, ttl=0)
+    assert expired.purge_expired() == 2
+
+def test_store_configuration():
+    assert isinstance(store_from_env(engine, {}), MemoryIdempotencyStore)
+    assert isinstance(store_from_env(engine, {"IDEMPOTENCY_STORE": "sql"}), SqlIdempotencyStore)
+    assert store_from_env(engine, {"IDEMPOTENCY_STORE": "off"}) is None
+    with pytest.raises(ValueError):
+        store_from_env(engine, {"IDEMPOTENCY_STORE": "redis"})
+
+    class PartialStore(IdempotencyStore):
+        async def begin(self, key, fingerprint):
+            return NEW, None
+    # Sin complete y release, el almacén falla al crearlo
+    with pytest.raises(TypeError):
+        PartialStore()
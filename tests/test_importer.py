@@ -0,0 +1,88 @@
+# tests/test_importer.py
+
+import json
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+from app import models
+from app.database import Base
+from app.importer import import_catalog, iter_records
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+    return str(path)
+
+def catalog_record(i, **overrides):
+    record = {
+        "name": f"Item {i}", "description": "-", "thumbnail": "-", "price": 10.0 + i, "stock": i,
+        "type": "PRODUCT" if i % 2 else "EVENT",
+        "care_instructions": "Lavar a mano" if i % 2 else None,
+        "event_date": None if i % 2 else "2025-06-01",
+    }
+    record.update(overrides)
+    return record
+
+def test_import_jsonl_in_chunks(engine, tmp_path):
+    path = write_jsonl(tmp_path / "catalog.jsonl", [catalog_record(i) for i in range(1, 26)])
+    progress = []
+    stats = import_catalog(engine, iter_records(path), chunk_size=10, progress=lambda s: progress.append(s.rows))
+
+    assert (stats.rows, stats.chunks) == (25, 3)
+    assert progress == [10, 20, 25]
+    with Session(engine) as db:
+        assert db.query(models.Product).count() == 13
+        assert db.query(models.Event).count() == 12
+        # Los ids de las subclases coinciden con los de 'items'
+        event = db.query(models.Event).filter_by(name="Item 4").one()
+        assert (event.event_date, event.price, event.stock) == ("2025-06-01", 14.0, 4)
+
+def test_import_csv_upserts_by_name(engine, tmp_path):
+    import_catalog(engine, [catalog_record(1), catalog_record(2)])
+    with Session(engine) as db:
+        original_id = db.scalar(select(models.Item.id).filter_by(name="Item 1"))
+
+    path = tmp_path / "catalog.csv"
+    path.write_text(
+        "name,description,thumbnail,price,stock,type,care_instructions,event_date\n"
+        "Item 1,Nuevo,-,99.5,7,EVENT,,2026-01-01\n"
+        "Item 3,-,-,5,1,PRODUCT,Secar al aire,\n",
+        encoding="utf-8",
+    )
+    import_catalog(engine, iter_records(str(path)))
+
+    with Session(engine) as db:
+        assert db.scalar(select(func.count()).select_from(models.Item)) == 3
+        # Mismo id, datos refrescados y fila movida de 'products' a 'events'
+        item = db.query(models.Item).filter_by(name="Item 1").one()
+        assert (item.id, item.type, item.price, item.stock) == (original_id, models.ItemType.EVENT, 99.5, 7)
+        assert db.get(models.Product, original_id) is None
+        assert db.get(models.Event, original_id).event_date == "2026-01-01"
+
+def test_import_skip_keeps_existing_items(engine):
+    import_catalog(engine, [catalog_record(1)])
+    import_catalog(engine, [catalog_record(1, price=1.0)], on_conflict="skip")
+    with Session(engine) as db:
+        assert db.query(models.Item).filter_by(name="Item 1").one().price == 11.0
+
+def test_invalid_record_is_rejected(engine):
+    with pytest.raises(ValueError, match="Registro 2"):
+        import_catalog(engine, [catalog_record(1), catalog_record(2, type="TICKET")])
+
+def test_repeated_name_in_a_chunk_keeps_the_last_record(engine):
+    # En PostgreSQL un nombre repetido en el mismo INSERT ... ON CONFLICT DO UPDATE abortaba la importación
+    records = [catalog_record(1), catalog_record(2), catalog_record(1, price=5.0, type="EVENT", event_date="2026-02-01")]
+    stats = import_catalog(engine, records, chunk_size=10)
+    assert stats.rows == 3
+    with Session(engine) as db:
+        item = db.query(models.Item).filter_by(name="Item 1").one()
+        assert (item.type, item.price, item.price_cents) == (models.ItemType.EVENT, 5.0, 500)
+        assert db.get(models.Product, item.id) is None
+        assert db.get(models.Event, item.id).event_date == "2026-02-01"
+        assert db.scalar(select(func.count()).select_from(models.Item)) == 2
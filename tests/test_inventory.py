@@ -0,0 +1,102 @@
+# tests/test_inventory.py
+
+import pytest
+from sqlalchemy import update
+from app import inventory, models
+from app.inventory import StockRebalancer, rebalance, rebalancer_from_env, set_stock_shards
+from tests.conftest import engine
+
+@pytest.fixture(scope="module")
+def sharded_items(db):
+    items = [
+        models.Event(
+            name=f"Concierto repartido {i}", description="-", thumbnail="-", price=40.0,
+            stock=100, type=models.ItemType.EVENT, event_date="2025-06-01"
+        )
+        for i in range(2)
+    ]
+    db.add_all(items)
+    db.commit()
+    item_ids = [item.id for item in items]
+    for item_id in item_ids:
+        assert set_stock_shards(engine, item_id, 4)
+    return item_ids
+
+def shards(db, item_id):
+    db.expire_all()
+    return [stock for _, stock in inventory.shard_stocks(db, item_id)]
+
+def set_shards(db, item_id, stocks):
+    db.execute(update(models.Item).where(models.Item.id == item_id).values(stock=stocks[0]))
+    for shard, stock in enumerate(stocks[1:], start=1):
+        db.execute(
+            update(models.ItemStockShard)
+            .where(models.ItemStockShard.item_id == item_id, models.ItemStockShard.shard == shard)
+            .values(stock=stock)
+        )
+    db.commit()
+
+def listed_stock(client, item_id):
+    items = client.get("/items/", params={"type": "EVENT", "limit": 1000}).json()["items"]
+    return next(item["stock"] for item in items if item["id"] == item_id)
+
+def test_sharded_item_keeps_stock_semantics(client, db, sharded_items):
+    item_id = sharded_items[0]
+    assert shards(db, item_id) == [25, 25, 25, 25]
+    assert listed_stock(client, item_id) == 100
+
+    cart_id = client.post("/cart/").json()["id"]
+    response = client.post(f"/cart/{cart_id}/items/", json={"item_id": item_id, "quantity": 15})
+    assert response.status_code == 200
+    assert response.json()["item"]["stock"] == 85
+    assert client.put(f"/cart/{cart_id}/items/{item_id}/", json={"quantity": 5}).json()["item"]["stock"] == 95
+    assert client.post(f"/cart/{cart_id}/items/batch/", json=[{"item_id": item_id, "quantity": 20}]).json()[0]["item"]["stock"] == 75
+    assert client.get(f"/cart/{cart_id}/").json()["items"][0]["item"]["stock"] == 75
+    assert sum(shards(db, item_id)) == 75 and listed_stock(client, item_id) == 75
+
+    assert client.delete(f"/cart/{cart_id}/items/{item_id}/").status_code == 200
+    assert sum(shards(db, item_id)) == 100
+
+def test_reservation_falls_back_to_siblings(client, db, sharded_items):
+    item_id, other_id = sharded_items
+    cart_id = client.post("/cart/").json()["id"]
+
+    # Ningún shard tiene 3 unidades por sí solo: se toman de varios
+    set_shards(db, item_id, [0, 2, 0, 1])
+    response = client.post(f"/cart/{cart_id}/items/", json={"item_id": item_id, "quantity": 3})
+    assert response.status_code == 200
+    assert response.json()["item"]["stock"] == 0
+    assert shards(db, item_id) == [0, 0, 0, 0]
+    assert client.post(f"/cart/{cart_id}/items/", json={"item_id": item_id, "quantity": 1}).status_code == 400
+
+    # Si otra línea del lote falla, lo tomado de los shards se deshace
+    set_shards(db, other_id, [1, 1, 1, 1])
+    response = client.post(f"/cart/{cart_id}/items/batch/", json=[
+        {"item_id": other_id, "quantity": 3}, {"item_id": 999999, "quantity": 1}
+    ])
+    assert response.status_code == 404
+    assert shards(db, other_id) == [1, 1, 1, 1]
+    assert client.post(f"/cart/{cart_id}/items/batch/", json=[{"item_id": other_id, "quantity": 5}]).status_code == 400
+    assert shards(db, other_id) == [1, 1, 1, 1]
+
+def test_rebalance_and_unshard(db, sharded_items):
+    item_id = sharded_items[1]
+    set_shards(db, item_id, [0, 37, 0, 3])
+    assert rebalance(engine) >= 1
+    assert shards(db, item_id) == [10, 10, 10, 10]
+    # Ya equilibrado: la pasada no escribe
+    assert rebalance(engine) == 0
+
+    assert set_stock_shards(engine, item_id, 2)
+    assert shards(db, item_id) == [20, 20]
+    assert set_stock_shards(engine, item_id, 1)
+    assert shards(db, item_id) == [40]
+    assert db.get(models.Item, item_id).stock == 40
+    assert not set_stock_shards(engine, 999999, 4)
+
+def test_rebalancer_from_env():
+    assert rebalancer_from_env(engine, env={}) is None
+    assert rebalancer_from_env(engine, env={"STOCK_REBALANCE_INTERVAL": "0"}) is None
+    rebalancer = rebalancer_from_env(engine, env={"STOCK_REBALANCE_INTERVAL": "2", "STOCK_REBALANCE_LOCK_TIMEOUT": "0.5"})
+    assert isinstance(rebalancer, StockRebalancer)
+    assert (rebalancer.interval, rebalancer.lock_timeout) == (2.0, 0.5)
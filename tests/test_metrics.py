@@ -0,0 +1,40 @@
+# tests/test_metrics.py
+
+from app.metrics import registry
+
+def sample(text, name, **labels):
+    # Valor de una muestra del formato de texto de Prometheus
+    rendered = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f"{name}{{{rendered}}} "
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return None
+
+def test_metrics_record_routes_statuses_and_queries(client, cart_id):
+    registry.reset()
+    client.get(f"/cart/{cart_id}/")
+    client.get(f"/cart/{cart_id}/")
+    client.get("/cart/999999/")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    route = {"method": "GET", "route": "/cart/{cart_id}/"}
+    assert sample(text, "http_requests_total", **route, status="200") == 2
+    assert sample(text, "http_requests_total", **route, status="404") == 1
+    assert sample(text, "http_request_duration_seconds_count", **route) == 3
+    assert sample(text, "http_request_duration_seconds_bucket", **route, le="+Inf") == 3
+    # GET /cart/{id}/ hace una consulta por petición
+    assert sample(text, "http_request_db_queries_sum", **route) == 3
+    assert sample(text, "http_request_db_queries_bucket", **route, le="1") == 3
+    assert sample(text, "http_request_db_seconds_total", **route) > 0
+    assert sample(text, "http_request_query_budget_exceeded_total", **route) == 0
+    assert sample(text, "db_pool_checked_out", pool="sync") is not None
+
+def test_unmatched_paths_share_one_label(client):
+    registry.reset()
+    client.get("/no-such-path/1")
+    client.get("/no-such-path/2")
+    assert sample(registry.render(), "http_requests_total", method="GET", route="unmatched", status="404") == 2
@@ -0,0 +1,63 @@
+# tests/test_pool.py
+
+import pytest
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import NullPool
+from app.database import pool_options
+from app.telemetry import Histogram, PoolTelemetry
+
+def make_engine(url, env):
+    telemetry = PoolTelemetry("test")
+    engine = create_engine(url, **pool_options(url, telemetry, env))
+    telemetry.attach(engine)
+    return engine, telemetry
+
+def test_queue_pool_from_env_records_waits_and_timeouts(tmp_path):
+    env = {"DB_POOL_CLASS": "queue", "DB_POOL_SIZE": "1", "DB_MAX_OVERFLOW": "0",
+           "DB_POOL_TIMEOUT": "0.05", "DB_POOL_PRE_PING": "true"}
+    engine, telemetry = make_engine(f"sqlite:///{tmp_path / 'pool.db'}", env)
+    try:
+        first = engine.connect()
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        stats = telemetry.snapshot()
+        assert (stats["pool_class"], stats["size"]) == ("QueuePool", 1)
+        assert (stats["checked_out"], stats["timeouts"], stats["connects"]) == (1, 1, 1)
+        assert stats["wait_seconds"]["count"] == 2
+        # La espera que agotó el timeout cae en el bucket de >= 0.05 s
+        assert stats["wait_seconds"]["buckets"]["0.025"] == 1
+        first.close()
+
+        # La instrumentación sobrevive a la recreación del pool
+        engine.dispose()
+        with engine.connect():
+            pass
+        stats = telemetry.snapshot()
+        assert (stats["checked_out"], stats["peak_checked_out"], stats["checkouts"]) == (0, 1, 2)
+        assert stats["wait_seconds"]["count"] == 3
+    finally:
+        engine.dispose()
+
+def test_pool_class_selection(tmp_path):
+    # Los parámetros de cola se ignoran en pools sin cola
+    engine, telemetry = make_engine(f"sqlite:///{tmp_path / 'null.db'}", {"DB_POOL_CLASS": "null", "DB_POOL_SIZE": "5"})
+    assert isinstance(engine.pool, NullPool)
+    with engine.connect():
+        pass
+    assert telemetry.snapshot()["pool_class"] == "NullPool"
+    with pytest.raises(ValueError):
+        pool_options("sqlite://", telemetry, {"DB_POOL_CLASS": "bogus"})
+
+def test_histogram_quantile():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.005, 0.05, 5.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(0.75) == 0.1
+    assert histogram.quantile(1.0) == float("inf")
+    assert histogram.snapshot()["buckets"] == {"0.01": 2, "0.1": 3, "1.0": 3, "+Inf": 4}
+
+def test_pool_stats_route(client):
+    response = client.get("/system/pool/")
+    assert response.status_code == 200
+    assert response.json()["pools"][0]["name"] == "sync"
@@ -0,0 +1,91 @@
+# tests/test_query_budget.py
+
+import pytest
+from fastapi.routing import APIRoute
+from sqlalchemy import text
+from app import models
+from app.cache import catalog_cache
+from app.main import app
+from app.query_budget import QueryBudget, QueryBudgetExceeded, get_query_budget, normalize_statement
+from app.routers import cart, cart_async
+from tests.conftest import engine
+
+LINES = 5
+
+def route_budget(router, method, path):
+    for route in router.routes:
+        if isinstance(route, APIRoute) and route.path == path and method in route.methods:
+            return get_query_budget(route.endpoint)
+    raise KeyError((method, path))
+
+def test_every_route_declares_a_budget():
+    missing = [route.path for route in app.routes if isinstance(route, APIRoute) and get_query_budget(route.endpoint) is None]
+    assert missing == []
+    # Los routers síncrono y asíncrono comparten presupuestos
+    for route in cart.router.routes:
+        for method in route.methods:
+            assert route_budget(cart_async.router, method, route.path) == get_query_budget(route.endpoint)
+
+@pytest.fixture(scope="module")
+def budget_items(db):
+    items = [
+        models.Product(
+            name=f"Presupuesto {i}", description="-", thumbnail="-", price=2.0,
+            stock=1000, type=models.ItemType.PRODUCT, care_instructions="-"
+        )
+        for i in range(LINES + 1)
+    ]
+    db.add_all(items)
+    db.commit()
+    return [item.id for item in items]
+
+def test_cart_routes_stay_within_budget(client, budget_items, assert_max_queries):
+    budget = lambda method, path: assert_max_queries(route_budget(cart.router, method, path))
+    lines = [{"item_id": item_id, "quantity": 1} for item_id in budget_items[:LINES]]
+    extra_item = budget_items[LINES]
+
+    with budget("POST", "/cart/"):
+        cart_id = client.post("/cart/").json()["id"]
+    # Con varias líneas en el carrito cualquier consulta por línea superaría el presupuesto
+    with budget("POST", "/cart/{cart_id}/items/batch/"):
+        assert client.post(f"/cart/{cart_id}/items/batch/", json=lines).status_code == 200
+    with budget("POST", "/cart/{cart_id}/items/"):
+        assert client.post(f"/cart/{cart_id}/items/", json={"item_id": extra_item, "quantity": 1}).status_code == 200
+    with budget("PUT", "/cart/{cart_id}/items/batch/"):
+        assert client.put(f"/cart/{cart_id}/items/batch/", json=[{**line, "quantity": 2} for line in lines]).status_code == 200
+    with budget("PUT", "/cart/{cart_id}/items/{item_id}/"):
+        assert client.put(f"/cart/{cart_id}/items/{extra_item}/", json={"quantity": 3}).status_code == 200
+    # Misma cantidad con la caché del catálogo fría: camino más caro de la ruta
+    catalog_cache.clear()
+    with budget("PUT", "/cart/{cart_id}/items/{item_id}/"):
+        assert client.put(f"/cart/{cart_id}/items/{extra_item}/", json={"quantity": 3}).status_code == 200
+    with budget("GET", "/cart/{cart_id}/"):
+        assert len(client.get(f"/cart/{cart_id}/").json()["items"]) == LINES + 1
+    with budget("GET", "/cart/{cart_id}/summary/"):
+        assert client.get(f"/cart/{cart_id}/summary/").status_code == 200
+    with budget("GET", "/cart/{cart_id}/invoice/"):
+        assert client.get(f"/cart/{cart_id}/invoice/").status_code == 200
+    with budget("DELETE", "/cart/{cart_id}/items/{item_id}/"):
+        assert client.delete(f"/cart/{cart_id}/items/{extra_item}/").status_code == 200
+    with budget("DELETE", "/cart/{cart_id}/items/batch/"):
+        assert client.request("DELETE", f"/cart/{cart_id}/items/batch/", json=budget_items[:LINES]).status_code == 200
+
+def test_budget_flags_excess_and_repeated_statements():
+    with pytest.raises(QueryBudgetExceeded, match="2 sentencias SQL, presupuesto 1"):
+        with QueryBudget(engine, max_queries=1, max_repeats=None):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+
+    # Misma consulta por cada línea: N+1 aunque el total quepa en el presupuesto
+    with pytest.raises(QueryBudgetExceeded, match="N\\+1"):
+        with QueryBudget(engine, max_queries=10):
+            with engine.connect() as conn:
+                for item_id in range(3):
+                    conn.execute(text("SELECT * FROM items WHERE id = :id"), {"id": item_id})
+
+def test_normalize_statement_collapses_variable_parts():
+    assert normalize_statement("SELECT * FROM t WHERE id IN (?, ?, ?) AND name = 'x'") == \
+        normalize_statement("SELECT * FROM t WHERE id IN (?)  AND name = 'y'")
+    assert normalize_statement("UPDATE t SET q=CASE t.id WHEN ? THEN ? WHEN ? THEN ? END") == \
+        normalize_statement("UPDATE t SET q=CASE t.id WHEN ? THEN ? END")
@@ -0,0 +1,114 @@
+# tests/test_replica.py
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app import database, models
+from app.database import Base, get_db
+from app.main import app
+from app.replica import COOKIE, HEADER
+
+def test_mutations_announce_the_cart_version(client):
+    response = client.post("/cart/")
+    cart_id = response.json()["id"]
+    assert response.headers[HEADER] == "0"
+    assert f"Path=/cart/{cart_id}/" in response.headers["set-cookie"]
+
+    items = client.get("/items/", params={"limit": 1}).json()["items"]
+    if items:
+        response = client.post(f"/cart/{cart_id}/items/", json={"item_id": items[0]["id"], "quantity": 1})
+        assert response.headers[HEADER] == "1"
+    # Ni las lecturas ni las mutaciones fallidas anuncian versión
+    assert HEADER not in client.get(f"/cart/{cart_id}/").headers
+    assert HEADER not in client.post(f"/cart/{cart_id}/items/", json={"item_id": 999999, "quantity": 1}).headers
+
+@pytest.fixture
+def primary_and_replica(tmp_path, monkeypatch):
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}", connect_args={"check_same_thread": False})
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}", connect_args={"check_same_thread": False})
+    for engine in (primary, replica):
+        Base.metadata.create_all(bind=engine)
+    Primary = sessionmaker(autocommit=False, autoflush=False, bind=primary)
+
+    def override_get_db():
+        db = Primary()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    previous = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = override_get_db
+    monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=replica))
+
+    def replicate():
+        # La réplica se pone al día copiando el fichero del primario
+        with primary.connect() as source, replica.connect() as target:
+            source.connection.driver_connection.backup(target.connection.driver_connection)
+
+    with Primary() as db:
+        item = models.Product(
+            name="Replicado", description="-", thumbnail="-", price=3.0,
+            stock=10, type=models.ItemType.PRODUCT, care_instructions="-"
+        )
+        db.add(item)
+        db.commit()
+        item_id = item.id
+    replicate()
+    yield replica, replicate, item_id
+    if previous is None:
+        del app.dependency_overrides[get_db]
+    else:
+        app.dependency_overrides[get_db] = previous
+    primary.dispose()
+    replica.dispose()
+
+def test_reads_go_to_the_replica_unless_it_lags_behind_the_client(primary_and_replica):
+    replica, replicate, item_id = primary_and_replica
+    replica_queries = []
+    event.listen(replica, "after_cursor_execute", lambda *args: replica_queries.append(1))
+    writer, other = TestClient(app), TestClient(app)
+
+    # Carrito recién creado: la réplica no lo tiene, así que su autor lee del primario
+    cart_id = writer.post("/cart/").json()["id"]
+    assert writer.cookies.get(COOKIE) == "0"
+    assert writer.get(f"/cart/{cart_id}/").status_code == 200
+    assert other.get(f"/cart/{cart_id}/").status_code == 404
+    assert other.get("/items/").json()["items"][0]["id"] == item_id
+
+    replicate()
+    assert writer.post(f"/cart/{cart_id}/items/", json={"item_id": item_id, "quantity": 2}).status_code == 200
+    assert writer.get(f"/cart/{cart_id}/summary/").json()["total_quantity"] == 2
+    assert other.get(f"/cart/{cart_id}/summary/").json()["total_quantity"] == 0
+    # Sin cookie, la cabecera X-Cart-Version pide lo mismo
+    assert other.get(f"/cart/{cart_id}/", headers={HEADER: "1"}).json()["total_quantity"] == 2
+
+    # Con la réplica al día, también quien escribió lee de ella
+    replicate()
+    replica_queries.clear()
+    assert writer.get(f"/cart/{cart_id}/invoice/").json()["total_quantity"] == 2
+    assert len(replica_queries) == 2
+
+def test_idempotent_replay_announces_the_written_version(primary_and_replica, monkeypatch):
+    from app import idempotency
+    monkeypatch.setattr(idempotency, "store", idempotency.MemoryIdempotencyStore())
+    replica, replicate, item_id = primary_and_replica
+    writer = TestClient(app)
+    cart_id = writer.post("/cart/").json()["id"]
+    replicate()
+
+    request = dict(json={"item_id": item_id, "quantity": 2}, headers={"Idempotency-Key": "replayed-write"})
+    assert writer.post(f"/cart/{cart_id}/items/", **request).headers[HEADER] == "1"
+    # La respuesta original se perdió: el reintento llega sin la cookie y la recibe con la repetición
+    retry = TestClient(app)
+    replay = retry.post(f"/cart/{cart_id}/items/", **request)
+    assert replay.headers["Idempotent-Replayed"] == "true" and replay.headers[HEADER] == "1"
+    assert retry.cookies.get(COOKIE) == "1"
+    assert retry.get(f"/cart/{cart_id}/").json()["total_quantity"] == 2
+
+def test_memory_store_refuses_a_read_replica():
+    from app.repository import repository_from_env
+    from tests.conftest import engine
+    with pytest.raises(ValueError):
+        repository_from_env(engine, env={"CART_STORE": "memory", "DATABASE_READ_URL": "sqlite:///./replica.db"})
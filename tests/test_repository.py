@@ -0,0 +1,168 @@
+# tests/test_repository.py
+
+import json
+import threading
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app import crud, models
+from app.database import Base
+from app.main import app
+from app.repository import CartRepository, MemoryCartRepository, SqlCartRepository, get_cart_repository, repository_from_env
+from tests.conftest import engine
+
+@pytest.fixture(scope="module")
+def memory_store(client):
+    store = MemoryCartRepository(engine, max_carts=2)
+    app.dependency_overrides[get_cart_repository] = lambda: store
+    yield store
+    del app.dependency_overrides[get_cart_repository]
+
+@pytest.fixture(scope="module")
+def store_items(db):
+    items = [
+        models.Product(
+            name=f"En memoria {i}", description="-", thumbnail="-", price=2.5,
+            stock=100, type=models.ItemType.PRODUCT, care_instructions="-"
+        )
+        for i in range(3)
+    ]
+    db.add_all(items)
+    db.commit()
+    return [item.id for item in items]
+
+def stored_lines(db, cart_id):
+    db.expire_all()
+    return {line.item_id: line.quantity for line in db.query(models.CartItem).filter(models.CartItem.cart_id == cart_id)}
+
+def stock(db, item_id):
+    db.expire_all()
+    return db.get(models.Item, item_id).stock
+
+def test_memory_tier_serves_carts_without_cart_tables(client, db, memory_store, store_items, assert_max_queries):
+    first, second, third = store_items
+    cart_id = client.post("/cart/").json()["id"]
+    assert client.post(f"/cart/{cart_id}/items/batch/", json=[
+        {"item_id": first, "quantity": 2}, {"item_id": second, "quantity": 1}
+    ]).status_code == 200
+
+    # Línea existente: solo la reserva sobre items.stock
+    with assert_max_queries(1):
+        response = client.post(f"/cart/{cart_id}/items/", json={"item_id": first, "quantity": 3})
+    assert response.json()["quantity"] == 5
+    assert response.json()["item"]["stock"] == stock(db, first) == 95
+    with assert_max_queries(1):
+        assert client.put(f"/cart/{cart_id}/items/{second}/", json={"quantity": 4}).json()["quantity"] == 4
+    # Línea nueva: reserva, INSERT de la línea (para tener su id) y el catálogo, aún no cacheado
+    with assert_max_queries(3):
+        assert client.post(f"/cart/{cart_id}/items/", json={"item_id": third, "quantity": 1}).status_code == 200
+    with assert_max_queries(1):
+        assert client.delete(f"/cart/{cart_id}/items/{third}/").status_code == 200
+    with assert_max_queries(0):
+        summary = client.get(f"/cart/{cart_id}/summary/").json()
+    assert (summary["total_quantity"], summary["total_price"], summary["version"]) == (9, 22.5, 5)
+    with assert_max_queries(1):
+        response = client.get(f"/cart/{cart_id}/")
+    contents = response.json()
+    assert [(line["item_id"], line["quantity"]) for line in contents["items"]] == [(first, 5), (second, 4)]
+    assert response.headers["ETag"].startswith('W/"5-')
+    with assert_max_queries(1):
+        assert client.get(f"/cart/{cart_id}/", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+    # Write-behind: cart_items solo cambia al volcar, y entonces coincide con la memoria
+    assert stored_lines(db, cart_id) == {first: 2, second: 1, third: 1}
+    memory_store.flush(cart_id)
+    assert stored_lines(db, cart_id) == {first: 5, second: 4}
+    db.expire_all()
+    assert crud.get_cart_contents(db, cart_id) == (summary["version"], contents)
+    assert crud.get_cart_summary(db, cart_id).model_dump() == summary
+
+    # La exportación lee cart_items: vuelca antes los cambios que solo están en memoria
+    assert client.put(f"/cart/{cart_id}/items/{second}/", json={"quantity": 1}).status_code == 200
+    exported = client.get(f"/cart/{cart_id}/invoice/export/").text.splitlines()
+    assert json.loads(exported[-1])["total_quantity"] == 6
+
+def test_lru_eviction_flushes_to_sql(client, db, memory_store, store_items):
+    carts = [client.post("/cart/").json()["id"] for _ in range(3)]
+    assert client.post(f"/cart/{carts[0]}/items/", json={"item_id": store_items[0], "quantity": 2}).status_code == 200
+    assert client.put(f"/cart/{carts[0]}/items/{store_items[0]}/", json={"quantity": 7}).status_code == 200
+    # Dos carritos más expulsan al primero, que se vuelca con su última cantidad
+    for cart_id in carts[1:]:
+        assert client.post(f"/cart/{cart_id}/items/", json={"item_id": store_items[1], "quantity": 1}).status_code == 200
+    assert memory_store.stats()["carts"] == 2
+    assert stored_lines(db, carts[0]) == {store_items[0]: 7}
+
+    loads = memory_store.stats()["loads"]
+    assert client.get(f"/cart/{carts[0]}/summary/").json()["total_quantity"] == 7
+    assert memory_store.stats()["loads"] == loads + 1
+    assert client.get("/cart/999999/summary/").status_code == 404
+
+def test_concurrent_edits_keep_stock_and_lines_consistent(tmp_path):
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'store.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+
+    @event.listens_for(file_engine, "connect")
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(file_engine, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    Base.metadata.create_all(bind=file_engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=file_engine)
+    store = MemoryCartRepository(file_engine)
+    with Session() as db:
+        item = models.Event(
+            name="Concierto", description="-", thumbnail="-", price=10.0,
+            stock=1000, type=models.ItemType.EVENT, event_date="2025-01-01"
+        )
+        db.add(item)
+        db.commit()
+        item_id = item.id
+        cart_id = store.create_cart(db).id
+
+    def worker():
+        with Session() as db:
+            for _ in range(20):
+                store.add_item_to_cart(db, cart_id, item_id, 2)
+                try:
+                    store.update_cart_item(db, cart_id, item_id, store.get_cart_summary(db, cart_id).total_quantity - 1)
+                except HTTPException as e:
+                    # Otro hilo vació (400) o eliminó (404) la línea entre la suma y la lectura
+                    if e.status_code not in (400, 404):
+                        raise
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with Session() as db:
+        in_memory = store.get_cart_summary(db, cart_id).total_quantity
+    store.stop()
+
+    with Session() as db:
+        in_cart = db.query(models.CartItem.quantity).filter(models.CartItem.cart_id == cart_id).scalar()
+        # Cada unidad en el carrito está reservada exactamente una vez
+        assert in_cart == in_memory > 0
+        assert db.get(models.Item, item_id).stock == 1000 - in_cart
+        assert SqlCartRepository().get_cart_summary(db, cart_id).total_quantity == in_cart
+    file_engine.dispose()
+
+def test_repository_configuration():
+    assert isinstance(repository_from_env(engine, env={}), SqlCartRepository)
+    store = repository_from_env(engine, env={"CART_STORE": "memory", "CART_STORE_MAX_CARTS": "50"})
+    assert (store.max_carts, store.flush_interval) == (50, 1.0)
+    with pytest.raises(ValueError):
+        repository_from_env(engine, env={"CART_STORE": "redis"})
+    with pytest.raises(ValueError):
+        repository_from_env(engine, async_mode=True, env={"CART_STORE": "memory"})
+
+    class PartialRepository(CartRepository):
+        def cart_exists(self, db, cart_id):
+            return True
+    # Un backend incompleto falla al crearlo, no en la primera petición
+    with pytest.raises(TypeError):
+        PartialRepository()
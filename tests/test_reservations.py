@@ -0,0 +1,205 @@
+# tests/test_reservations.py
+
+import threading
+import time
+import anyio
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from app import crud, models
+from app.database import Base
+from app.metrics import MetricsRegistry
+from app.repository import SqlCartRepository, repository_from_env
+from app.reservations import DEFAULT_MAX_PENDING, ReservationBatcher, batcher_from_env
+from app.utils.exceptions import ItemNotFoundException, OutOfStockException
+from tests.conftest import engine
+
+def new_event(name, stock):
+    return models.Event(
+        name=name, description="-", thumbnail="-", price=12.5,
+        stock=stock, type=models.ItemType.EVENT, event_date="2025-03-01"
+    )
+
+def test_batch_grants_in_arrival_order(db):
+    item = new_event("Preventa por lotes", 5)
+    carts = [models.Cart() for _ in range(3)]
+    db.add_all([item, *carts])
+    db.commit()
+    first, second, third = (cart.id for cart in carts)
+
+    results = crud.add_item_to_carts(db, item.id, [(first, 3), (second, 4), (third, 2), (first, 1)])
+    # Como una detrás de otra: 3 (quedan 2), 4 no cabe, 2 (quedan 0), 1 no cabe
+    assert [(r.quantity, r.item.stock) for r in (results[0], results[2])] == [(3, 2), (2, 0)]
+    assert isinstance(results[1], OutOfStockException) and isinstance(results[3], OutOfStockException)
+    db.expire_all()
+    assert db.get(models.Item, item.id).stock == 0
+    assert [crud.get_cart_summary(db, cart.id).total_quantity for cart in carts] == [3, 0, 2]
+    assert crud.get_cart_summary(db, first).total_price == 37.5
+
+    # Dos peticiones del mismo carrito: cada una ve la línea y el stock de su turno
+    db.query(models.Item).filter(models.Item.id == item.id).update({"stock": 10})
+    db.commit()
+    results = crud.add_item_to_carts(db, item.id, [(first, 1), (first, 2)])
+    assert [(r.quantity, r.item.stock) for r in results] == [(4, 9), (6, 7)]
+    assert crud.get_cart_summary(db, first).total_quantity == 6
+
+    with pytest.raises(ItemNotFoundException):
+        crud.add_item_to_carts(db, 999999, [(first, 1), (second, 1)])
+
+@pytest.fixture
+def file_sessionmaker(tmp_path):
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'queue.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+
+    @event.listens_for(file_engine, "connect")
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(file_engine, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    Base.metadata.create_all(bind=file_engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=file_engine)
+    file_engine.dispose()
+
+def test_concurrent_adds_share_transactions(file_sessionmaker):
+    with file_sessionmaker() as db:
+        item = new_event("Venta flash", 5)
+        carts = [models.Cart() for _ in range(8)]
+        db.add_all([item, *carts])
+        db.commit()
+        item_id, cart_ids = item.id, [cart.id for cart in carts]
+
+    batcher = ReservationBatcher(window=0.05, max_batch=8)
+    barrier = threading.Barrier(len(cart_ids))
+    statuses = []
+
+    def worker(cart_id):
+        with file_sessionmaker() as db:
+            barrier.wait()
+            try:
+                batcher.add_item_to_cart(db, cart_id, item_id, 1)
+                statuses.append(200)
+            except HTTPException as e:
+                statuses.append(e.status_code)
+
+    threads = [threading.Thread(target=worker, args=(cart_id,)) for cart_id in cart_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200] * 5 + [400] * 3
+    snapshot = batcher.metrics.snapshot()
+    assert snapshot["queue_wait"]["count"] == 8
+    assert snapshot["batch_sizes"]["count"] < 8
+    assert batcher.pending == 0
+    with file_sessionmaker() as db:
+        assert db.get(models.Item, item_id).stock == 0
+        assert db.query(func.sum(models.CartItem.quantity)).scalar() == 5
+        assert db.query(func.sum(models.Cart.total_quantity)).scalar() == 5
+
+def test_full_queue_sheds_load(db):
+    item = new_event("Cola llena", 10)
+    carts = [models.Cart() for _ in range(2)]
+    db.add_all([item, *carts])
+    db.commit()
+    item_id, cart_ids = item.id, [cart.id for cart in carts]
+
+    batcher = ReservationBatcher(window=0.2, max_pending=1)
+    leader = threading.Thread(target=batcher.add_item_to_cart, args=(db, cart_ids[0], item_id, 1))
+    leader.start()
+    while batcher.pending == 0:
+        time.sleep(0.001)
+    with pytest.raises(HTTPException) as shed:
+        batcher.add_item_to_cart(db, cart_ids[1], item_id, 1)
+    leader.join()
+    assert shed.value.status_code == 429 and shed.value.headers == {"Retry-After": "1"}
+    assert batcher.metrics.snapshot()["shed"] == 1
+
+    registry = MetricsRegistry()
+    registry.add_reservations(SqlCartRepository(batcher))
+    rendered = registry.render()
+    assert "reservation_queue_shed_total 1" in rendered
+    assert 'reservation_queue_batch_size_bucket{le="1"} 1' in rendered
+
+def run_adds(batcher, sessionmaker, cart_ids, item_id, outcomes):
+    # Una petición por hilo, como en el threadpool: (código, cabeceras) de cada una
+    def worker(cart_id):
+        with sessionmaker() as db:
+            try:
+                batcher.add_item_to_cart(db, cart_id, item_id, 1)
+                outcomes.append((200, {}))
+            except HTTPException as e:
+                outcomes.append((e.status_code, e.headers))
+
+    threads = [threading.Thread(target=worker, args=(cart_id,)) for cart_id in cart_ids]
+    for thread in threads:
+        thread.start()
+    return threads
+
+async def default_thread_limit():
+    return anyio.to_thread.current_default_thread_limiter().total_tokens
+
+def test_default_queue_sheds_before_the_threadpool_fills(file_sessionmaker):
+    batcher = batcher_from_env(env={"RESERVATION_QUEUE": "on"})
+    threadpool = anyio.run(default_thread_limit)
+    assert batcher.max_pending == DEFAULT_MAX_PENDING < threadpool
+    with file_sessionmaker() as db:
+        item = new_event("Threadpool lleno", 1000)
+        carts = [models.Cart() for _ in range(threadpool)]
+        db.add_all([item, *carts])
+        db.commit()
+        item_id, cart_ids = item.id, [cart.id for cart in carts]
+
+    # Un lote anterior del ítem que no termina: tantas peticiones como hilos tiene el threadpool
+    item_lock = batcher._item_locks[item_id % len(batcher._item_locks)]
+    item_lock.acquire()
+    outcomes = []
+    threads = run_adds(batcher, file_sessionmaker, cart_ids, item_id, outcomes)
+    deadline = time.monotonic() + 5
+    while len(outcomes) < threadpool - DEFAULT_MAX_PENDING and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert batcher.pending == DEFAULT_MAX_PENDING
+    item_lock.release()
+    for thread in threads:
+        thread.join()
+
+    shed = [headers for code, headers in outcomes if code == 429]
+    assert len(shed) == threadpool - DEFAULT_MAX_PENDING and all(h == {"Retry-After": "1"} for h in shed)
+    assert sum(code == 200 for code, _ in outcomes) == DEFAULT_MAX_PENDING
+    assert batcher.pending == 0
+
+def test_stuck_batch_times_out_its_requests(file_sessionmaker):
+    with file_sessionmaker() as db:
+        item = new_event("Lote atascado", 10)
+        carts = [models.Cart() for _ in range(3)]
+        db.add_all([item, *carts])
+        db.commit()
+        item_id, cart_ids = item.id, [cart.id for cart in carts]
+
+    batcher = ReservationBatcher(window=0.01, statement_timeout=0.2)
+    item_lock = batcher._item_locks[item_id % len(batcher._item_locks)]
+    item_lock.acquire()
+    outcomes = []
+    started = time.monotonic()
+    for thread in run_adds(batcher, file_sessionmaker, cart_ids, item_id, outcomes):
+        thread.join()
+    item_lock.release()
+
+    # Ni el líder ni quienes esperan a su lote pasan de la ventana más el límite de las sentencias
+    assert time.monotonic() - started < 1
+    assert outcomes == [(503, {"Retry-After": "1"})] * 3
+    assert batcher.pending == 0 and batcher.metrics.snapshot()["timeouts"] == 3
+    with file_sessionmaker() as db:
+        assert db.get(models.Item, item_id).stock == 10
+
+def test_reservation_queue_configuration():
+    assert batcher_from_env(env={}) is None
+    batcher = batcher_from_env(env={"RESERVATION_QUEUE": "on", "RESERVATION_BATCH_WINDOW": "0.005",
+                                    "RESERVATION_QUEUE_MAX_PENDING": "100"})
+    assert (batcher.window, batcher.max_batch, batcher.max_pending, batcher.statement_timeout) == (0.005, 64, 100, 5.0)
+    assert repository_from_env(engine, env={"RESERVATION_QUEUE": "on"}).reservations is not None
+    with pytest.raises(ValueError):
+        repository_from_env(engine, env={"RESERVATION_QUEUE": "on", "CART_STORE": "memory"})
@@ -0,0 +1,62 @@
+# tests/test_startup.py
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine
+from app import startup
+from app.database import Base
+from app.query_budget import QueryBudget
+
+def alembic_config(connection) -> Config:
+    # Sin alembic.ini: no reconfigura el logging de las pruebas
+    config = Config()
+    config.set_main_option("script_location", "alembic")
+    config.attributes["connection"] = connection
+    return config
+
+@pytest.fixture
+def file_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    yield engine
+    engine.dispose()
+
+def test_alembic_heads_follow_down_revisions(tmp_path):
+    assert startup.alembic_heads() == set(ScriptDirectory.from_config(alembic_config(None)).get_heads())
+
+    (tmp_path / "a.py").write_text("revision: str = 'a'\ndown_revision: Union[str, None] = None\n")
+    (tmp_path / "b.py").write_text("revision: str = 'b'\ndown_revision: Union[str, None] = 'a'\n")
+    (tmp_path / "c.py").write_text("revision: str = 'c'\ndown_revision: Union[str, None] = 'a'\n")
+    assert startup.alembic_heads(tmp_path) == {"b", "c"}
+    (tmp_path / "d.py").write_text("revision = 'd'\ndown_revision = ('b', 'c')\n")
+    assert startup.alembic_heads(tmp_path) == {"d"}
+
+def test_check_passes_after_alembic_upgrade(file_engine):
+    with file_engine.begin() as conn:
+        command.upgrade(alembic_config(conn), "head")
+    # Una sola consulta barata, sin inspeccionar las tablas
+    with QueryBudget(file_engine, max_queries=1) as budget:
+        startup.check_schema(file_engine)
+    assert budget.statements == ["SELECT version_num FROM alembic_version"]
+
+def test_check_rejects_unmigrated_or_stale_schema(file_engine):
+    # Esquema creado con create_all, sin revisión de Alembic
+    Base.metadata.create_all(bind=file_engine)
+    with pytest.raises(startup.SchemaMismatch, match="revisión ninguna"):
+        startup.run(file_engine, "check", startup.StartupReport())
+
+    with file_engine.begin() as conn:
+        command.stamp(alembic_config(conn), "head")
+    startup.check_schema(file_engine)
+    with pytest.raises(startup.SchemaMismatch, match="y el código espera 9999"):
+        startup.check_schema(file_engine, heads={"9999"})
+
+    with pytest.raises(ValueError, match="DB_SCHEMA_MODE"):
+        startup.schema_mode({"DB_SCHEMA_MODE": "migrate"})
+
+def test_startup_phases_are_reported(client):
+    assert list(startup.report.phases) == ["import", "schema", "warmup"]
+    body = client.get("/metrics").text
+    for phase in startup.report.phases:
+        assert f'app_startup_seconds{{phase="{phase}"}}' in body
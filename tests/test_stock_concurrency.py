@@ -0,0 +1,191 @@
+# tests/test_stock_concurrency.py
+
+import threading
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from app import crud, inventory, models
+from app.database import Base
+
+STOCK = 50
+THREADS = 8
+ATTEMPTS_PER_THREAD = 20
+
+@pytest.fixture
+def file_sessionmaker(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'stock.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+
+    # BEGIN IMMEDIATE: SQLite serializa escritores en lugar de fallar al promocionar el lock
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+def test_concurrent_reservations_never_oversell(file_sessionmaker):
+    with file_sessionmaker() as db:
+        item = models.Event(
+            name="Flash sale", description="-", thumbnail="-", price=10.0,
+            stock=STOCK, type=models.ItemType.EVENT, event_date="2025-01-01"
+        )
+        db.add(item)
+        carts = [models.Cart() for _ in range(THREADS)]
+        db.add_all(carts)
+        db.commit()
+        item_id = item.id
+        cart_ids = [cart.id for cart in carts]
+
+    granted = []
+    rejected = []
+    lock = threading.Lock()
+
+    def worker(cart_id):
+        with file_sessionmaker() as db:
+            for _ in range(ATTEMPTS_PER_THREAD):
+                try:
+                    crud.add_item_to_cart(db, cart_id, item_id, 1)
+                    with lock:
+                        granted.append(cart_id)
+                except HTTPException as e:
+                    assert e.status_code == 400
+                    with lock:
+                        rejected.append(cart_id)
+
+    threads = [threading.Thread(target=worker, args=(cart_id,)) for cart_id in cart_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with file_sessionmaker() as db:
+        stock = db.query(models.Item.stock).filter(models.Item.id == item_id).scalar()
+        reserved = db.query(func.sum(models.CartItem.quantity)).scalar()
+
+    assert len(granted) == STOCK
+    assert len(rejected) == THREADS * ATTEMPTS_PER_THREAD - STOCK
+    assert stock == 0
+    assert reserved == STOCK
+
+def test_concurrent_reservations_on_sharded_stock_never_oversell(file_sessionmaker):
+    engine = file_sessionmaker.kw["bind"]
+    with file_sessionmaker() as db:
+        item = models.Event(
+            name="Flash sale repartida", description="-", thumbnail="-", price=10.0,
+            stock=STOCK, type=models.ItemType.EVENT, event_date="2025-01-01"
+        )
+        db.add(item)
+        carts = [models.Cart() for _ in range(THREADS)]
+        db.add_all(carts)
+        db.commit()
+        item_id = item.id
+        cart_ids = [cart.id for cart in carts]
+    inventory.set_stock_shards(engine, item_id, 4)
+
+    done = threading.Event()
+    statuses = []
+
+    def worker(cart_id):
+        with file_sessionmaker() as db:
+            for attempt in range(ATTEMPTS_PER_THREAD):
+                try:
+                    crud.add_item_to_cart(db, cart_id, item_id, 2)
+                    if attempt % 3 == 2:
+                        # Bajar la línea a 1 devuelve unidades a un shard al azar
+                        crud.update_cart_item(db, cart_id, item_id, 1)
+                except HTTPException as e:
+                    statuses.append(e.status_code)
+
+    def rebalancer():
+        # Repartos concurrentes con las reservas
+        while not done.is_set():
+            inventory.rebalance(engine)
+
+    threads = [threading.Thread(target=worker, args=(cart_id,)) for cart_id in cart_ids]
+    background = threading.Thread(target=rebalancer)
+    background.start()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done.set()
+    background.join()
+
+    with file_sessionmaker() as db:
+        available = db.query(inventory.available_stock()).filter(models.Item.id == item_id).scalar()
+        reserved = db.query(func.sum(models.CartItem.quantity)).scalar()
+        stocks = [stock for _, stock in inventory.shard_stocks(db, item_id)]
+
+    # Ninguna unidad se pierde ni se crea entre reservas, devoluciones y repartos
+    assert set(statuses) <= {400}
+    assert min(stocks) >= 0
+    assert available + reserved == STOCK
+
+def test_update_and_remove_return_stock(file_sessionmaker):
+    with file_sessionmaker() as db:
+        item = models.Product(
+            name="Camiseta", description="-", thumbnail="-", price=10.0,
+            stock=10, type=models.ItemType.PRODUCT, care_instructions="-"
+        )
+        cart = models.Cart()
+        db.add_all([item, cart])
+        db.commit()
+        item_id, cart_id = item.id, cart.id
+
+        crud.add_item_to_cart(db, cart_id, item_id, 4)
+        crud.update_cart_item(db, cart_id, item_id, 7)
+        assert db.get(models.Item, item_id).stock == 3
+
+        with pytest.raises(HTTPException) as exc:
+            crud.update_cart_item(db, cart_id, item_id, 11)
+        assert exc.value.status_code == 400
+        db.expire_all()
+        assert db.get(models.Item, item_id).stock == 3
+
+        crud.update_cart_item(db, cart_id, item_id, 2)
+        db.expire_all()
+        assert db.get(models.Item, item_id).stock == 8
+
+        crud.remove_cart_item(db, cart_id, item_id)
+        db.expire_all()
+        assert db.get(models.Item, item_id).stock == 10
+        with pytest.raises(HTTPException) as exc:
+            crud.remove_cart_item(db, cart_id, item_id)
+        assert exc.value.status_code == 404
+
+def test_concurrent_adds_of_a_new_item_share_one_line(file_sessionmaker):
+    with file_sessionmaker() as db:
+        item = models.Product(
+            name="Taza", description="-", thumbnail="-", price=5.0,
+            stock=1000, type=models.ItemType.PRODUCT, care_instructions="-"
+        )
+        cart = models.Cart()
+        db.add_all([item, cart])
+        db.commit()
+        item_id, cart_id = item.id, cart.id
+
+    def worker():
+        with file_sessionmaker() as db:
+            for _ in range(ATTEMPTS_PER_THREAD):
+                crud.add_item_to_cart(db, cart_id, item_id, 1)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # El upsert sobre el índice único (cart_id, item_id) nunca crea una segunda línea
+    with file_sessionmaker() as db:
+        lines = db.query(models.CartItem.quantity).filter(models.CartItem.cart_id == cart_id).all()
+        assert lines == [(THREADS * ATTEMPTS_PER_THREAD,)]
+        assert crud.get_cart_summary(db, cart_id).total_quantity == THREADS * ATTEMPTS_PER_THREAD
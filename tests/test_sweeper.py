@@ -0,0 +1,93 @@
+# tests/test_sweeper.py
+
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import update
+from app import models
+from app.metrics import MetricsRegistry
+from app.sweeper import SweeperMetrics, SweepStats, sweep, sweeper_from_env
+from tests.conftest import engine
+
+TTL = 3600
+
+@pytest.fixture(scope="module")
+def sweeper_items(db):
+    items = [
+        models.Product(
+            name=f"Abandonado {i}", description="-", thumbnail="-", price=5.0,
+            stock=100, type=models.ItemType.PRODUCT, care_instructions="-"
+        )
+        for i in range(3)
+    ]
+    db.add_all(items)
+    db.commit()
+    return [item.id for item in items]
+
+def make_cart(client, lines):
+    cart_id = client.post("/cart/").json()["id"]
+    assert client.post(f"/cart/{cart_id}/items/batch/", json=[
+        {"item_id": item_id, "quantity": quantity} for item_id, quantity in lines
+    ]).status_code == 200
+    return cart_id
+
+def age_carts(db, cart_ids, seconds):
+    db.execute(
+        update(models.Cart).where(models.Cart.id.in_(cart_ids))
+        .values(last_activity_at=models.utcnow() - timedelta(seconds=seconds))
+    )
+    db.commit()
+
+def stock(db, item_ids):
+    db.expire_all()
+    return [db.get(models.Item, item_id).stock for item_id in item_ids]
+
+def test_mutations_refresh_last_activity(client, db, sweeper_items):
+    cart_id = make_cart(client, [(sweeper_items[0], 1)])
+    age_carts(db, [cart_id], TTL * 2)
+    assert client.put(f"/cart/{cart_id}/items/{sweeper_items[0]}/", json={"quantity": 2}).status_code == 200
+    db.expire_all()
+    assert db.get(models.Cart, cart_id).last_activity_at > models.utcnow() - timedelta(seconds=60)
+    client.delete(f"/cart/{cart_id}/items/{sweeper_items[0]}/")
+
+def test_sweep_returns_stock_of_idle_carts_only(client, db, sweeper_items, assert_max_queries):
+    before = stock(db, sweeper_items)
+    idle = [
+        make_cart(client, [(sweeper_items[0], 2), (sweeper_items[1], 3)]),
+        make_cart(client, [(sweeper_items[0], 1), (sweeper_items[2], 4)]),
+    ]
+    active = make_cart(client, [(sweeper_items[1], 5)])
+    age_carts(db, idle, TTL + 60)
+
+    # Número constante de sentencias sea cual sea el número de carritos y líneas
+    with assert_max_queries(4):
+        stats = sweep(engine, TTL, batch_size=100, pause=0)
+    assert (stats.carts, stats.lines, stats.units, stats.batches) == (2, 4, 10, 1)
+
+    assert stock(db, sweeper_items) == [before[0], before[1] - 5, before[2]]
+    assert client.get(f"/cart/{idle[0]}/").status_code == 404
+    assert client.get(f"/cart/{active}/summary/").json()["total_quantity"] == 5
+    assert db.query(models.CartItem).filter(models.CartItem.cart_id.in_(idle)).count() == 0
+
+def test_sweep_runs_in_bounded_batches(client, db, sweeper_items):
+    carts = [make_cart(client, [(sweeper_items[2], 1)]) for _ in range(5)]
+    age_carts(db, carts, TTL + 60)
+
+    stats = sweep(engine, TTL, batch_size=2, pause=0, max_batches=2)
+    assert (stats.carts, stats.batches) == (4, 2)
+    stats = sweep(engine, TTL, batch_size=2, pause=0)
+    assert (stats.carts, stats.units, stats.batches) == (1, 1, 1)
+
+def test_sweeper_configuration_and_metrics():
+    assert sweeper_from_env(engine, {}) is None
+    configured = sweeper_from_env(engine, {"CART_TTL_SECONDS": "600", "CART_SWEEP_BATCH_SIZE": "50"})
+    assert (configured.ttl, configured.batch_size, configured.interval) == (600, 50, 60)
+
+    metrics = SweeperMetrics()
+    metrics.record(SweepStats(carts=3, lines=7, units=12, batches=2, elapsed=0.5))
+    registry = MetricsRegistry()
+    registry.add_sweeper(metrics)
+    body = registry.render()
+    assert "cart_sweeper_reclaimed_units_total 12" in body
+    assert "cart_sweeper_reclaimed_carts_total 3" in body
+    assert "cart_sweeper_last_run_seconds 0.5" in body